@@ -5,22 +5,40 @@ Provides RESTful API with OpenAPI documentation for all convivial features
 
 import os
 import json
-from datetime import datetime, timedelta
+import base64
+import hashlib
+import math
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
 from functools import wraps
 import uuid
 
-from flask import Flask, request, jsonify
+import jwt as pyjwt
+from flask import Flask, Response, request, jsonify
 from flask_restx import Api, Resource, fields, Namespace
 from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity, get_jwt
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import text, and_, or_
 from sqlalchemy.dialects.postgresql import UUID
+import boto3
+import click
 import redis
+from botocore.client import Config as BotoConfig
+from botocore.exceptions import BotoCoreError, ClientError
+from flask.cli import AppGroup
 from minio import Minio
+from minio.commonconfig import ENABLED, REPLACE, CopySource, Filter
+from minio.error import S3Error
+from minio.lifecycleconfig import AbortIncompleteMultipartUpload, Expiration, LifecycleConfig, Rule
 from werkzeug.datastructures import FileStorage
 import requests
 
+from convivial_shared.presence import PresenceIndex
+from maintenance import PeriodicJob
+
 # Initialize Flask app
 app = Flask(__name__)
 
@@ -31,6 +49,16 @@ app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=1)
 app.config['JWT_TOKEN_LOCATION'] = ['headers']
 app.config['JWT_HEADER_NAME'] = 'Authorization'
 app.config['JWT_HEADER_TYPE'] = 'Bearer'
+# Tokens signed with auth-service's rotating keys are checked against its JWKS;
+# HS256 tokens with the shared secret are accepted unless JWT_ACCEPT_HS256=false
+JWT_ACCEPT_HS256 = os.environ.get('JWT_ACCEPT_HS256', 'true').lower() == 'true'
+app.config['JWT_DECODE_ALGORITHMS'] = ['EdDSA', 'RS256'] + (['HS256'] if JWT_ACCEPT_HS256 else [])
+jwks_client = pyjwt.PyJWKClient(
+    os.environ.get('AUTH_JWKS_URL', 'http://auth-service:5000/.well-known/jwks.json'),
+    cache_keys=True,
+    lifespan=int(os.environ.get('JWKS_CACHE_TTL', '300')),
+    timeout=5
+)
 
 # Database configuration
 app.config['SQLALCHEMY_DATABASE_URI'] = f"postgresql://{os.environ.get('POSTGRES_USER', 'searxng')}:{os.environ.get('POSTGRES_PASSWORD')}@{os.environ.get('POSTGRES_HOST', 'postgres')}/{os.environ.get('POSTGRES_DB', 'searxng_convivial')}"
@@ -39,7 +67,27 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 # Initialize extensions
 db = SQLAlchemy(app)
 jwt = JWTManager(app)
-cors = CORS(app, origins=os.environ.get('ALLOWED_ORIGINS', 'http://localhost:8890').split(','))
+
+@jwt.decode_key_loader
+def verification_key(jwt_header, jwt_payload):
+    """Key for an incoming token: JWKS entry by kid, or the shared secret for HS256"""
+    if jwt_header.get('alg') == 'HS256':
+        if not JWT_ACCEPT_HS256:
+            raise pyjwt.InvalidSignatureError('HS256 tokens are no longer accepted')
+        return app.config['JWT_SECRET_KEY']
+    try:
+        signing_key = jwks_client.get_signing_key(jwt_header.get('kid', ''))
+    except pyjwt.PyJWKClientError as e:
+        raise pyjwt.InvalidSignatureError(f'No signing key: {e}')
+    # auth-service only publishes Ed25519 (EdDSA) and RSA (RS256) keys
+    if jwt_header.get('alg') != ('EdDSA' if signing_key.key_type == 'OKP' else 'RS256'):
+        raise pyjwt.InvalidSignatureError('Token algorithm does not match its signing key')
+    return signing_key.key
+cors = CORS(
+    app,
+    origins=os.environ.get('ALLOWED_ORIGINS', 'http://localhost:8890').split(','),
+    expose_headers=['ETag', 'X-Next-Cursor']
+)
 
 # Redis clients
 redis_cache = redis.Redis(
@@ -54,15 +102,81 @@ redis_pubsub = redis.Redis(
     decode_responses=True
 )
 
-# MinIO client for file storage
+# Online users, indexed by last heartbeat (see convivial_shared/presence.py)
+presence_index = PresenceIndex(redis_cache, ttl=int(os.environ.get('PRESENCE_TTL', '300')))
+
+# MinIO client for file storage. Browsers upload straight to MinIO with
+# URLs signed for MINIO_PUBLIC_ENDPOINT (the address they can reach); the
+# internal clients only create, complete and inspect uploads.
+UPLOAD_BUCKET = os.environ.get('MINIO_BUCKET', 'convivial-files')
+# Presigned uploads land under this prefix and are copied out on completion;
+# anything left here is removed by a bucket lifecycle rule
+UPLOAD_STAGING_PREFIX = 'staging/'
+MINIO_REGION = os.environ.get('MINIO_REGION', 'us-east-1')
 minio_client = None
+minio_public = None
+s3_client = None
+s3_public = None
+
+def _s3(endpoint, secure):
+    return boto3.client(
+        's3',
+        endpoint_url=f"{'https' if secure else 'http'}://{endpoint}",
+        aws_access_key_id=os.environ.get('MINIO_ACCESS_KEY'),
+        aws_secret_access_key=os.environ.get('MINIO_SECRET_KEY'),
+        region_name=MINIO_REGION,
+        config=BotoConfig(signature_version='s3v4', s3={'addressing_style': 'path'})
+    )
+
 if os.environ.get('MINIO_ENDPOINT'):
+    minio_secure = os.environ.get('MINIO_SECURE', 'false').lower() == 'true'
+    public_endpoint = os.environ.get('MINIO_PUBLIC_ENDPOINT', os.environ['MINIO_ENDPOINT'])
+    public_secure = os.environ.get('MINIO_PUBLIC_SECURE', str(minio_secure)).lower() == 'true'
     minio_client = Minio(
         os.environ.get('MINIO_ENDPOINT'),
         access_key=os.environ.get('MINIO_ACCESS_KEY'),
         secret_key=os.environ.get('MINIO_SECRET_KEY'),
-        secure=os.environ.get('MINIO_SECURE', 'false').lower() == 'true'
+        secure=minio_secure,
+        region=MINIO_REGION
+    )
+    # Signing is local; with the region given, this client never connects
+    minio_public = Minio(
+        public_endpoint,
+        access_key=os.environ.get('MINIO_ACCESS_KEY'),
+        secret_key=os.environ.get('MINIO_SECRET_KEY'),
+        secure=public_secure,
+        region=MINIO_REGION
     )
+    s3_client = _s3(os.environ['MINIO_ENDPOINT'], minio_secure)
+    s3_public = _s3(public_endpoint, public_secure)
+
+_upload_bucket_ready = False
+_upload_bucket_lock = threading.Lock()
+
+def ensure_upload_bucket():
+    """Create the bucket if needed; checked at startup, retried only if that failed"""
+    global _upload_bucket_ready
+    if _upload_bucket_ready or minio_client is None:
+        return
+    with _upload_bucket_lock:
+        if not _upload_bucket_ready:
+            if not minio_client.bucket_exists(UPLOAD_BUCKET):
+                minio_client.make_bucket(UPLOAD_BUCKET)
+            minio_client.set_bucket_lifecycle(UPLOAD_BUCKET, LifecycleConfig([
+                Rule(
+                    ENABLED,
+                    rule_filter=Filter(prefix=UPLOAD_STAGING_PREFIX),
+                    rule_id='expire-upload-staging',
+                    expiration=Expiration(days=1),
+                    abort_incomplete_multipart_upload=AbortIncompleteMultipartUpload(days_after_initiation=1)
+                )
+            ]))
+            _upload_bucket_ready = True
+
+try:
+    ensure_upload_bucket()
+except Exception as e:
+    app.logger.warning(f"Upload bucket not checked at startup: {e}")
 
 # API Documentation
 api = Api(app, version='1.0', title='SearXNG Convivial API',
@@ -91,6 +205,11 @@ discovery_model = api.model('Discovery', {
     'annotations': fields.Raw(description='User annotations')
 })
 
+discovery_batch_model = api.model('DiscoveryBatch', {
+    'discoveries': fields.List(fields.Nested(discovery_model), required=True,
+                               description='Discoveries to share, in order')
+})
+
 collection_model = api.model('Collection', {
     'id': fields.String(description='Collection ID'),
     'name': fields.String(required=True, description='Collection name'),
@@ -98,6 +217,8 @@ collection_model = api.model('Collection', {
     'type': fields.String(description='Collection type'),
     'owner_id': fields.String(description='Owner user ID'),
     'is_shared': fields.Boolean(description='Is shared with friends?'),
+    'item_count': fields.Integer(description='Number of items in the collection'),
+    'last_added_at': fields.DateTime(description='When the newest item was added'),
     'created_at': fields.DateTime(description='Creation timestamp')
 })
 
@@ -126,6 +247,32 @@ def get_current_user():
         'role': claims.get('role', 'friend')
     }
 
+# Keyset pagination: a cursor is the (discovered_at, id) of the last row
+# served, so the next page starts right after it without an OFFSET scan
+DISCOVERY_PAGE_SIZE = 50
+DISCOVERY_PAGE_MAX = 100
+
+def encode_cursor(discovered_at, discovery_id):
+    raw = json.dumps([discovered_at.isoformat(), str(discovery_id)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """(discovered_at, id) from an opaque cursor; ValueError if it was not made by encode_cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        discovered_at, discovery_id = json.loads(raw)
+        return datetime.fromisoformat(discovered_at), str(uuid.UUID(discovery_id))
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f'Invalid cursor: {e}')
+
+discovery_list_args = ns_discoveries.parser()
+discovery_list_args.add_argument('cursor', type=str, location='args',
+                                 help='X-Next-Cursor of the previous page; returns older discoveries')
+discovery_list_args.add_argument('since', type=str, location='args',
+                                 help='ISO-8601 timestamp; only discoveries made after it')
+discovery_list_args.add_argument('limit', type=int, location='args', default=DISCOVERY_PAGE_SIZE,
+                                 help=f'Page size, at most {DISCOVERY_PAGE_MAX}')
+
 # Health check
 @app.route('/health')
 def health():
@@ -140,20 +287,52 @@ def health():
 class DiscoveryList(Resource):
     @require_auth()
     @ns_discoveries.doc('list_discoveries')
+    @ns_discoveries.expect(discovery_list_args)
     @ns_discoveries.marshal_list_with(discovery_model)
     def get(self):
-        """List recent discoveries from all friends"""
-        query = text("""
+        """List discoveries from all friends, newest first, one page at a time"""
+        args = discovery_list_args.parse_args()
+        limit = max(1, min(args['limit'] or DISCOVERY_PAGE_SIZE, DISCOVERY_PAGE_MAX))
+        
+        conditions = []
+        params = {'limit': limit + 1}
+        if args['cursor']:
+            try:
+                params['cursor_at'], params['cursor_id'] = decode_cursor(args['cursor'])
+            except ValueError as e:
+                ns_discoveries.abort(400, str(e))
+            conditions.append('(d.discovered_at, d.id) < (:cursor_at, CAST(:cursor_id AS uuid))')
+        if args['since']:
+            try:
+                params['since'] = datetime.fromisoformat(args['since'])
+            except ValueError:
+                ns_discoveries.abort(400, 'since must be an ISO-8601 timestamp')
+            conditions.append('d.discovered_at > :since')
+        
+        # New discoveries move the newest timestamp; deletes, edits and renamed
+        # authors bump the change counter (init-db/05-discoveries-version.sql)
+        version, latest = db.session.execute(text("""
+            SELECT version, (SELECT max(discovered_at) FROM discoveries)
+            FROM discovery_changes
+        """)).one()
+        page_key = hashlib.sha1(f"{args['cursor']}|{args['since']}|{limit}".encode('utf-8')).hexdigest()[:12]
+        etag = f'W/"discoveries-{version}-{latest.timestamp() if latest else 0}-{page_key}"'
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if etag in request.headers.get('If-None-Match', ''):
+            return [], 304, headers
+        
+        query = text(f"""
             SELECT d.*, u.username, u.display_name
             FROM discoveries d
             JOIN users u ON d.user_id = u.id
-            ORDER BY d.discovered_at DESC
-            LIMIT 50
+            {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+            ORDER BY d.discovered_at DESC, d.id DESC
+            LIMIT :limit
         """)
         
-        result = db.session.execute(query)
+        rows = db.session.execute(query, params).fetchall()
         discoveries = []
-        for row in result:
+        for row in rows[:limit]:
             disc = dict(row._mapping)
             disc['user'] = {
                 'username': disc.pop('username'),
@@ -161,7 +340,11 @@ class DiscoveryList(Resource):
             }
             discoveries.append(disc)
         
-        return discoveries
+        if len(rows) > limit:
+            last = discoveries[-1]
+            headers['X-Next-Cursor'] = encode_cursor(last['discovered_at'], last['id'])
+        
+        return discoveries, 200, headers
     
     @require_auth()
     @ns_discoveries.doc('create_discovery')
@@ -199,11 +382,142 @@ class DiscoveryList(Resource):
             'id': discovery_id,
             'user': user['username'],
             'title': data.get('title'),
+            'url': data.get('url'),
+            'is_gift': data.get('is_gift', False),
+            'gifted_to': data.get('gifted_to'),
+            'gift_message': data.get('gift_message'),
             'timestamp': datetime.utcnow().isoformat()
         }))
         
         return {'id': discovery_id, 'message': 'Discovery shared'}, 201
 
+DISCOVERY_BATCH_MAX = int(os.environ.get('DISCOVERY_BATCH_MAX', '500'))
+DISCOVERY_TEXT_FIELDS = ('query', 'url', 'title', 'snippet', 'engine', 'gift_message')
+
+def validate_discovery(item):
+    """(row values, errors) for one submitted discovery; errors is empty when it is usable"""
+    if not isinstance(item, dict):
+        return None, {'_': 'Expected an object'}
+    errors = {}
+    for field in DISCOVERY_TEXT_FIELDS:
+        if item.get(field) is not None and not isinstance(item[field], str):
+            errors[field] = 'Must be a string'
+    if not isinstance(item.get('query'), str) or not item['query'].strip():
+        errors['query'] = 'Required'
+    if isinstance(item.get('engine'), str) and len(item['engine']) > 50:
+        errors['engine'] = 'At most 50 characters'
+    if not isinstance(item.get('is_gift', False), bool):
+        errors['is_gift'] = 'Must be a boolean'
+    gifted_to = item.get('gifted_to')
+    if gifted_to is not None:
+        try:
+            gifted_to = str(uuid.UUID(str(gifted_to)))
+        except ValueError:
+            errors['gifted_to'] = 'Must be a user id'
+    if errors:
+        return None, errors
+    values = {field: item.get(field) for field in DISCOVERY_TEXT_FIELDS}
+    values.update(is_gift=item.get('is_gift', False), gifted_to=gifted_to)
+    return values, {}
+
+@ns_discoveries.route('/batch')
+class DiscoveryBatch(Resource):
+    @require_auth()
+    @ns_discoveries.doc('create_discoveries')
+    @ns_discoveries.expect(discovery_batch_model)
+    def post(self):
+        """Share many discoveries at once; each one gets its own status"""
+        user = get_current_user()
+        data = request.get_json(silent=True)
+        items = data.get('discoveries') if isinstance(data, dict) else data
+        if not isinstance(items, list) or not items:
+            return {'message': 'Expected {"discoveries": [...]}'}, 400
+        if len(items) > DISCOVERY_BATCH_MAX:
+            return {'message': f'At most {DISCOVERY_BATCH_MAX} discoveries per batch'}, 413
+        
+        # Validate every item, then check gift recipients in one query, and only
+        # then drop repeats, so a repeat of a rejected item is kept in its place
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            values, errors = validate_discovery(item)
+            if errors:
+                results[index] = {'index': index, 'status': 'invalid', 'errors': errors}
+            else:
+                valid.append((index, values))
+        
+        recipients = list({values['gifted_to'] for _, values in valid if values['gifted_to']})
+        known = set()
+        if recipients:
+            known = {str(row[0]) for row in db.session.execute(
+                text('SELECT id FROM users WHERE id = ANY(CAST(:ids AS uuid[]))'), {'ids': recipients}
+            )}
+        
+        rows = []
+        seen = {}
+        for index, values in valid:
+            if values['gifted_to'] and values['gifted_to'] not in known:
+                results[index] = {'index': index, 'status': 'invalid', 'errors': {'gifted_to': 'Unknown user'}}
+                continue
+            key = (values['query'], values['url'])
+            if key in seen:
+                results[index] = {'index': index, 'status': 'duplicate', 'duplicate_of': seen[key]}
+                continue
+            seen[key] = index
+            values['id'] = str(uuid.uuid4())
+            results[index] = {'index': index, 'status': 'created', 'id': values['id']}
+            rows.append((index, values))
+        
+        if rows:
+            # One multi-row INSERT for the whole batch, in a single transaction
+            query = text("""
+                INSERT INTO discoveries
+                (id, user_id, query, result_url, result_title, result_snippet, engine, is_gift, gifted_to, gift_message)
+                SELECT t.id, CAST(:user_id AS uuid), t.query, t.url, t.title, t.snippet, t.engine,
+                       t.is_gift, t.gifted_to, t.gift_message
+                FROM unnest(
+                    CAST(:ids AS uuid[]), CAST(:queries AS text[]), CAST(:urls AS text[]),
+                    CAST(:titles AS text[]), CAST(:snippets AS text[]), CAST(:engines AS text[]),
+                    CAST(:is_gifts AS boolean[]), CAST(:gifted_tos AS uuid[]), CAST(:gift_messages AS text[])
+                ) AS t(id, query, url, title, snippet, engine, is_gift, gifted_to, gift_message)
+                RETURNING id, discovered_at
+            """)
+            columns = [values for _, values in rows]
+            inserted = db.session.execute(query, {
+                'user_id': user['id'],
+                'ids': [values['id'] for values in columns],
+                'queries': [values['query'] for values in columns],
+                'urls': [values['url'] for values in columns],
+                'titles': [values['title'] for values in columns],
+                'snippets': [values['snippet'] for values in columns],
+                'engines': [values['engine'] for values in columns],
+                'is_gifts': [values['is_gift'] for values in columns],
+                'gifted_tos': [values['gifted_to'] for values in columns],
+                'gift_messages': [values['gift_message'] for values in columns]
+            })
+            discovered_at = {str(row.id): row.discovered_at for row in inserted}
+            db.session.commit()
+            for index, values in rows:
+                results[index]['discovered_at'] = discovered_at[values['id']].isoformat()
+            
+            # One event for the whole batch rather than one per discovery
+            try:
+                redis_pubsub.publish('discoveries:batch', json.dumps({
+                    'user': user['username'],
+                    'count': len(rows),
+                    'discoveries': [
+                        {key: values[key] for key in ('id', 'title', 'url', 'is_gift', 'gifted_to', 'gift_message')}
+                        for _, values in rows
+                    ],
+                    'timestamp': datetime.utcnow().isoformat()
+                }))
+            except redis.RedisError as e:
+                app.logger.warning(f"Discovery batch event not published: {e}")
+        
+        created = len(rows)
+        status = 201 if created == len(items) else 207 if created else 400
+        return {'created': created, 'failed': len(items) - created, 'results': results}, status
+
 # Collection endpoints  
 @ns_collections.route('/')
 class CollectionList(Resource):
@@ -212,13 +526,13 @@ class CollectionList(Resource):
     @ns_collections.marshal_list_with(collection_model)
     def get(self):
         """List all collections"""
+        # item_count and last_added_at are kept up to date by a trigger on
+        # collection_items (init-db/03-collection-counters.sql)
         query = text("""
-            SELECT c.*, u.username, u.display_name, COUNT(ci.discovery_id) as item_count
+            SELECT c.*, u.username, u.display_name
             FROM collections c
             JOIN users u ON c.owner_id = u.id
-            LEFT JOIN collection_items ci ON c.id = ci.collection_id
             WHERE c.is_shared = true OR c.owner_id = :user_id
-            GROUP BY c.id, u.username, u.display_name
             ORDER BY c.created_at DESC
         """)
         
@@ -265,42 +579,290 @@ class CollectionList(Resource):
         return {'id': collection_id, 'message': 'Collection created'}, 201
 
 # Morning Coffee endpoint
+# Digests are built each morning by plugins/morning_coffee.py, into Redis
+# (morning_coffee:<date>) and the morning_coffee table. Each worker keeps the
+# encoded response per digest date and serves those bytes as they are.
+MORNING_COFFEE_CACHE_TTL = int(os.environ.get('MORNING_COFFEE_CACHE_TTL', '300'))
+_coffee_cache = {}  # digest date -> (expires_at, body, etag)
+_coffee_lock = threading.Lock()
+
+def load_morning_coffee(digest_date):
+    """Encoded digest for ``digest_date`` in the shape the homepage card reads"""
+    # Reactions are only kept in the table (coffee_reactions), so they are read
+    # from there whichever copy the digest itself comes from
+    stored = redis_cache.get(f'morning_coffee:{digest_date.isoformat()}')
+    if stored:
+        stored = json.loads(stored)
+        digest = stored.get('digest') or {}
+        reactions = db.session.execute(text("""
+            SELECT coffee_reactions FROM morning_coffee WHERE digest_date = :date
+        """), {'date': digest_date}).scalar()
+        extra = {
+            'summary': stored.get('summary'),
+            'generated_at': stored.get('generated_at'),
+            'reactions': reactions or {}
+        }
+    else:
+        row = db.session.execute(text("""
+            SELECT discoveries, generated_summary, coffee_reactions, created_at
+            FROM morning_coffee
+            WHERE digest_date = :date
+        """), {'date': digest_date}).first()
+        if row is None:
+            return json.dumps({'available': False, 'date': digest_date.isoformat()}).encode('utf-8')
+        digest = row.discoveries or {}
+        extra = {
+            'summary': row.generated_summary,
+            'generated_at': row.created_at.isoformat() if row.created_at else None,
+            'reactions': row.coffee_reactions or {}
+        }
+    payload = dict(digest, available=True, date=digest_date.isoformat(), **extra)
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
 @ns_social.route('/morning-coffee')
 class MorningCoffee(Resource):
     @require_auth()
-    @ns_social.doc('get_morning_coffee')
+    @ns_social.doc('get_morning_coffee', params={
+        'date': 'Digest date (YYYY-MM-DD); defaults to yesterday, the latest digest'
+    })
     def get(self):
-        """Get today's morning coffee digest"""
-        today = datetime.utcnow().date()
+        """Get the morning coffee digest"""
+        if request.args.get('date'):
+            try:
+                digest_date = date.fromisoformat(request.args['date'])
+            except ValueError:
+                ns_social.abort(400, 'date must be YYYY-MM-DD')
+        else:
+            # The plugin digests the previous UTC day
+            digest_date = datetime.utcnow().date() - timedelta(days=1)
         
-        # Check cache first
-        cached = redis_cache.get(f'morning_coffee:{today}')
-        if cached:
-            return json.loads(cached)
+        now = time.time()
+        with _coffee_lock:
+            cached = _coffee_cache.get(digest_date)
+        if cached is None or cached[0] <= now:
+            body = load_morning_coffee(digest_date)
+            etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+            cached = (now + MORNING_COFFEE_CACHE_TTL, body, etag)
+            with _coffee_lock:
+                _coffee_cache[digest_date] = cached
+                for stale in [key for key, entry in _coffee_cache.items() if entry[0] <= now]:
+                    del _coffee_cache[stale]
         
-        # Generate digest
-        query = text("""
-            SELECT d.*, u.username, u.display_name
-            FROM discoveries d
-            JOIN users u ON d.user_id = u.id
-            WHERE DATE(d.discovered_at) = :date
-            ORDER BY d.discovered_at DESC
-        """)
+        _, body, etag = cached
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if etag in request.headers.get('If-None-Match', ''):
+            return Response(status=304, headers=headers)
+        return Response(body, mimetype='application/json', headers=headers)
+
+# File upload endpoints
+# Two-phase uploads: POST /files/uploads returns a presigned PUT URL (or one
+# URL per part for large files), the client sends the bytes to MinIO, then
+# POST /files/uploads/<id>/complete records what actually arrived.
+# The URLs only reach a staging key: completion checks the staged object and
+# copies it to the final key with the declared Content-Type, so re-sending
+# to a URL that is still valid never changes a file that is being served.
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', str(200 * 1024 * 1024)))
+UPLOAD_PART_SIZE = int(os.environ.get('UPLOAD_PART_SIZE', str(16 * 1024 * 1024)))
+UPLOAD_URL_EXPIRY = int(os.environ.get('UPLOAD_URL_EXPIRY', '900'))
+UPLOAD_TYPE_PATTERN = re.compile(r'^[a-z0-9_-]{1,50}$')
+UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+
+upload_request_model = api.model('UploadRequest', {
+    'filename': fields.String(required=True, description='Original file name'),
+    'content_type': fields.String(description='MIME type', default='application/octet-stream'),
+    'size': fields.Integer(required=True, description='Size in bytes'),
+    'type': fields.String(description='avatar, voice_note, general, ...', default='general')
+})
+
+upload_complete_model = api.model('UploadComplete', {
+    'parts': fields.List(fields.Raw, description='Multipart only: [{"part_number": 1, "etag": "..."}]')
+})
+
+def staging_key(object_key):
+    """Where the presigned URLs for ``object_key`` put the bytes"""
+    return f"{UPLOAD_STAGING_PREFIX}{object_key}"
+
+def file_url(object_key):
+    """Download link browsers can use, valid for 7 days"""
+    return minio_public.presigned_get_object(UPLOAD_BUCKET, object_key, expires=timedelta(days=7))
+
+@ns_files.route('/uploads')
+class UploadList(Resource):
+    @require_auth()
+    @ns_files.doc('start_upload')
+    @ns_files.expect(upload_request_model)
+    def post(self):
+        """Start an upload: returns where to send the file, never receives it"""
+        if not minio_client:
+            return {'message': 'File storage not configured'}, 503
         
-        result = db.session.execute(query, {'date': today})
-        discoveries = list(result)
+        data = request.get_json(silent=True) or {}
+        filename = data.get('filename')
+        size = data.get('size')
+        file_type = data.get('type', 'general')
+        content_type = data.get('content_type') or 'application/octet-stream'
+        if not isinstance(filename, str) or not filename:
+            return {'message': 'filename is required'}, 400
+        if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+            return {'message': 'size must be a positive number of bytes'}, 400
+        if size > UPLOAD_MAX_BYTES:
+            return {'message': f'Files are limited to {UPLOAD_MAX_BYTES} bytes'}, 413
+        if not isinstance(file_type, str) or not UPLOAD_TYPE_PATTERN.match(file_type):
+            return {'message': 'type must be lowercase letters, digits, - or _'}, 400
+        if not isinstance(content_type, str) or len(content_type) > 100:
+            return {'message': 'Invalid content_type'}, 400
         
-        digest = {
-            'date': today.isoformat(),
-            'discoveries': len(discoveries),
-            'summary': f"☕ {len(discoveries)} discoveries yesterday",
-            'highlights': discoveries[:5] if discoveries else []
-        }
+        user = get_current_user()
+        ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else 'bin'
+        upload_id = str(uuid.uuid4())
+        object_key = f"{user['id']}/{file_type}/{upload_id}.{re.sub(r'[^a-z0-9]', '', ext)[:10] or 'bin'}"
+        expires = timedelta(seconds=UPLOAD_URL_EXPIRY)
+        part_count = math.ceil(size / UPLOAD_PART_SIZE)
+        if part_count > 10000:
+            return {'message': 'File needs more than 10000 parts; raise UPLOAD_PART_SIZE'}, 413
         
-        # Cache for 1 hour
-        redis_cache.setex(f'morning_coffee:{today}', 3600, json.dumps(digest))
+        try:
+            ensure_upload_bucket()
+            if size <= UPLOAD_PART_SIZE:
+                multipart_id = None
+                target = {
+                    'method': 'PUT',
+                    'url': minio_public.presigned_put_object(UPLOAD_BUCKET, staging_key(object_key),
+                                                             expires=expires),
+                    'headers': {'Content-Type': content_type}
+                }
+            else:
+                multipart_id = s3_client.create_multipart_upload(
+                    Bucket=UPLOAD_BUCKET, Key=staging_key(object_key), ContentType=content_type
+                )['UploadId']
+                target = {
+                    'method': 'multipart',
+                    'part_size': UPLOAD_PART_SIZE,
+                    'parts': [
+                        {
+                            'part_number': number,
+                            'url': s3_public.generate_presigned_url('upload_part', Params={
+                                'Bucket': UPLOAD_BUCKET, 'Key': staging_key(object_key),
+                                'UploadId': multipart_id, 'PartNumber': number
+                            }, ExpiresIn=UPLOAD_URL_EXPIRY)
+                        }
+                        for number in range(1, part_count + 1)
+                    ]
+                }
+        except (S3Error, BotoCoreError, ClientError) as e:
+            return {'message': f'Upload could not be started: {e}'}, 502
         
-        return digest
+        db.session.execute(text("""
+            INSERT INTO file_uploads
+            (id, user_id, object_key, file_type, content_type, declared_size, multipart_upload_id)
+            VALUES (:id, :user_id, :object_key, :file_type, :content_type, :size, :multipart_id)
+        """), {
+            'id': upload_id,
+            'user_id': user['id'],
+            'object_key': object_key,
+            'file_type': file_type,
+            'content_type': content_type,
+            'size': size,
+            'multipart_id': multipart_id
+        })
+        db.session.commit()
+        
+        return dict(target, upload_id=upload_id, filename=object_key, expires_in=UPLOAD_URL_EXPIRY), 201
+
+@ns_files.route('/uploads/<string:upload_id>/complete')
+class UploadComplete(Resource):
+    @require_auth()
+    @ns_files.doc('complete_upload')
+    @ns_files.expect(upload_complete_model)
+    def post(self, upload_id):
+        """Confirm an upload once the bytes are in storage and record its metadata"""
+        if not minio_client:
+            return {'message': 'File storage not configured'}, 503
+        
+        if not UPLOAD_ID_PATTERN.match(upload_id):
+            return {'message': 'Upload not found'}, 404
+        
+        user = get_current_user()
+        upload = db.session.execute(text("""
+            SELECT object_key, file_type, content_type, multipart_upload_id, status
+            FROM file_uploads
+            WHERE id = CAST(:id AS uuid) AND user_id = :user_id
+            FOR UPDATE
+        """), {'id': upload_id, 'user_id': user['id']}).first()
+        if upload is None:
+            db.session.rollback()
+            return {'message': 'Upload not found'}, 404
+        if upload.status != 'pending':
+            db.session.rollback()
+            return {'message': f'Upload is already {upload.status}'}, 409
+        
+        staged = staging_key(upload.object_key)
+        try:
+            if upload.multipart_upload_id:
+                parts = (request.get_json(silent=True) or {}).get('parts')
+                if not isinstance(parts, list) or not parts:
+                    db.session.rollback()
+                    return {'message': 'parts are required for a multipart upload'}, 400
+                s3_client.complete_multipart_upload(
+                    Bucket=UPLOAD_BUCKET,
+                    Key=staged,
+                    UploadId=upload.multipart_upload_id,
+                    MultipartUpload={'Parts': [
+                        {'PartNumber': int(part['part_number']), 'ETag': str(part['etag'])}
+                        for part in sorted(parts, key=lambda part: int(part['part_number']))
+                    ]}
+                )
+            stat = minio_client.stat_object(UPLOAD_BUCKET, staged)
+        except (KeyError, TypeError, ValueError):
+            db.session.rollback()
+            return {'message': 'parts must be [{"part_number": n, "etag": "..."}]'}, 400
+        except (S3Error, ClientError) as e:
+            db.session.rollback()
+            return {'message': f'Upload not found in storage: {e}'}, 409
+        except BotoCoreError as e:
+            db.session.rollback()
+            return {'message': f'Storage unavailable: {e}'}, 502
+        
+        etag = None
+        try:
+            if stat.size > UPLOAD_MAX_BYTES:
+                status = 'rejected'
+            else:
+                # Copy exactly the object checked above, with the Content-Type that was declared
+                etag = minio_client.copy_object(
+                    UPLOAD_BUCKET,
+                    upload.object_key,
+                    CopySource(UPLOAD_BUCKET, staged, match_etag=stat.etag),
+                    metadata={'Content-Type': upload.content_type},
+                    metadata_directive=REPLACE
+                ).etag
+                status = 'complete'
+            minio_client.remove_object(UPLOAD_BUCKET, staged)
+        except S3Error as e:
+            db.session.rollback()
+            return {'message': f'Upload could not be stored: {e}'}, 502
+        db.session.execute(text("""
+            UPDATE file_uploads
+            SET status = :status, size = :size, etag = :etag, completed_at = NOW()
+            WHERE id = CAST(:id AS uuid)
+        """), {
+            'id': upload_id,
+            'status': status,
+            'size': stat.size,
+            'etag': etag
+        })
+        db.session.commit()
+        if status == 'rejected':
+            return {'message': f'Files are limited to {UPLOAD_MAX_BYTES} bytes'}, 413
+        
+        return {
+            'upload_id': upload_id,
+            'filename': upload.object_key,
+            'url': file_url(upload.object_key),
+            'type': upload.file_type,
+            'size': stat.size,
+            'content_type': upload.content_type
+        }
 
 # File upload endpoints
 @ns_files.route('/upload')
@@ -308,7 +870,7 @@ class FileUpload(Resource):
     @require_auth()
     @ns_files.doc('upload_file')
     def post(self):
-        """Upload a file (avatar, voice note, etc.)"""
+        """Upload a file through the API (prefer /files/uploads, which goes straight to storage)"""
         if not minio_client:
             return {'message': 'File storage not configured'}, 503
         
@@ -327,12 +889,10 @@ class FileUpload(Resource):
         filename = f"{user['id']}/{file_type}/{uuid.uuid4()}.{ext}"
         
         # Upload to MinIO
-        bucket = os.environ.get('MINIO_BUCKET', 'convivial-files')
+        bucket = UPLOAD_BUCKET
         
         try:
-            # Ensure bucket exists
-            if not minio_client.bucket_exists(bucket):
-                minio_client.make_bucket(bucket)
+            ensure_upload_bucket()
             
             # Upload file
             minio_client.put_object(
@@ -362,13 +922,7 @@ class OnlineUsers(Resource):
     @ns_presence.doc('get_online_users')
     def get(self):
         """Get currently online users"""
-        # Get from Redis
-        online_users = []
-        for key in redis_cache.scan_iter('presence:*'):
-            user_data = redis_cache.get(key)
-            if user_data:
-                online_users.append(json.loads(user_data))
-        
+        online_users = presence_index.online()
         return {'users': online_users, 'count': len(online_users)}
 
 # Search collision detection
@@ -420,6 +974,85 @@ class PendingGifts(Resource):
         
         return {'gifts': gifts, 'count': len(gifts)}
 
+# Collection counters are maintained by a trigger; this recount repairs any
+# drift (e.g. rows changed with the trigger disabled) once per interval, one
+# short transaction per COLLECTION_RECONCILE_BATCH collections
+COLLECTION_RECONCILE_BATCH = int(os.environ.get('COLLECTION_RECONCILE_BATCH', '100'))
+
+def reconcile_collection_counts():
+    corrected = 0
+    after_id = None
+    while True:
+        batch = db.session.execute(
+            text('SELECT * FROM reconcile_collection_counts(CAST(:after_id AS uuid), :batch_size)'),
+            {'after_id': after_id, 'batch_size': COLLECTION_RECONCILE_BATCH}
+        ).one()
+        db.session.commit()
+        corrected += batch.corrected
+        if batch.last_id is None:
+            break
+        after_id = str(batch.last_id)
+    if corrected:
+        app.logger.warning(f"Corrected item counters on {corrected} collections")
+    return corrected
+
+def _reconcile_in_app_context():
+    with app.app_context():
+        return reconcile_collection_counts()
+
+collection_reconciler = PeriodicJob(
+    'collection-counts',
+    float(os.environ.get('COLLECTION_RECONCILE_INTERVAL', '3600')),
+    redis_cache,
+    _reconcile_in_app_context
+)
+
+# Uploads never confirmed: abort their multipart uploads so MinIO frees the parts
+def expire_pending_uploads():
+    stale = db.session.execute(text("""
+        UPDATE file_uploads SET status = 'expired'
+        WHERE status = 'pending' AND created_at < NOW() - make_interval(secs => :age)
+        RETURNING object_key, multipart_upload_id
+    """), {'age': UPLOAD_URL_EXPIRY * 2}).fetchall()
+    db.session.commit()
+    for upload in stale:
+        try:
+            if upload.multipart_upload_id:
+                s3_client.abort_multipart_upload(
+                    Bucket=UPLOAD_BUCKET, Key=staging_key(upload.object_key), UploadId=upload.multipart_upload_id
+                )
+            else:
+                minio_client.remove_object(UPLOAD_BUCKET, staging_key(upload.object_key))
+        except (S3Error, BotoCoreError, ClientError) as e:
+            app.logger.warning(f"Expired upload {upload.object_key} not cleaned up: {e}")
+    return len(stale)
+
+def _expire_uploads_in_app_context():
+    with app.app_context():
+        return expire_pending_uploads()
+
+upload_expirer = PeriodicJob(
+    'expired-uploads',
+    float(os.environ.get('UPLOAD_CLEANUP_INTERVAL', '3600')) if minio_client else 0,
+    redis_cache,
+    _expire_uploads_in_app_context
+)
+
+@app.before_request
+def start_maintenance():
+    collection_reconciler.ensure_started()
+    upload_expirer.ensure_started()
+
+# Maintenance CLI: flask --app app collections reconcile
+collections_cli = AppGroup('collections', help='Collection maintenance')
+
+@collections_cli.command('reconcile')
+def reconcile_collections():
+    """Recount item_count and last_added_at for every collection now"""
+    click.echo(f"corrected {reconcile_collection_counts()} collections")
+
+app.cli.add_command(collections_cli)
+
 # Error handlers
 @app.errorhandler(401)
 def unauthorized(error):
@@ -0,0 +1,65 @@
+"""
+Periodic maintenance jobs for api-service
+Every worker runs the schedule, but a Redis lock held for the whole interval
+lets only one of them (across all replicas) do the work each time round
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Callable
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicJob:
+    """Runs ``job`` about once per ``interval`` seconds cluster-wide
+
+    The lock ``maintenance:<name>`` is taken with SET NX and left to expire
+    after ``interval``, so a worker that dies mid-run never blocks the next
+    turn. ``job`` must finish well within ``interval``.
+    """
+
+    def __init__(self, name: str, interval: float, redis_client: redis.Redis, job: Callable[[], object]):
+        self.name = name
+        self.interval = interval
+        self.redis = redis_client
+        self.job = job
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.last_result = None
+
+    def ensure_started(self):
+        """Start the scheduler thread once per process (gunicorn forks workers)"""
+        if self.interval <= 0:
+            return
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=f'maintenance-{self.name}', daemon=True)
+            self._thread.start()
+
+    def run_once(self) -> bool:
+        """Run the job unless another worker already has this turn"""
+        if not self.redis.set(f'maintenance:{self.name}', os.getpid(), nx=True, ex=max(1, int(self.interval))):
+            return False
+        self.last_result = self.job()
+        return True
+
+    def _run(self):
+        while True:
+            # Spread workers out so they do not all race for the lock at once
+            time.sleep(self.interval / 10 + (os.getpid() % 10))
+            try:
+                self.run_once()
+            except redis.RedisError as e:
+                logger.warning(f"Maintenance job {self.name} skipped, Redis unavailable: {e}")
+            except Exception as e:
+                logger.error(f"Maintenance job {self.name} failed: {e}")
@@ -0,0 +1,65 @@
+"""Collection counters in init-db/03-collection-counters.sql; needs TEST_DATABASE_URL"""
+
+
+def make_user(pg, username):
+    pg.execute('INSERT INTO users (username) VALUES (%s) RETURNING id', (username,))
+    return pg.fetchone()[0]
+
+
+def make_collection(pg, owner):
+    pg.execute("INSERT INTO collections (name, type, owner_id) VALUES ('Ferns', 'cabinet', %s) RETURNING id",
+               (owner,))
+    return pg.fetchone()[0]
+
+
+def add_item(pg, collection, owner, added_at='2026-10-01T12:00:00Z'):
+    pg.execute("INSERT INTO discoveries (user_id, query) VALUES (%s, 'ferns') RETURNING id", (owner,))
+    discovery = pg.fetchone()[0]
+    pg.execute('INSERT INTO collection_items (collection_id, discovery_id, added_at) VALUES (%s, %s, %s) '
+               'RETURNING id', (collection, discovery, added_at))
+    return pg.fetchone()[0]
+
+
+def counters(pg, collection):
+    pg.execute('SELECT item_count, last_added_at::text FROM collections WHERE id = %s', (collection,))
+    return pg.fetchone()
+
+
+def test_trigger_keeps_count_and_last_added_in_step(pg):
+    owner = make_user(pg, 'counter_owner_a')
+    ferns = make_collection(pg, owner)
+    mosses = make_collection(pg, owner)
+
+    add_item(pg, ferns, owner, '2026-10-01T12:00:00Z')
+    newest = add_item(pg, ferns, owner, '2026-10-02T12:00:00Z')
+    assert counters(pg, ferns) == (2, '2026-10-02 12:00:00+00')
+
+    pg.execute('DELETE FROM collection_items WHERE id = %s', (newest,))
+    assert counters(pg, ferns) == (1, '2026-10-01 12:00:00+00')
+
+    # Moving an item counts against one collection and for the other
+    pg.execute('UPDATE collection_items SET collection_id = %s WHERE collection_id = %s', (mosses, ferns))
+    assert counters(pg, ferns) == (0, None)
+    assert counters(pg, mosses) == (1, '2026-10-01 12:00:00+00')
+
+
+def test_reconcile_repairs_drift_batch_by_batch(pg):
+    owner = make_user(pg, 'counter_owner_b')
+    collections = [make_collection(pg, owner) for _ in range(3)]
+    for collection in collections:
+        add_item(pg, collection, owner)
+    pg.execute('UPDATE collections SET item_count = 7, last_added_at = NULL')
+
+    corrected, after_id = 0, None
+    while True:
+        pg.execute('SELECT * FROM reconcile_collection_counts(%s, 2)', (after_id,))
+        batch_corrected, after_id = pg.fetchone()
+        corrected += batch_corrected
+        if after_id is None:
+            break
+
+    assert corrected == 3
+    assert all(counters(pg, collection) == (1, '2026-10-01 12:00:00+00') for collection in collections)
+
+    pg.execute('SELECT * FROM reconcile_collection_counts(NULL, 100)')
+    assert pg.fetchone()[0] == 0
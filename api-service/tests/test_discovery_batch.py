@@ -0,0 +1,107 @@
+import json
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+from flask_jwt_extended import create_access_token
+
+import app as api
+
+FRIEND = str(uuid.uuid4())
+STRANGER = str(uuid.uuid4())
+
+
+class DiscoveryDb:
+    """Just enough of users and discoveries for DiscoveryBatch.post"""
+
+    def __init__(self, user_ids):
+        self.user_ids = set(user_ids)
+        self.inserts = []
+        self.commits = 0
+
+    def execute(self, query, params):
+        statement = ' '.join(str(query).split())
+        if statement.startswith('SELECT id FROM users'):
+            return [(user_id,) for user_id in params['ids'] if user_id in self.user_ids]
+        if statement.startswith('INSERT INTO discoveries'):
+            self.inserts.append(params)
+            now = datetime.now(timezone.utc)
+            return [SimpleNamespace(id=discovery_id, discovered_at=now) for discovery_id in params['ids']]
+        raise AssertionError(f'Unexpected SQL: {statement}')
+
+    def commit(self):
+        self.commits += 1
+
+    def remove(self):
+        pass
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = DiscoveryDb([FRIEND])
+    monkeypatch.setattr(api.db, 'session', db)
+    monkeypatch.setattr(api, 'redis_pubsub', fakeredis.FakeRedis(decode_responses=True))
+    return db
+
+
+def post_batch(items):
+    with api.app.app_context():
+        token = create_access_token(identity=str(uuid.uuid4()), additional_claims={'username': 'alice'})
+    return api.app.test_client().post('/discoveries/batch', json={'discoveries': items},
+                                      headers={'Authorization': f'Bearer {token}'})
+
+
+def test_partial_failure_creates_the_valid_discoveries(db):
+    resp = post_batch([
+        {'query': 'ferns', 'url': 'https://example.org/ferns', 'title': 'Ferns'},
+        {'url': 'https://example.org/no-query'},
+        {'query': 'ferns', 'url': 'https://example.org/ferns', 'title': 'Ferns again'},
+        {'query': 'moss', 'url': 'https://example.org/moss', 'is_gift': True, 'gifted_to': STRANGER},
+        {'query': 'moss', 'url': 'https://example.org/moss', 'is_gift': True, 'gifted_to': FRIEND}
+    ])
+
+    assert resp.status_code == 207
+    body = resp.get_json()
+    assert (body['created'], body['failed']) == (2, 3)
+    assert [result['status'] for result in body['results']] == [
+        'created', 'invalid', 'duplicate', 'invalid', 'created'
+    ]
+    assert body['results'][1]['errors'] == {'query': 'Required'}
+    assert body['results'][2]['duplicate_of'] == 0
+    assert body['results'][3]['errors'] == {'gifted_to': 'Unknown user'}
+
+    # The created ones go in with one INSERT and one commit
+    [insert] = db.inserts
+    assert insert['ids'] == [body['results'][0]['id'], body['results'][4]['id']]
+    assert insert['gifted_tos'] == [None, FRIEND]
+    assert db.commits == 1
+    assert all('discovered_at' in body['results'][index] for index in (0, 4))
+
+
+def test_batch_without_valid_discoveries_is_rejected(db):
+    resp = post_batch([{'query': ''}, 'not an object'])
+
+    assert resp.status_code == 400
+    assert [result['status'] for result in resp.get_json()['results']] == ['invalid', 'invalid']
+    assert db.inserts == [] and db.commits == 0
+
+
+def test_batch_is_announced_in_one_event(db):
+    subscriber = api.redis_pubsub.pubsub()
+    subscriber.subscribe('discoveries:batch')
+    subscriber.get_message()
+
+    resp = post_batch([
+        {'query': 'ferns', 'url': 'https://example.org/ferns', 'title': 'Ferns'},
+        {'query': 'moss', 'url': 'https://example.org/moss', 'is_gift': True, 'gifted_to': FRIEND}
+    ])
+
+    event = json.loads(subscriber.get_message()['data'])
+    assert event['count'] == 2
+    assert [(d['id'], d['is_gift'], d['gifted_to']) for d in event['discoveries']] == [
+        (resp.get_json()['results'][0]['id'], False, None),
+        (resp.get_json()['results'][1]['id'], True, FRIEND)
+    ]
+    assert subscriber.get_message() is None
@@ -0,0 +1,103 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+import app as api
+
+NOW = datetime(2026, 10, 16, 12, 0, tzinfo=timezone.utc)
+
+
+class Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def one(self):
+        return self.rows[0]
+
+    def fetchall(self):
+        return self.rows
+
+
+class ListingDb:
+    """The change counter and a page of discoveries for DiscoveryList.get"""
+
+    def __init__(self, count):
+        self.version = 1
+        self.rows = [
+            SimpleNamespace(_mapping={
+                'id': str(uuid.uuid4()),
+                'user_id': str(uuid.uuid4()),
+                'query': f'query {i}',
+                'discovered_at': NOW - timedelta(minutes=i),
+                'username': 'alice',
+                'display_name': 'Alice'
+            })
+            for i in range(count)
+        ]
+        self.pages = []
+
+    def execute(self, query, params=None):
+        statement = ' '.join(str(query).split())
+        if statement.startswith('SELECT version'):
+            latest = self.rows[0]._mapping['discovered_at'] if self.rows else None
+            return Result([(self.version, latest)])
+        if statement.startswith('SELECT d.*'):
+            self.pages.append((statement, params))
+            return Result(self.rows[:params['limit']])
+        raise AssertionError(f'Unexpected SQL: {statement}')
+
+    def remove(self):
+        pass
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = ListingDb(3)
+    monkeypatch.setattr(api.db, 'session', db)
+    return db
+
+
+def list_discoveries(query='', etag=None):
+    with api.app.app_context():
+        token = create_access_token(identity=str(uuid.uuid4()), additional_claims={'username': 'alice'})
+    headers = {'Authorization': f'Bearer {token}'}
+    if etag:
+        headers['If-None-Match'] = etag
+    return api.app.test_client().get(f'/discoveries/{query}', headers=headers)
+
+
+def test_unchanged_listing_revalidates_without_the_page_query(db):
+    first = list_discoveries()
+    assert first.status_code == 200 and len(first.json) == 3
+
+    again = list_discoveries(etag=first.headers['ETag'])
+    assert again.status_code == 304
+    assert len(db.pages) == 1
+
+
+def test_any_counted_change_invalidates_the_etag(db):
+    etag = list_discoveries().headers['ETag']
+
+    # A delete or an edit leaves the newest timestamp where it was
+    db.version += 1
+    assert list_discoveries(etag=etag).status_code == 200
+
+
+def test_next_cursor_continues_after_the_last_row(db):
+    first = list_discoveries('?limit=2')
+    assert len(first.json) == 2
+
+    cursor = first.headers['X-Next-Cursor']
+    assert api.decode_cursor(cursor) == (db.rows[1]._mapping['discovered_at'], db.rows[1]._mapping['id'])
+    list_discoveries(f'?limit=2&cursor={cursor}')
+    statement, params = db.pages[-1]
+    assert '(d.discovered_at, d.id) < (:cursor_at, CAST(:cursor_id AS uuid))' in statement
+    assert params['cursor_id'] == db.rows[1]._mapping['id']
+
+
+def test_malformed_cursor_is_rejected(db):
+    assert list_discoveries('?cursor=not-a-cursor').status_code == 400
+    assert list_discoveries('?since=yesterday').status_code == 400
@@ -0,0 +1,50 @@
+"""Discovery change counter in init-db/05-discoveries-version.sql; needs TEST_DATABASE_URL"""
+
+
+def as_new_transaction(pg):
+    """The fixture runs in one transaction; forget that it already bumped the counter"""
+    pg.execute('UPDATE discovery_changes SET changed_in = NULL')
+
+
+def version(pg):
+    # The triggers are deferred to commit; fire them without committing
+    pg.execute('SET CONSTRAINTS ALL IMMEDIATE')
+    pg.execute('SET CONSTRAINTS ALL DEFERRED')
+    pg.execute('SELECT version FROM discovery_changes')
+    return pg.fetchone()[0]
+
+
+def test_every_kind_of_change_bumps_the_version(pg):
+    pg.execute("INSERT INTO users (username, display_name) VALUES ('version_owner', 'Owner') RETURNING id")
+    owner = pg.fetchone()[0]
+    as_new_transaction(pg)
+    start = version(pg)
+
+    pg.execute("INSERT INTO discoveries (user_id, query) VALUES (%s, 'ferns'), (%s, 'moss') RETURNING id",
+               (owner, owner))
+    first = pg.fetchone()[0]
+    pg.execute("INSERT INTO discoveries (user_id, query) VALUES (%s, 'lichen')", (owner,))
+    assert version(pg) == start + 1  # once per transaction, however many rows
+
+    changes = [
+        ("UPDATE discoveries SET annotations = '{\"note\": \"lovely\"}' WHERE id = %s", (first,)),
+        ('UPDATE discoveries SET is_gift = TRUE WHERE id = %s', (first,)),
+        ("UPDATE users SET display_name = 'Renamed' WHERE id = %s", (owner,)),
+        ('DELETE FROM discoveries WHERE id = %s', (first,)),
+        ('DELETE FROM users WHERE id = %s', (owner,))  # cascades to the remaining discoveries
+    ]
+    for statement, params in changes:
+        as_new_transaction(pg)
+        before = version(pg)
+        pg.execute(statement, params)
+        assert version(pg) > before, statement
+
+
+def test_unrelated_user_updates_leave_the_version_alone(pg):
+    pg.execute("INSERT INTO users (username) VALUES ('version_idle') RETURNING id")
+    user = pg.fetchone()[0]
+    as_new_transaction(pg)
+    before = version(pg)
+
+    pg.execute("UPDATE users SET last_seen = NOW(), current_mood = 'sleepy' WHERE id = %s", (user,))
+    assert version(pg) == before
@@ -0,0 +1,89 @@
+import json
+import uuid
+from datetime import date, datetime, timezone
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+from flask_jwt_extended import create_access_token
+
+import app as api
+
+DIGEST_DATE = date(2026, 10, 15)
+
+
+class Result:
+    def __init__(self, row):
+        self.row = row
+
+    def first(self):
+        return self.row
+
+    def scalar(self):
+        return self.row
+
+
+class CoffeeDb:
+    """One morning_coffee row"""
+
+    def __init__(self, reactions):
+        self.reactions = reactions
+        self.queries = 0
+
+    def execute(self, query, params):
+        assert params == {'date': DIGEST_DATE}
+        self.queries += 1
+        statement = ' '.join(str(query).split())
+        if statement.startswith('SELECT coffee_reactions'):
+            return Result(self.reactions)
+        return Result(SimpleNamespace(
+            discoveries={'top_discoveries': []},
+            generated_summary='Quiet day',
+            coffee_reactions=self.reactions,
+            created_at=datetime(2026, 10, 16, 6, 0, tzinfo=timezone.utc)
+        ))
+
+    def remove(self):
+        pass
+
+
+@pytest.fixture
+def coffee(monkeypatch):
+    db = CoffeeDb({'user-1': '☕☕'})
+    cache = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(api.db, 'session', db)
+    monkeypatch.setattr(api, 'redis_cache', cache)
+    monkeypatch.setattr(api, '_coffee_cache', {})
+    return SimpleNamespace(db=db, cache=cache)
+
+
+def get_coffee(etag=None):
+    with api.app.app_context():
+        token = create_access_token(identity=str(uuid.uuid4()), additional_claims={'username': 'alice'})
+    headers = {'Authorization': f'Bearer {token}'}
+    if etag:
+        headers['If-None-Match'] = etag
+    return api.app.test_client().get(f'/social/morning-coffee?date={DIGEST_DATE.isoformat()}', headers=headers)
+
+
+def test_reactions_come_from_the_table_whichever_copy_is_read(coffee):
+    from_table = get_coffee().get_json()
+
+    api._coffee_cache.clear()
+    coffee.cache.set(f'morning_coffee:{DIGEST_DATE.isoformat()}', json.dumps({
+        'digest': {'top_discoveries': []},
+        'summary': 'Quiet day',
+        'generated_at': '2026-10-16T06:00:00+00:00'
+    }))
+    from_redis = get_coffee().get_json()
+
+    assert from_table['reactions'] == from_redis['reactions'] == {'user-1': '☕☕'}
+
+
+def test_encoded_digest_is_reused_and_revalidated(coffee):
+    first = get_coffee()
+    assert first.status_code == 200
+
+    again = get_coffee(etag=first.headers['ETag'])
+    assert again.status_code == 304
+    assert coffee.db.queries == 1
@@ -0,0 +1,57 @@
+import fakeredis
+import pytest
+
+from convivial_shared import presence
+from convivial_shared.presence import INDEX_KEY, STATUS_KEY, PresenceIndex, anonymize_query
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(presence.time, 'time', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def index():
+    return PresenceIndex(fakeredis.FakeRedis(decode_responses=True), ttl=300)
+
+
+def test_online_lists_recent_heartbeats_newest_first(index, clock):
+    index.update('alice', {'username': 'alice', 'status': 'searching'})
+    clock[0] += 10
+    index.update('bob', {'username': 'bob', 'status': 'idle'})
+
+    assert index.online() == [
+        {'username': 'bob', 'status': 'idle', 'user_id': 'bob'},
+        {'username': 'alice', 'status': 'searching', 'user_id': 'alice'}
+    ]
+
+
+def test_heartbeat_replaces_the_status(index, clock):
+    index.update('alice', {'status': 'searching'})
+    clock[0] += 10
+    index.update('alice', {'status': 'idle'})
+
+    assert index.online() == [{'status': 'idle', 'user_id': 'alice'}]
+
+
+def test_silent_users_are_pruned_from_both_keys(index, clock):
+    index.update('alice', {'status': 'searching'})
+    clock[0] += 200
+    index.update('bob', {'status': 'idle'})
+    clock[0] += 101  # alice is now 301s silent, bob 101s
+
+    assert [user['user_id'] for user in index.online()] == ['bob']
+    assert index.redis.zrange(INDEX_KEY, 0, -1) == ['bob']
+    assert index.redis.hkeys(STATUS_KEY) == ['bob']
+
+
+def test_empty_index(index):
+    assert index.online() == []
+
+
+def test_query_hints_do_not_reveal_the_query():
+    assert anonymize_query('ferns') == 'f****'
+    assert anonymize_query('alpine medicinal plants') == '3 words about a...'
+    assert anonymize_query('owl') == '✨'
@@ -0,0 +1,215 @@
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from flask_jwt_extended import create_access_token
+from minio.error import S3Error
+
+import app as api
+
+USER_ID = str(uuid.uuid4())
+UPLOAD_ID = str(uuid.uuid4())
+OBJECT_KEY = f'{USER_ID}/general/{UPLOAD_ID}.png'
+
+
+class Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def first(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+
+class UploadDb:
+    """file_uploads rows, answering the statements the upload endpoints send"""
+
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.updates = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def execute(self, query, params):
+        statement = ' '.join(str(query).split())
+        if statement.startswith('SELECT object_key'):
+            return Result([row for row in self.rows if row.id == params['id']])
+        if statement.startswith('UPDATE file_uploads SET status = :status'):
+            self.updates.append(params)
+            return Result([])
+        if statement.startswith("UPDATE file_uploads SET status = 'expired'"):
+            return Result([row for row in self.rows if row.status == 'pending'])
+        raise AssertionError(statement)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def remove(self):
+        pass
+
+
+class FakeMinio:
+    def __init__(self, size=1024, etag='staged-etag'):
+        self.size = size
+        self.etag = etag
+        self.copies = []
+        self.removed = []
+
+    def stat_object(self, bucket, key):
+        return SimpleNamespace(size=self.size, etag=self.etag)
+
+    def copy_object(self, bucket, key, source, metadata=None, metadata_directive=None):
+        if source._match_etag != self.etag:
+            raise S3Error('PreconditionFailed', 'etag changed', key, 'req', 'host', None)
+        self.copies.append((key, source, metadata))
+        return SimpleNamespace(etag='final-etag')
+
+    def remove_object(self, bucket, key):
+        self.removed.append(key)
+
+    def presigned_get_object(self, bucket, key, expires=None):
+        return f'https://files.example/{key}'
+
+
+class FakeS3:
+    def __init__(self):
+        self.completed = []
+        self.aborted = []
+
+    def complete_multipart_upload(self, **kwargs):
+        self.completed.append(kwargs)
+
+    def abort_multipart_upload(self, **kwargs):
+        self.aborted.append(kwargs)
+
+
+def pending(upload_id=UPLOAD_ID, object_key=OBJECT_KEY, multipart_upload_id=None):
+    return SimpleNamespace(
+        id=upload_id,
+        object_key=object_key,
+        file_type='general',
+        content_type='image/png',
+        multipart_upload_id=multipart_upload_id,
+        status='pending'
+    )
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    minio = FakeMinio()
+    s3 = FakeS3()
+    monkeypatch.setattr(api, 'minio_client', minio)
+    monkeypatch.setattr(api, 'minio_public', minio)
+    monkeypatch.setattr(api, 's3_client', s3)
+    return SimpleNamespace(minio=minio, s3=s3)
+
+
+def use_db(monkeypatch, rows):
+    db = UploadDb(rows)
+    monkeypatch.setattr(api.db, 'session', db)
+    return db
+
+
+def complete(upload_id=UPLOAD_ID, body=None):
+    with api.app.app_context():
+        token = create_access_token(identity=USER_ID, additional_claims={'username': 'alice'})
+    return api.app.test_client().post(
+        f'/files/uploads/{upload_id}/complete',
+        json=body or {},
+        headers={'Authorization': f'Bearer {token}'}
+    )
+
+
+def test_completion_copies_the_checked_object_out_of_staging(monkeypatch, storage):
+    db = use_db(monkeypatch, [pending()])
+
+    response = complete()
+
+    assert response.status_code == 200
+    assert response.get_json()['size'] == 1024
+    [(key, source, metadata)] = storage.minio.copies
+    assert key == OBJECT_KEY
+    assert source._object_name == api.staging_key(OBJECT_KEY)
+    assert source._match_etag == 'staged-etag'
+    assert metadata == {'Content-Type': 'image/png'}
+    assert storage.minio.removed == [api.staging_key(OBJECT_KEY)]
+    assert db.updates == [{'id': UPLOAD_ID, 'status': 'complete', 'size': 1024, 'etag': 'final-etag'}]
+
+
+def test_object_replaced_after_the_check_is_not_copied(monkeypatch, storage):
+    db = use_db(monkeypatch, [pending()])
+    stat_object = storage.minio.stat_object
+
+    def stat_then_overwrite(bucket, key):
+        stat = stat_object(bucket, key)
+        storage.minio.etag = 'overwritten-etag'
+        return stat
+
+    monkeypatch.setattr(storage.minio, 'stat_object', stat_then_overwrite)
+
+    response = complete()
+
+    assert response.status_code == 502
+    assert storage.minio.copies == []
+    assert db.updates == []
+    assert db.rollbacks == 1
+
+
+def test_oversize_object_is_rejected_and_discarded(monkeypatch, storage):
+    db = use_db(monkeypatch, [pending()])
+    storage.minio.size = api.UPLOAD_MAX_BYTES + 1
+
+    response = complete()
+
+    assert response.status_code == 413
+    assert storage.minio.copies == []
+    assert storage.minio.removed == [api.staging_key(OBJECT_KEY)]
+    assert db.updates[0]['status'] == 'rejected'
+
+
+def test_multipart_parts_are_completed_in_order(monkeypatch, storage):
+    use_db(monkeypatch, [pending(multipart_upload_id='mp-1')])
+
+    response = complete(body={'parts': [
+        {'part_number': 2, 'etag': 'b'},
+        {'part_number': 1, 'etag': 'a'}
+    ]})
+
+    assert response.status_code == 200
+    [call] = storage.s3.completed
+    assert call['Key'] == api.staging_key(OBJECT_KEY)
+    assert call['UploadId'] == 'mp-1'
+    assert call['MultipartUpload'] == {'Parts': [
+        {'PartNumber': 1, 'ETag': 'a'},
+        {'PartNumber': 2, 'ETag': 'b'}
+    ]}
+
+
+def test_upload_is_completed_only_once(monkeypatch, storage):
+    use_db(monkeypatch, [SimpleNamespace(**dict(vars(pending()), status='complete'))])
+
+    assert complete().status_code == 409
+    assert complete(upload_id='not-a-uuid').status_code == 404
+    assert storage.minio.copies == []
+
+
+def test_expired_uploads_free_their_staging_space(monkeypatch, storage):
+    single = pending()
+    multipart = pending(upload_id=str(uuid.uuid4()), object_key=f'{USER_ID}/general/big.bin',
+                        multipart_upload_id='mp-2')
+    use_db(monkeypatch, [single, multipart])
+
+    with api.app.app_context():
+        assert api.expire_pending_uploads() == 2
+
+    assert storage.minio.removed == [api.staging_key(OBJECT_KEY)]
+    assert storage.s3.aborted == [{
+        'Bucket': api.UPLOAD_BUCKET,
+        'Key': api.staging_key(f'{USER_ID}/general/big.bin'),
+        'UploadId': 'mp-2'
+    }]
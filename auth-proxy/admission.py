@@ -0,0 +1,216 @@
+"""
+Admission control for requests the auth proxy sends to SearXNG
+Bounds concurrency toward the upstream and hands free slots to waiting
+requests by priority class, so the first page of a search is never stuck
+behind infinite-scroll or speculative traffic
+"""
+
+import math
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+
+from circuit_breaker import UpstreamUnavailable
+
+# Highest priority first
+INTERACTIVE = 'interactive'
+AUTOCOMPLETE = 'autocomplete'
+STATIC = 'static'
+SCROLL = 'scroll'
+SPECULATIVE = 'speculative'
+PRIORITY_CLASSES = (INTERACTIVE, AUTOCOMPLETE, STATIC, SCROLL, SPECULATIVE)
+
+# Seconds a request may wait for a slot before it is turned away
+DEFAULT_QUEUE_TIMEOUTS = {
+    INTERACTIVE: 10.0,
+    AUTOCOMPLETE: 1.0,
+    STATIC: 5.0,
+    SCROLL: 10.0,
+    SPECULATIVE: 0.0
+}
+
+WAIT_SAMPLES = 1000
+
+
+def classify(path: str, values=None) -> str:
+    """Priority class of a proxied SearXNG request; ``values`` are its query/form fields"""
+    if path == 'search':
+        try:
+            pageno = int((values or {}).get('pageno', 1))
+        except ValueError:
+            pageno = 1
+        return INTERACTIVE if pageno <= 1 else SCROLL
+    if path == 'autocompleter':
+        return AUTOCOMPLETE
+    if path.startswith('static/') or path == 'favicon.ico':
+        return STATIC
+    return INTERACTIVE
+
+
+def parse_class_settings(spec: str, defaults: Dict[str, float], cast: Callable = float) -> Dict[str, float]:
+    """Parse ``scroll=4,speculative=1`` overrides on top of the defaults"""
+    settings = dict(defaults)
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, value = item.partition('=')
+        settings[name.strip()] = cast(value)
+    return settings
+
+
+def worker_share(total: int, workers: int) -> int:
+    """Slots one of ``workers`` processes gets out of ``total``; never zero"""
+    return max(1, math.ceil(total / max(1, workers)))
+
+
+class AdmissionRejected(UpstreamUnavailable):
+    """No slot became free for this class in time; handled like an unavailable upstream"""
+
+
+class Ticket:
+    """A granted slot; release it exactly once when the upstream response is done"""
+
+    def __init__(self, controller: 'AdmissionController', priority_class: str):
+        self.controller = controller
+        self.priority_class = priority_class
+        self.granted = False
+        self.cancelled = False
+        self.released = False
+        self.event = threading.Event()
+
+    def release(self):
+        self.controller._release(self)
+
+
+class _ClassStats:
+    def __init__(self):
+        self.admitted = 0
+        self.rejected = 0
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+        self.max_wait = 0.0
+
+    def record_wait(self, seconds: float):
+        self.waits.append(seconds)
+        self.max_wait = max(self.max_wait, seconds)
+
+    def summary(self) -> Dict:
+        waits = sorted(self.waits)
+
+        def percentile(p):
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(len(waits) * p))] * 1000, 1)
+
+        return {
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'wait_ms_p50': percentile(0.50),
+            'wait_ms_p95': percentile(0.95),
+            'wait_ms_p99': percentile(0.99),
+            'wait_ms_max': round(self.max_wait * 1000, 1)
+        }
+
+
+class AdmissionController:
+    """Priority queues in front of a fixed number of upstream slots
+
+    Lower classes may also be capped below ``max_concurrency`` so some slots
+    are always left for interactive searches.
+    """
+
+    def __init__(self, name: str, max_concurrency: int = 16, class_limits: Dict[str, int] = None,
+                 queue_timeouts: Dict[str, float] = None, max_queue: int = 256):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.class_limits = {
+            SCROLL: max(1, max_concurrency // 2),
+            SPECULATIVE: max(1, max_concurrency // 4)
+        }
+        self.class_limits.update(class_limits or {})
+        self.queue_timeouts = dict(DEFAULT_QUEUE_TIMEOUTS)
+        self.queue_timeouts.update(queue_timeouts or {})
+        self.max_queue = max_queue
+
+        self._lock = threading.Lock()
+        self._active = 0
+        self._active_by_class = {name: 0 for name in PRIORITY_CLASSES}
+        self._queues = {name: deque() for name in PRIORITY_CLASSES}
+        self._stats = {name: _ClassStats() for name in PRIORITY_CLASSES}
+
+    def _has_room(self, priority_class: str) -> bool:
+        limit = self.class_limits.get(priority_class, self.max_concurrency)
+        return self._active < self.max_concurrency and self._active_by_class[priority_class] < limit
+
+    def _grant(self, ticket: Ticket):
+        ticket.granted = True
+        self._active += 1
+        self._active_by_class[ticket.priority_class] += 1
+        ticket.event.set()
+
+    def _dispatch(self):
+        """Hand free slots to the oldest waiter of the highest class that has room"""
+        for priority_class in PRIORITY_CLASSES:
+            queue = self._queues[priority_class]
+            while queue and self._has_room(priority_class):
+                ticket = queue.popleft()
+                if not ticket.cancelled:
+                    self._grant(ticket)
+            if self._active >= self.max_concurrency:
+                return
+
+    def admit(self, priority_class: str, timeout: Optional[float] = None) -> Ticket:
+        """Wait for a slot in ``priority_class`` or raise AdmissionRejected"""
+        if priority_class not in self._queues:
+            priority_class = INTERACTIVE
+        if timeout is None:
+            timeout = self.queue_timeouts.get(priority_class, 0)
+        stats = self._stats[priority_class]
+        ticket = Ticket(self, priority_class)
+        started = time.monotonic()
+
+        with self._lock:
+            if len(self._queues[priority_class]) >= self.max_queue:
+                stats.rejected += 1
+                raise AdmissionRejected(self.name, f'{priority_class} queue full', 1)
+            self._queues[priority_class].append(ticket)
+            self._dispatch()
+
+        if not ticket.granted:
+            ticket.event.wait(timeout)
+
+        with self._lock:
+            if not ticket.granted:
+                ticket.cancelled = True
+                try:
+                    self._queues[priority_class].remove(ticket)
+                except ValueError:
+                    pass
+                stats.rejected += 1
+                raise AdmissionRejected(self.name, f'no {priority_class} slot free', 1)
+            stats.admitted += 1
+            stats.record_wait(time.monotonic() - started)
+        return ticket
+
+    def _release(self, ticket: Ticket):
+        with self._lock:
+            if ticket.released or not ticket.granted:
+                return
+            ticket.released = True
+            self._active -= 1
+            self._active_by_class[ticket.priority_class] -= 1
+            self._dispatch()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'max_concurrency': self.max_concurrency,
+                'active': self._active,
+                'class_limits': self.class_limits,
+                'classes': {
+                    name: dict(
+                        self._stats[name].summary(),
+                        active=self._active_by_class[name],
+                        queued=len(self._queues[name])
+                    )
+                    for name in PRIORITY_CLASSES
+                }
+            }
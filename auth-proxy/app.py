@@ -7,10 +7,33 @@ import os
 import jwt
 import redis
 from datetime import datetime
-from flask import Flask, request, redirect, session, render_template_string, make_response
+from flask import (
+    Flask, Response, request, redirect, session, render_template_string,
+    make_response, stream_with_context
+)
 from flask_session import Session
 import requests
 
+from admission import (
+    SPECULATIVE, AdmissionController, DEFAULT_QUEUE_TIMEOUTS, classify, parse_class_settings, worker_share
+)
+from assets import IMMUTABLE, URL_PREFIX
+from cookie_session import CookieSessionInterface
+from coalescing import SingleFlight
+from convivial_shared.search_events import SEARCH_KEY_HEADER
+from proxy_common import (
+    SEARXNG_URL, AUTH_SERVICE_URL, API_SERVICE_URL, AUTH_VERIFY_MODE, PROXY_METHODS,
+    PROXY_RESPONSE_MODE, STREAM_CHUNK_SIZE, HOP_BY_HOP_RESPONSE_HEADERS, LOGIN_TEMPLATE,
+    CONVIVIAL_API_URL, LEGACY_CONVIVIAL_API_URL, SESSION_BACKEND, assets, token_verifier,
+    build_inject_script, build_session_codec, is_internal_caller, upstream_headers
+)
+from prefetch import SPECULATIVE_HEADER, Prefetcher
+from result_cache import SearchResultCache, parse_category_ttls, replayable_headers, search_key
+from served_searches import ServedSearches
+from streaming import inject_stream, tee
+from token_refresh import RefreshRejected, TokenRefresher
+from upstream import UpstreamClient
+
 app = Flask(__name__)
 
 # Configuration
@@ -27,194 +50,133 @@ app.config['SESSION_COOKIE_SECURE'] = os.environ.get('ENV') == 'production'
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 
 # Initialize session
-Session(app)
-
-# Service URLs
-SEARXNG_URL = os.environ.get('SEARXNG_URL', 'http://searxng:8080')
-AUTH_SERVICE_URL = os.environ.get('AUTH_SERVICE_URL', 'http://auth-service:5000')
-API_SERVICE_URL = os.environ.get('API_SERVICE_URL', 'http://api-service:5001')
-JWT_SECRET = os.environ.get('JWT_SECRET', 'dev-jwt-secret')
-
-# Login page template
-LOGIN_TEMPLATE = """
-<!DOCTYPE html>
-<html>
-<head>
-    <title>Digital Salon - Login</title>
-    <meta name="viewport" content="width=device-width, initial-scale=1">
-    <style>
-        body {
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            min-height: 100vh;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            margin: 0;
-        }
-        .container {
-            background: white;
-            padding: 2rem;
-            border-radius: 12px;
-            box-shadow: 0 20px 25px -5px rgba(0, 0, 0, 0.1);
-            width: 100%;
-            max-width: 400px;
-        }
-        h1 {
-            text-align: center;
-            color: #1a202c;
-            margin-bottom: 0.5rem;
-        }
-        .subtitle {
-            text-align: center;
-            color: #718096;
-            margin-bottom: 2rem;
-        }
-        .form-group {
-            margin-bottom: 1.5rem;
-        }
-        label {
-            display: block;
-            color: #4a5568;
-            margin-bottom: 0.5rem;
-            font-weight: 500;
-        }
-        input {
-            width: 100%;
-            padding: 0.75rem;
-            border: 1px solid #e2e8f0;
-            border-radius: 6px;
-            font-size: 1rem;
-            transition: border-color 0.2s;
-        }
-        input:focus {
-            outline: none;
-            border-color: #667eea;
-        }
-        button {
-            width: 100%;
-            padding: 0.75rem;
-            background: #667eea;
-            color: white;
-            border: none;
-            border-radius: 6px;
-            font-size: 1rem;
-            font-weight: 500;
-            cursor: pointer;
-            transition: background 0.2s;
-        }
-        button:hover {
-            background: #5a67d8;
-        }
-        .toggle-form {
-            text-align: center;
-            margin-top: 1.5rem;
-            color: #718096;
-        }
-        .toggle-form a {
-            color: #667eea;
-            text-decoration: none;
-        }
-        .error {
-            background: #fed7d7;
-            color: #c53030;
-            padding: 0.75rem;
-            border-radius: 6px;
-            margin-bottom: 1rem;
-        }
-        .success {
-            background: #c6f6d5;
-            color: #2f855a;
-            padding: 0.75rem;
-            border-radius: 6px;
-            margin-bottom: 1rem;
-        }
-        .friend-count {
-            text-align: center;
-            color: #718096;
-            font-size: 0.875rem;
-            margin-top: 1rem;
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>🌟 Digital Salon</h1>
-        <p class="subtitle">{{ 'Join' if is_register else 'Welcome back to' }} your private search circle</p>
-        
-        {% if error %}
-            <div class="error">{{ error }}</div>
-        {% endif %}
-        
-        {% if success %}
-            <div class="success">{{ success }}</div>
-        {% endif %}
-        
-        <form method="POST">
-            {% if is_register %}
-                <div class="form-group">
-                    <label for="email">Email</label>
-                    <input type="email" id="email" name="email" required>
-                </div>
-            {% endif %}
-            
-            <div class="form-group">
-                <label for="username">Username</label>
-                <input type="text" id="username" name="username" required>
-            </div>
-            
-            <div class="form-group">
-                <label for="password">Password</label>
-                <input type="password" id="password" name="password" required>
-            </div>
-            
-            {% if is_register %}
-                <div class="form-group">
-                    <label for="display_name">Display Name (optional)</label>
-                    <input type="text" id="display_name" name="display_name">
-                </div>
-            {% endif %}
-            
-            <button type="submit">{{ 'Create Account' if is_register else 'Login' }}</button>
-        </form>
-        
-        <div class="toggle-form">
-            {% if is_register %}
-                Already have an account? <a href="/login">Login</a>
-            {% else %}
-                New to the salon? <a href="/register">Register</a>
-            {% endif %}
-        </div>
-        
-        {% if friend_count is defined %}
-            <div class="friend-count">
-                {{ friend_count }} of 3 friend slots used
-            </div>
-        {% endif %}
-    </div>
-    
-    <!-- Include the convivial API -->
-    <script src="/static/js/convivial-api.js"></script>
-</body>
-</html>
-"""
+if SESSION_BACKEND == 'cookie':
+    app.session_interface = CookieSessionInterface(build_session_codec())
+else:
+    Session(app)
+
+# Pooled keep-alive clients, one per upstream (see upstream.UpstreamClient.from_env)
+searxng_client = UpstreamClient.from_env('searxng', 'SEARXNG', SEARXNG_URL, pool_size=20, read_timeout=30)
+auth_client = UpstreamClient.from_env('auth-service', 'AUTH_SERVICE', AUTH_SERVICE_URL)
+api_client = UpstreamClient.from_env('api-service', 'API_SERVICE', API_SERVICE_URL)
+
+# Priority admission in front of SearXNG (see admission.py). Slots are counted
+# per process, so ADMISSION_MAX_CONCURRENCY is the total for the container and
+# each of the PROXY_WORKERS gunicorn workers gets an equal share. A share only
+# ever queues requests when it is smaller than the worker's PROXY_THREADS;
+# ADMISSION_CLASS_LIMITS apply within each share. See the Dockerfile.
+PROXY_WORKERS = int(os.environ.get('PROXY_WORKERS', '1'))
+PROXY_THREADS = int(os.environ.get('PROXY_THREADS', '1'))
+ADMISSION_PER_WORKER = worker_share(int(os.environ.get('ADMISSION_MAX_CONCURRENCY', '16')), PROXY_WORKERS)
+if os.environ.get('ADMISSION_ENABLED', 'true').lower() == 'true':
+    if ADMISSION_PER_WORKER >= PROXY_THREADS:
+        app.logger.warning(
+            f"Admission allows {ADMISSION_PER_WORKER} SearXNG requests per worker but workers have "
+            f"{PROXY_THREADS} threads; lower ADMISSION_MAX_CONCURRENCY or raise PROXY_THREADS "
+            "for priorities to take effect"
+        )
+    searxng_client.admission = AdmissionController(
+        'searxng',
+        max_concurrency=ADMISSION_PER_WORKER,
+        class_limits=parse_class_settings(os.environ.get('ADMISSION_CLASS_LIMITS', ''), {}, int),
+        queue_timeouts=parse_class_settings(os.environ.get('ADMISSION_QUEUE_TIMEOUTS', ''),
+                                            DEFAULT_QUEUE_TIMEOUTS)
+    )
+
+# Shared /search result cache in redis-cache (see result_cache.py)
+SEARCH_CACHE_ENABLED = os.environ.get('SEARCH_CACHE_ENABLED', 'true').lower() == 'true'
+result_cache = SearchResultCache(
+    redis.Redis(host=os.environ.get('REDIS_HOST', 'redis-cache'), port=6379),
+    category_ttls=parse_category_ttls(os.environ.get('SEARCH_CACHE_TTLS', '')),
+    stale_ttl=int(os.environ.get('SEARCH_CACHE_STALE_TTL', '600')),
+    max_bytes=int(os.environ.get('SEARCH_CACHE_MAX_BYTES', str(2 * 1024 * 1024))),
+    fallback_ttl=int(os.environ.get('SEARCH_CACHE_FALLBACK_TTL', '86400'))
+)
+
+# Single-flight for identical concurrent searches (see coalescing.py)
+COALESCE_SEARCHES = os.environ.get('COALESCE_SEARCHES', 'true').lower() == 'true'
+COALESCE_ACROSS_WORKERS = os.environ.get('COALESCE_ACROSS_WORKERS', 'false').lower() == 'true'
+coalescer = SingleFlight(
+    result_cache.redis if COALESCE_ACROSS_WORKERS and SEARCH_CACHE_ENABLED else None,
+    wait_timeout=float(os.environ.get('COALESCE_WAIT_TIMEOUT', '30'))
+)
+
+# Opt-in page-2 prefetch for infinite scroll into the result cache (see prefetch.py)
+PREFETCH_ENABLED = (os.environ.get('PREFETCH_ENABLED', 'false').lower() == 'true'
+                    and SEARCH_CACHE_ENABLED)
+prefetcher = Prefetcher(
+    result_cache.store,
+    per_user=int(os.environ.get('PREFETCH_PER_USER', '1')),
+    max_in_flight=int(os.environ.get('PREFETCH_MAX_IN_FLIGHT', '4'))
+) if PREFETCH_ENABLED else None
+
+# Searches answered without SearXNG, announced to its plugins (see served_searches.py)
+served_searches = ServedSearches(result_cache.redis)
+
+# Silent access-token refresh shortly before expiry (see token_refresh.py)
+TOKEN_REFRESH_ENABLED = os.environ.get('TOKEN_REFRESH_ENABLED', 'true').lower() == 'true'
+token_refresher = TokenRefresher(
+    auth_client,
+    app.config['SESSION_REDIS'],
+    margin=float(os.environ.get('TOKEN_REFRESH_MARGIN', '120'))
+)
 
 def verify_token(token):
+    """Verify JWT token, locally unless AUTH_VERIFY_MODE=remote"""
+    if AUTH_VERIFY_MODE == 'local':
+        return token_verifier.verify(token)
+    return verify_token_remote(token)
+
+def verify_token_remote(token):
     """Verify JWT token with auth service"""
     try:
         headers = {'Authorization': f'Bearer {token}'}
-        response = requests.get(f"{AUTH_SERVICE_URL}/auth/verify", headers=headers, timeout=5)
+        response = auth_client.get('/auth/verify', headers=headers)
         if response.status_code == 200:
             return response.json()
         return None
     except:
         return None
 
+def authenticate_session():
+    """(token, user_info) for this session, refreshing the access token when needed
+
+    The token is verified first. A valid token is renewed once it is within
+    ``TOKEN_REFRESH_MARGIN`` seconds of expiry; an invalid one only if
+    expiry is its sole fault (see TokenVerifier.verify_expired), so a revoked
+    token is never swapped for a fresh one. A refresh token that auth-service
+    refuses (e.g. revoked at logout) ends the session.
+    """
+    token = session.get('access_token')
+    if not token:
+        return None, None
+    
+    user_info = verify_token(token)
+    refresh_token = session.get('refresh_token')
+    if not TOKEN_REFRESH_ENABLED or not refresh_token:
+        return token, user_info
+    if user_info:
+        if not token_refresher.due(token):
+            return token, user_info
+    elif token_verifier.verify_expired(token) is None:
+        return token, None
+    
+    try:
+        new_token = token_refresher.refresh(refresh_token)
+    except RefreshRejected:
+        session.clear()
+        return None, None
+    new_info = verify_token(new_token) if new_token else None
+    if new_info:
+        session['access_token'] = new_token
+        return new_token, new_info
+    return token, user_info
+
 def get_friend_count():
     """Get current friend count"""
     try:
         # Create a temporary token for internal use
-        response = requests.get(f"{AUTH_SERVICE_URL}/auth/users", timeout=5)
+        response = auth_client.get('/auth/users')
         if response.status_code == 200:
             data = response.json()
             return data.get('count', 0)
@@ -231,10 +193,9 @@ def login():
         
         # Authenticate with auth service
         try:
-            response = requests.post(
-                f"{AUTH_SERVICE_URL}/auth/login",
-                json={'username': username, 'password': password},
-                timeout=10
+            response = auth_client.post(
+                '/auth/login',
+                json={'username': username, 'password': password}
             )
             
             if response.status_code == 200:
@@ -277,11 +238,7 @@ def register():
         }
         
         try:
-            response = requests.post(
-                f"{AUTH_SERVICE_URL}/auth/register",
-                json=data,
-                timeout=10
-            )
+            response = auth_client.post('/auth/register', json=data)
             
             if response.status_code == 201:
                 result = response.json()
@@ -312,111 +269,305 @@ def register():
 def logout():
     """Logout user"""
     token = session.get('access_token')
+    refresh_token = session.get('refresh_token')
     if token:
         try:
+            # Revoke the refresh token as well: a copied session cookie must not outlive this
             headers = {'Authorization': f'Bearer {token}'}
-            requests.post(f"{AUTH_SERVICE_URL}/auth/logout", headers=headers, timeout=5)
+            auth_client.post('/auth/logout', headers=headers, json={'refresh_token': refresh_token})
         except:
             pass
+    if refresh_token:
+        token_refresher.forget(refresh_token)
     
     session.clear()
     return redirect('/login')
 
-@app.route('/static/js/convivial-api.js')
+@app.context_processor
+def inject_asset_urls():
+    return {'convivial_api_url': CONVIVIAL_API_URL}
+
+def asset_response(asset, cache_control):
+    """Serve an in-memory asset, honouring Accept-Encoding and If-None-Match"""
+    status, body, headers = assets.response_parts(
+        asset,
+        request.headers.get('Accept-Encoding', ''),
+        request.headers.get('If-None-Match', ''),
+        cache_control
+    )
+    return Response(body, status=status, headers=headers)
+
+@app.route(f'{URL_PREFIX}<filename>')
+def serve_convivial_asset(filename):
+    """Serve a fingerprinted convivial asset (cacheable forever)"""
+    asset = assets.get(request.path)
+    if asset is None:
+        return "Not found", 404
+    return asset_response(asset, IMMUTABLE)
+
+@app.route(LEGACY_CONVIVIAL_API_URL)
 def serve_convivial_api():
-    """Serve the convivial API JavaScript"""
-    try:
-        with open('/app/static/js/convivial-api.js', 'r') as f:
-            content = f.read()
-        return content, 200, {'Content-Type': 'application/javascript'}
-    except:
+    """Serve the convivial API JavaScript at its unversioned URL"""
+    asset = assets.by_name.get('convivial-api.js')
+    if asset is None:
         return "console.error('Convivial API not found');", 404
+    return asset_response(asset, 'no-cache')
+
+def upstream_response_headers(resp):
+    """Upstream headers minus the ones that describe the upstream connection"""
+    return [
+        (key, value) for key, value in resp.headers.items()
+        if key.lower() not in HOP_BY_HOP_RESPONSE_HEADERS
+    ]
+
+def stream_upstream_response(resp, inject_script=None, on_complete=None, extra_headers=()):
+    """Relay an upstream response as it arrives, splicing in the script for HTML"""
+    headers = upstream_response_headers(resp)
+    
+    body = resp.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+    if on_complete is not None:
+        # Tee the raw upstream bytes, before anything user-specific is spliced in
+        body = tee(body, on_complete, result_cache.max_bytes)
+    if inject_script is not None:
+        body = inject_stream(body, inject_script.encode('utf-8'))
+    elif 'Content-Encoding' not in resp.headers and 'Content-Length' in resp.headers:
+        # Untouched identity bodies keep their length so clients can show progress
+        headers.append(('Content-Length', resp.headers['Content-Length']))
+    headers.extend(extra_headers)
+    
+    response = Response(stream_with_context(body), status=resp.status_code, headers=headers)
+    response.call_on_close(resp.close)
+    if on_complete is not None:
+        # Covers responses that are closed before their body is ever iterated
+        response.call_on_close(lambda: on_complete(None))
+    return response
+
+def fetch_search_page(path, params, headers):
+    """Fetch a search page in full for the cache (revalidation and prefetch)
+
+    Nobody is waiting on these, so they are marked speculative both for
+    admission and for SearXNG plugins, which must not record them.
+    """
+    headers = dict(headers)
+    headers[SPECULATIVE_HEADER[0]] = SPECULATIVE_HEADER[1]
+    resp = searxng_client.get(f'/{path}', params=params, headers=headers, priority_class=SPECULATIVE)
+    return resp.status_code, upstream_response_headers(resp), resp.content
+
+def page_response(status, headers, body, user_info, token, cache_key, cache_state):
+    """Serve a buffered search page (cached or coalesced) with this user's script spliced in
+
+    SearXNG never sees these searches, so they are announced to its plugins
+    on the served-search stream instead.
+    """
+    served_searches.record(user_info, request.values.get('q', ''), request.values.get('mood', ''),
+                           search_key=cache_key.key, served_as=cache_state)
+    headers = list(headers)
+    headers.append(('X-Proxy-Cache', cache_state))
+    
+    if any(key.lower() == 'content-type' and 'text/html' in value for key, value in headers):
+        payload = build_inject_script(user_info, token).encode('utf-8')
+        body = b''.join(inject_stream([body], payload))
+    return Response(body, status=status, headers=headers)
 
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
+def search_unavailable(error, cache_key, user_info, token):
+    """Answer a search SearXNG cannot serve: an old cached page if any, else 503"""
+    if cache_key is not None and SEARCH_CACHE_ENABLED:
+        page = result_cache.get(cache_key, allow_expired=True)
+        if page is not None:
+            return page_response(page.status, page.headers, page.body, user_info, token, cache_key, 'FALLBACK')
+    
+    response = make_response(f"Error connecting to search service: {str(error)}", 503)
+    retry_after = getattr(error, 'retry_after', 0)
+    if retry_after:
+        response.headers['Retry-After'] = str(max(1, int(retry_after)))
+    return response
+
+def next_page_prefetch(path, cache_key, headers, user_info):
+    """Callable that warms page 2 after page 1 is served, or None
+
+    Everything it needs is taken from the request now, since it may run
+    after the request context is gone.
+    """
+    if prefetcher is None or cache_key is None or cache_key.pageno != 1:
+        return None
+    values = request.values.copy()
+    values['pageno'] = '2'
+    next_key = search_key(values, request.cookies)
+    params = values.to_dict(flat=False)
+    headers = dict(headers)
+    headers[SEARCH_KEY_HEADER] = next_key.key
+    user_id = str(user_info['user_id'])
+    
+    def _prefetch():
+        if not result_cache.contains(next_key):
+            prefetcher.schedule(next_key, user_id, lambda: fetch_search_page(path, params, headers))
+    
+    return _prefetch
+
+def search_completion(cache_key, flight, status, headers, on_served=None):
+    """Callback run once per upstream search: store the page and release waiters"""
+    done = False
+    
+    def _complete(body):
+        nonlocal done
+        if done:
+            return
+        done = True
+        if body is not None and SEARCH_CACHE_ENABLED:
+            result_cache.store(cache_key, status, headers, body)
+        if flight is not None:
+            # Waiters belong to other users: never hand them this user's Set-Cookie
+            coalescer.complete(flight, (status, replayable_headers(headers), body) if body is not None else None)
+        if body is not None and status == 200 and on_served is not None:
+            on_served()
+    
+    return _complete
+
+@app.route('/', defaults={'path': ''}, methods=PROXY_METHODS)
+@app.route('/<path:path>', methods=PROXY_METHODS)
 def proxy(path):
     """Proxy requests to SearXNG with authentication"""
-    # Check if user is authenticated
-    token = session.get('access_token')
+    # Check if user is authenticated (renewing the access token if it is about to expire)
+    token, user_info = authenticate_session()
     if not token:
         return redirect(f'/login?next={request.path}')
     
-    # Verify token
-    user_info = verify_token(token)
     if not user_info:
         session.clear()
         return redirect(f'/login?next={request.path}')
     
-    # Proxy the request to SearXNG
-    url = f"{SEARXNG_URL}/{path}"
+    headers = upstream_headers(request.headers, user_info)
+    # Read the raw body before request.values parses (and consumes) the form
+    data = None if request.method == 'GET' else request.get_data()
+    
+    cache_key = None
+    if path == 'search' and request.method in ('GET', 'POST') and (
+            SEARCH_CACHE_ENABLED or COALESCE_SEARCHES):
+        cache_key = search_key(request.values, request.cookies)
+    if cache_key is not None:
+        # Lets SearXNG plugins keep this page's results for later served-search events
+        headers[SEARCH_KEY_HEADER] = cache_key.key
+    prefetch = next_page_prefetch(path, cache_key, headers, user_info)
+    
+    flight = None
+    if cache_key is not None:
+        # Repeated searches (and prefetched scroll pages) are answered from the shared cache
+        if SEARCH_CACHE_ENABLED:
+            page = result_cache.get(cache_key)
+            if page is not None:
+                if page.is_stale:
+                    params = request.values.to_dict(flat=False)
+                    result_cache.revalidate(cache_key, lambda: fetch_search_page(path, params, headers))
+                if prefetch is not None:
+                    prefetch()
+                return page_response(page.status, page.headers, page.body, user_info, token, cache_key,
+                                     'STALE' if page.is_stale else 'HIT')
+        
+        # Identical searches already in flight share one upstream request
+        if COALESCE_SEARCHES:
+            flight, leader = coalescer.join(cache_key.key)
+            if not leader:
+                result = coalescer.wait(flight)
+                flight = None
+                if result is not None:
+                    if prefetch is not None:
+                        prefetch()
+                    return page_response(*result, user_info, token, cache_key, 'COALESCED')
+            elif COALESCE_ACROSS_WORKERS and not coalescer.claim_distributed(flight):
+                page = coalescer.wait_distributed(cache_key.key, lambda: result_cache.get(cache_key))
+                if page is not None:
+                    coalescer.complete(flight, (page.status, page.headers, page.body))
+                    if prefetch is not None:
+                        prefetch()
+                    return page_response(page.status, page.headers, page.body, user_info, token, cache_key,
+                                         'COALESCED')
     
     # Forward request
     try:
-        # Prepare headers
-        headers = dict(request.headers)
-        headers['X-User-Id'] = user_info['user_id']
-        headers['X-Username'] = user_info['claims']['username']
-        headers['X-User-Role'] = user_info['claims']['role']
-        
-        # Remove hop-by-hop headers
-        for header in ['Host', 'Connection', 'Content-Length', 'Transfer-Encoding']:
-            headers.pop(header, None)
-        
-        # Make request
-        if request.method == 'GET':
-            resp = requests.get(
-                url,
-                params=request.args,
-                headers=headers,
-                stream=True,
-                timeout=30
-            )
-        else:
-            resp = requests.request(
-                method=request.method,
-                url=url,
-                params=request.args,
-                headers=headers,
-                data=request.get_data(),
-                stream=True,
-                timeout=30
-            )
-        
-        # Create response
-        response = make_response(resp.content)
-        response.status_code = resp.status_code
-        
-        # Copy headers
-        for key, value in resp.headers.items():
-            if key.lower() not in ['connection', 'content-encoding', 'content-length', 'transfer-encoding']:
-                response.headers[key] = value
-        
-        # Inject convivial features if it's an HTML page
-        if 'text/html' in resp.headers.get('Content-Type', ''):
-            content = resp.content.decode('utf-8')
-            
-            # Inject user info and convivial features
-            inject_script = f"""
-            <script>
-                window.convivialUser = {user_info['claims']};
-                window.convivialToken = '{token}';
-            </script>
-            <script src="/static/js/convivial-api.js"></script>
-            """
-            
-            # Inject before </body>
-            content = content.replace('</body>', inject_script + '</body>')
-            response.data = content.encode('utf-8')
-        
-        return response
-        
+        resp = searxng_client.request(
+            request.method,
+            f'/{path}',
+            params=request.args,
+            headers=headers,
+            data=data,
+            stream=True,
+            priority_class=classify(path, request.values)
+        )
     except requests.exceptions.RequestException as e:
-        return f"Error connecting to search service: {str(e)}", 503
+        if flight is not None:
+            coalescer.complete(flight)
+        return search_unavailable(e, cache_key, user_info, token)
+    except Exception:
+        if flight is not None:
+            coalescer.complete(flight)
+        raise
+    
+    is_html = 'text/html' in resp.headers.get('Content-Type', '')
+    inject_script = build_inject_script(user_info, token) if is_html else None
+    
+    on_complete = None
+    extra_headers = []
+    if cache_key is not None:
+        on_complete = search_completion(cache_key, flight, resp.status_code, upstream_response_headers(resp),
+                                        prefetch)
+        extra_headers.append(('X-Proxy-Cache', 'MISS'))
+    
+    if PROXY_RESPONSE_MODE == 'stream':
+        return stream_upstream_response(resp, inject_script, on_complete, extra_headers)
+    
+    try:
+        content = resp.content
+    except requests.exceptions.RequestException as e:
+        if on_complete is not None:
+            on_complete(None)
+        return search_unavailable(e, cache_key, user_info, token)
+    finally:
+        resp.close()
+    if on_complete is not None:
+        on_complete(content)
+    
+    # Create response
+    response = make_response(content)
+    response.status_code = resp.status_code
+    
+    # Copy headers
+    for key, value in upstream_response_headers(resp) + extra_headers:
+        response.headers[key] = value
+    
+    # Inject convivial features if it's an HTML page
+    if is_html:
+        content = content.decode('utf-8')
+        
+        # Inject before </body>
+        content = content.replace('</body>', inject_script + '</body>')
+        response.data = content.encode('utf-8')
+    
+    return response
 
 @app.route('/health')
 def health():
     """Health check"""
     return {'status': 'healthy', 'service': 'auth-proxy'}
 
+@app.route('/health/stats')
+def health_stats():
+    """Internal counters for monitoring"""
+    if not is_internal_caller(request.headers):
+        return {'message': 'Stats are for internal monitoring only'}, 403
+    return {
+        'token_cache': token_verifier.stats(),
+        'search_cache': result_cache.stats(),
+        'coalescing': coalescer.stats(),
+        'token_refresh': token_refresher.stats(),
+        'session_cookies': (app.session_interface.codec.stats()
+                            if isinstance(app.session_interface, CookieSessionInterface) else None),
+        'prefetch': prefetcher.stats() if prefetcher is not None else None,
+        'served_searches': served_searches.stats(),
+        'upstreams': {
+            client.name: client.stats()
+            for client in (searxng_client, auth_client, api_client)
+        }
+    }
+
 if __name__ == '__main__':
     app.run(debug=os.environ.get('ENV') != 'production', host='0.0.0.0', port=8000)
\ No newline at end of file
@@ -0,0 +1,141 @@
+"""
+Fingerprinted convivial assets for the auth proxy
+Loads the convivial JS/CSS into memory once, precompresses them and serves
+them under content-hash URLs that browsers may cache forever
+"""
+
+import gzip
+import hashlib
+import logging
+import os
+from typing import Dict, NamedTuple, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # optional: gzip is always available
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+URL_PREFIX = '/static/convivial/'
+
+# Logical name -> path relative to the asset root. Only convivial-api.js is
+# linked from proxied pages (proxy_common.build_inject_script); the others are
+# served at their fingerprinted URLs (AssetBundle.url_for) for convivial pages
+# that opt in, so SearXNG's own pages keep their look.
+CONVIVIAL_ASSETS = {
+    'convivial-api.js': 'static/js/convivial-api.js',
+    'convivial-features.js': 'static/js/convivial-features.js',
+    'convivial-ui.css': 'static/css/convivial-ui.css',
+    'convivial-theme.css': 'themes/convivial-theme.css'
+}
+
+CONTENT_TYPES = {
+    '.js': 'application/javascript; charset=utf-8',
+    '.css': 'text/css; charset=utf-8'
+}
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+class Asset(NamedTuple):
+    name: str
+    url: str
+    content_type: str
+    etag: str
+    variants: Dict[str, bytes]  # content-coding -> body, 'identity' always present
+
+
+def _accepted_encodings(header: str) -> Dict[str, float]:
+    accepted = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    return accepted
+
+
+class AssetBundle:
+    """In-memory, precompressed copies of the convivial assets"""
+
+    def __init__(self, root: str, assets: Dict[str, str] = None):
+        self.root = root
+        self.by_name: Dict[str, Asset] = {}
+        self.by_url: Dict[str, Asset] = {}
+        for name, relative in (assets or CONVIVIAL_ASSETS).items():
+            try:
+                self._add(name, os.path.join(root, relative))
+            except OSError as e:
+                logger.warning(f"Convivial asset {name} not loaded: {e}")
+
+    def _add(self, name: str, path: str):
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        stem, ext = os.path.splitext(name)
+
+        variants = {'identity': data}
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(compressed) < len(data):
+            variants['gzip'] = compressed
+        if brotli is not None:
+            compressed = brotli.compress(data, quality=11)
+            if len(compressed) < len(data):
+                variants['br'] = compressed
+
+        asset = Asset(
+            name=name,
+            url=f"{URL_PREFIX}{stem}.{digest}{ext}",
+            content_type=CONTENT_TYPES.get(ext, 'application/octet-stream'),
+            etag=f'W/"{digest}"',
+            variants=variants
+        )
+        self.by_name[name] = asset
+        self.by_url[asset.url] = asset
+
+    def url_for(self, name: str, fallback: str) -> str:
+        """Fingerprinted URL for ``name``, or ``fallback`` if the file was not loaded"""
+        asset = self.by_name.get(name)
+        return asset.url if asset else fallback
+
+    def get(self, url: str) -> Optional[Asset]:
+        return self.by_url.get(url)
+
+    @staticmethod
+    def negotiate(asset: Asset, accept_encoding: str) -> Tuple[str, bytes]:
+        """Smallest variant the client accepts"""
+        accepted = _accepted_encodings(accept_encoding or '')
+        for coding in ('br', 'gzip'):
+            if coding in asset.variants and accepted.get(coding, accepted.get('*', 0)) > 0:
+                return coding, asset.variants[coding]
+        return 'identity', asset.variants['identity']
+
+    @staticmethod
+    def not_modified(asset: Asset, if_none_match: str) -> bool:
+        tags = {tag.strip() for tag in (if_none_match or '').split(',')}
+        return '*' in tags or asset.etag in tags or asset.etag[2:] in tags
+
+    def response_parts(self, asset: Asset, accept_encoding: str, if_none_match: str,
+                       cache_control: str = IMMUTABLE) -> Tuple[int, bytes, Dict[str, str]]:
+        """Status, body and headers for serving ``asset``"""
+        headers = {
+            'ETag': asset.etag,
+            'Cache-Control': cache_control,
+            'Vary': 'Accept-Encoding'
+        }
+        if self.not_modified(asset, if_none_match):
+            return 304, b'', headers
+
+        coding, body = self.negotiate(asset, accept_encoding)
+        headers['Content-Type'] = asset.content_type
+        if coding != 'identity':
+            headers['Content-Encoding'] = coding
+        return 200, body, headers
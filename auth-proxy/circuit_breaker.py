@@ -0,0 +1,151 @@
+"""
+Circuit breaker and concurrency limit for auth proxy upstreams
+Stops sending work to an upstream that keeps failing, probes it again after
+a cool-down, and caps how many requests may be in flight to it at once
+"""
+
+import threading
+import time
+from typing import Dict
+
+import requests
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class UpstreamUnavailable(requests.exceptions.ConnectionError):
+    """Raised instead of calling an upstream that is open or saturated
+
+    Subclasses ``requests`` errors so existing ``except RequestException``
+    handlers treat a rejection like any other connection failure.
+    """
+
+    def __init__(self, upstream: str, reason: str, retry_after: float = 0):
+        super().__init__(f"{upstream} unavailable ({reason})")
+        self.upstream = upstream
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Permit:
+    """One admitted call; report its outcome and release its slot exactly once"""
+
+    def __init__(self, breaker: 'CircuitBreaker', probe: bool):
+        self.breaker = breaker
+        self.probe = probe
+        self._recorded = False
+        self._released = False
+
+    def success(self):
+        if not self._recorded:
+            self._recorded = True
+            self.breaker._on_success(self)
+
+    def failure(self):
+        if not self._recorded:
+            self._recorded = True
+            self.breaker._on_failure(self)
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.breaker._release(self)
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with half-open probing and a bulkhead"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30,
+                 half_open_max_calls: int = 1, max_concurrency: int = 32,
+                 acquire_timeout: float = 1.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.max_concurrency = max_concurrency
+        self.acquire_timeout = acquire_timeout
+
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._in_flight = 0
+        self._counters = {'opened': 0, 'rejected_open': 0, 'rejected_saturated': 0, 'failures': 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def _retry_after(self) -> float:
+        return max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at))
+
+    def acquire(self) -> Permit:
+        """Admit a call or raise UpstreamUnavailable"""
+        with self._lock:
+            state = self._current_state()
+            probe = False
+            if state == OPEN:
+                self._counters['rejected_open'] += 1
+                raise UpstreamUnavailable(self.name, 'circuit open', self._retry_after())
+            if state == HALF_OPEN:
+                if self._probes >= self.half_open_max_calls:
+                    self._counters['rejected_open'] += 1
+                    raise UpstreamUnavailable(self.name, 'circuit half-open', self.recovery_timeout)
+                self._probes += 1
+                probe = True
+
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            with self._lock:
+                self._counters['rejected_saturated'] += 1
+                if probe:
+                    self._probes -= 1
+            raise UpstreamUnavailable(self.name, 'too many concurrent requests', 1)
+
+        with self._lock:
+            self._in_flight += 1
+        return Permit(self, probe)
+
+    def _on_success(self, permit: Permit):
+        with self._lock:
+            self._failures = 0
+            if self._state == HALF_OPEN:
+                self._state = CLOSED
+
+    def _on_failure(self, permit: Permit):
+        with self._lock:
+            self._counters['failures'] += 1
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self._counters['opened'] += 1
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def _release(self, permit: Permit):
+        with self._lock:
+            self._in_flight -= 1
+            if permit.probe and self._state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+        self._slots.release()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(
+                self._counters,
+                state=self._current_state(),
+                consecutive_failures=self._failures,
+                in_flight=self._in_flight,
+                max_concurrency=self.max_concurrency,
+                retry_after=round(self._retry_after(), 1) if self._state == OPEN else 0
+            )
@@ -0,0 +1,139 @@
+"""
+Single-flight coalescing for identical concurrent searches
+The first request for a key fetches from SearXNG; identical requests that
+arrive meanwhile wait for its body instead of fanning out again. With Redis
+configured, workers also wait on each other through a lock and a channel.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+LOCK_PREFIX = 'inflight:'
+DONE_CHANNEL_PREFIX = 'inflight:done:'
+
+
+class Flight:
+    """One upstream fetch that other requests in this worker can wait on"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.event = threading.Event()
+        self.result = None
+        self.waiters = 0
+        self.distributed = False
+
+
+class SingleFlight:
+    """Per-key in-flight registry, optionally shared across workers through Redis"""
+
+    def __init__(self, redis_client: Optional[redis.Redis] = None, wait_timeout: float = 30,
+                 lock_ttl: float = 35):
+        self.redis = redis_client
+        self.wait_timeout = wait_timeout
+        self.lock_ttl = lock_ttl
+        self._flights: Dict[str, Flight] = {}
+        self._lock = threading.Lock()
+        self._counters = {
+            'leaders': 0,
+            'saved_local': 0,
+            'saved_distributed': 0,
+            'wait_timeouts': 0,
+            'failed_flights': 0
+        }
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def join(self, key: str) -> Tuple[Flight, bool]:
+        """Return the flight for ``key`` and whether the caller must lead it"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                return flight, False
+            flight = Flight(key)
+            self._flights[key] = flight
+            self._counters['leaders'] += 1
+            return flight, True
+
+    def wait(self, flight: Flight):
+        """Block until the leader finishes; None means the caller should fetch itself"""
+        if not flight.event.wait(self.wait_timeout):
+            self._count('wait_timeouts')
+            return None
+        if flight.result is None:
+            return None
+        self._count('saved_local')
+        return flight.result
+
+    def complete(self, flight: Flight, result=None):
+        """Hand ``result`` (or None on failure) to every waiter and retire the flight"""
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        if result is None:
+            self._count('failed_flights')
+        flight.result = result
+        flight.event.set()
+
+        if flight.distributed and self.redis is not None:
+            try:
+                self.redis.delete(LOCK_PREFIX + flight.key)
+                self.redis.publish(DONE_CHANNEL_PREFIX + flight.key, b'1' if result is not None else b'0')
+            except redis.RedisError as e:
+                logger.warning(f"Could not release in-flight lock: {e}")
+
+    def claim_distributed(self, flight: Flight) -> bool:
+        """Take the cross-worker lock; False means another worker is already fetching"""
+        if self.redis is None:
+            return True
+        try:
+            claimed = self.redis.set(LOCK_PREFIX + flight.key, b'1', nx=True, px=int(self.lock_ttl * 1000))
+        except redis.RedisError as e:
+            logger.warning(f"In-flight lock unavailable: {e}")
+            return True
+        flight.distributed = bool(claimed)
+        return flight.distributed
+
+    def wait_distributed(self, key: str, load: Callable[[], Optional[object]]):
+        """Wait for another worker's fetch, then ``load()`` its result (usually from the cache)"""
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(DONE_CHANNEL_PREFIX + key)
+            # The other worker may have finished before we subscribed
+            result = load()
+            if result is None:
+                deadline = time.monotonic() + self.wait_timeout
+                while result is None and time.monotonic() < deadline:
+                    message = pubsub.get_message(timeout=min(1.0, deadline - time.monotonic()))
+                    if message is not None:
+                        result = load()
+                        break
+                    if not self.redis.exists(LOCK_PREFIX + key):
+                        result = load()
+                        break
+        except redis.RedisError as e:
+            logger.warning(f"Distributed in-flight wait failed: {e}")
+            return None
+        finally:
+            pubsub.close()
+
+        if result is None:
+            self._count('wait_timeouts')
+            return None
+        self._count('saved_distributed')
+        return result
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = dict(self._counters)
+            counters['in_flight'] = len(self._flights)
+        counters['upstream_requests_saved'] = counters['saved_local'] + counters['saved_distributed']
+        return counters
@@ -0,0 +1,122 @@
+"""
+Stateless session cookies for the auth proxy
+Keeps the whole session (tokens and a small user dict) in an encrypted,
+authenticated cookie so no Redis round trip is needed per request. Decoded
+cookies are memoized in a small LRU. Sessions stay revocable through the
+token blocklist, which every proxied request already checks.
+"""
+
+import base64
+import hashlib
+import json
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from flask.sessions import SecureCookieSession, SessionInterface
+
+# Browsers drop cookies larger than this
+MAX_COOKIE_BYTES = 4093
+
+
+def derive_key(secret: str) -> bytes:
+    """Fernet key from an arbitrary secret string"""
+    return base64.urlsafe_b64encode(hashlib.sha256(f'session-cookie:{secret}'.encode('utf-8')).digest())
+
+
+class SessionCodec:
+    """zlib-compressed JSON sealed with Fernet (AES-CBC + HMAC), plus a decode LRU
+
+    The first secret encrypts; all of them decrypt, so keys can be rotated by
+    prepending a new one.
+    """
+
+    def __init__(self, secrets: List[str], max_age: int = 30 * 86400, cache_size: int = 1024):
+        self.fernet = MultiFernet([Fernet(derive_key(secret)) for secret in secrets])
+        self.max_age = max_age
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # cookie hash -> (data, issued_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def encode(self, data: Dict) -> str:
+        payload = zlib.compress(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+        return self.fernet.encrypt(payload).decode('ascii')
+
+    def decode(self, cookie: str) -> Optional[Dict]:
+        """Session dict for ``cookie``, or None if it is forged, corrupt or too old"""
+        key = hashlib.sha256(cookie.encode('utf-8')).digest()
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[1] + self.max_age > now:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return dict(entry[0])
+            self.misses += 1
+
+        try:
+            token = cookie.encode('ascii')
+            payload = self.fernet.decrypt(token, ttl=self.max_age)
+            data = json.loads(zlib.decompress(payload))
+            issued_at = self.fernet.extract_timestamp(token)
+        except (InvalidToken, UnicodeError, zlib.error, ValueError):
+            return None
+        if not isinstance(data, dict):
+            return None
+
+        with self._lock:
+            self._cache[key] = (data, issued_at)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return dict(data)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'size': len(self._cache), 'hits': self.hits, 'misses': self.misses}
+
+
+class CookieSessionInterface(SessionInterface):
+    """Flask session interface backed by SessionCodec"""
+
+    session_class = SecureCookieSession
+
+    def __init__(self, codec: SessionCodec):
+        self.codec = codec
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if not cookie:
+            return self.session_class()
+        data = self.codec.decode(cookie)
+        return self.session_class(data or {})
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified:
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if not session.modified:
+            return
+
+        value = self.codec.encode(dict(session))
+        if len(name) + len(value) > MAX_COOKIE_BYTES:
+            app.logger.warning(f"Session cookie is {len(value)} bytes; browsers may drop it")
+        response.set_cookie(
+            name,
+            value,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
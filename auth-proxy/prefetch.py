@@ -0,0 +1,88 @@
+"""
+Speculative next-page prefetch for infinite scroll
+After page 1 of a search is served, fetches page 2 in the background at the
+lowest admission priority and stores it in the shared search result cache,
+so the scroll request that usually follows is answered without a SearXNG
+fan-out by whichever worker receives it
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, List, Tuple
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Sent with every speculative upstream request so SearXNG plugins can skip
+# side effects (presence, search history, discoveries) for searches nobody made
+SPECULATIVE_HEADER = ('Sec-Purpose', 'prefetch')
+
+
+class Prefetcher:
+    """Background page fetches with per-user and global caps
+
+    ``per_user`` bounds how many prefetches one user may have running and
+    ``max_in_flight`` bounds the whole worker; ``per_user`` is kept below it
+    so one user cannot take every slot. Fetched pages are handed to
+    ``store`` (``SearchResultCache.store``), which keeps only complete 200s.
+    """
+
+    def __init__(self, store: Callable[[Hashable, int, List[Tuple[str, str]], bytes], bool],
+                 per_user: int = 1, max_in_flight: int = 4):
+        self.store = store
+        self.per_user = max(1, min(per_user, max_in_flight - 1))
+        self.max_in_flight = max_in_flight
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='prefetch')
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, str] = {}  # key -> user_id
+        self._counters = {
+            'scheduled': 0,
+            'skipped_user_cap': 0,
+            'skipped_global_cap': 0,
+            'stored': 0,
+            'failed': 0
+        }
+
+    def schedule(self, key: Hashable, user_id: str,
+                 fetch: Callable[[], Tuple[int, List[Tuple[str, str]], bytes]]) -> bool:
+        """Run ``fetch`` in the background unless ``key`` is already running or a cap is hit"""
+        with self._lock:
+            if key in self._in_flight:
+                return False
+            if len(self._in_flight) >= self.max_in_flight:
+                self._counters['skipped_global_cap'] += 1
+                return False
+            if sum(1 for owner in self._in_flight.values() if owner == user_id) >= self.per_user:
+                self._counters['skipped_user_cap'] += 1
+                return False
+            self._in_flight[key] = user_id
+            self._counters['scheduled'] += 1
+
+        self._executor.submit(self._run, key, fetch)
+        return True
+
+    def _run(self, key: Hashable, fetch):
+        stored = False
+        try:
+            status, headers, body = fetch()
+            stored = self.store(key, status, headers, body)
+        except requests.exceptions.RequestException as e:
+            # Includes admission rejections when real traffic has the slots
+            logger.debug(f"Prefetch skipped: {e}")
+        except Exception as e:
+            logger.warning(f"Prefetch failed: {e}")
+
+        with self._lock:
+            self._in_flight.pop(key, None)
+            self._counters['stored' if stored else 'failed'] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(
+                self._counters,
+                in_flight=len(self._in_flight),
+                per_user=self.per_user,
+                max_in_flight=self.max_in_flight
+            )
@@ -0,0 +1,278 @@
+"""
+Shared pieces of the auth proxy
+Configuration, templates and helpers used by app.py, kept apart from the
+request handling
+"""
+
+import hmac
+import os
+
+import jwt
+import redis
+
+from assets import AssetBundle
+from convivial_shared.search_events import SEARCH_KEY_HEADER
+from cookie_session import SessionCodec
+from token_cache import TokenVerifier
+
+# Service URLs
+SEARXNG_URL = os.environ.get('SEARXNG_URL', 'http://searxng:8080')
+AUTH_SERVICE_URL = os.environ.get('AUTH_SERVICE_URL', 'http://auth-service:5000')
+API_SERVICE_URL = os.environ.get('API_SERVICE_URL', 'http://api-service:5001')
+
+# Response relay: 'stream' forwards chunks as they arrive, 'buffer' reads the whole body first
+PROXY_RESPONSE_MODE = os.environ.get('PROXY_RESPONSE_MODE', 'stream')
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', '16384'))
+HOP_BY_HOP_RESPONSE_HEADERS = ['connection', 'content-encoding', 'content-length', 'transfer-encoding']
+
+JWT_SECRET = os.environ.get('JWT_SECRET', 'dev-jwt-secret')
+
+# Asymmetric tokens are checked against auth-service's published keys;
+# JWT_ACCEPT_HS256=false stops trusting tokens signed with the shared secret
+AUTH_JWKS_URL = os.environ.get('AUTH_JWKS_URL', f'{AUTH_SERVICE_URL}/.well-known/jwks.json')
+JWT_ALGORITHMS = [name.strip() for name in os.environ.get('JWT_ALGORITHMS', 'EdDSA,RS256,HS256').split(',')]
+JWT_ACCEPT_HS256 = os.environ.get('JWT_ACCEPT_HS256', 'true').lower() == 'true'
+
+# Token verification: 'local' checks signatures in-process, 'remote' asks auth-service
+AUTH_VERIFY_MODE = os.environ.get('AUTH_VERIFY_MODE', 'local')
+
+token_verifier = TokenVerifier(
+    JWT_SECRET if JWT_ACCEPT_HS256 else None,
+    redis.Redis(
+        host=os.environ.get('REDIS_HOST', 'redis-cache'),
+        port=6379,
+        decode_responses=True
+    ),
+    algorithms=JWT_ALGORITHMS,
+    cache_size=int(os.environ.get('TOKEN_CACHE_SIZE', '1024')),
+    cache_ttl=int(os.environ.get('TOKEN_CACHE_TTL', '60')),
+    jwks_client=jwt.PyJWKClient(
+        AUTH_JWKS_URL,
+        cache_keys=True,
+        lifespan=int(os.environ.get('JWKS_CACHE_TTL', '300')),
+        timeout=5
+    ) if AUTH_JWKS_URL else None
+)
+
+# /health/stats is for monitoring inside the deployment only: callers send this
+# shared secret as X-Internal-Token (the endpoint is off while it is unset)
+INTERNAL_API_TOKEN = os.environ.get('INTERNAL_API_TOKEN', '')
+INTERNAL_TOKEN_HEADER = 'X-Internal-Token'
+
+
+def is_internal_caller(headers) -> bool:
+    """True if the request carries INTERNAL_API_TOKEN"""
+    return bool(INTERNAL_API_TOKEN) and hmac.compare_digest(
+        headers.get(INTERNAL_TOKEN_HEADER, '').encode('utf-8'), INTERNAL_API_TOKEN.encode('utf-8'))
+
+# Session storage: 'redis' (server-side, Flask-Session format) or 'cookie' (encrypted, stateless)
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'redis')
+
+
+def build_session_codec() -> SessionCodec:
+    """Codec for SESSION_BACKEND=cookie; SESSION_COOKIE_KEYS lists rotation keys, newest first"""
+    keys = [key.strip() for key in os.environ.get('SESSION_COOKIE_KEYS', '').split(',') if key.strip()]
+    return SessionCodec(
+        keys or [os.environ.get('SECRET_KEY', 'dev-secret-key')],
+        max_age=int(os.environ.get('SESSION_COOKIE_MAX_AGE', str(30 * 86400))),
+        cache_size=int(os.environ.get('SESSION_CACHE_SIZE', '1024'))
+    )
+
+# Request headers that must not be forwarded to SearXNG
+HOP_BY_HOP_REQUEST_HEADERS = ['Host', 'Connection', 'Content-Length', 'Transfer-Encoding']
+
+# Methods relayed by the catch-all route (SearXNG submits searches as POST by default)
+PROXY_METHODS = ['GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS']
+
+# Convivial JS/CSS, fingerprinted and precompressed at startup
+assets = AssetBundle(os.environ.get('ASSET_ROOT', '/app'))
+LEGACY_CONVIVIAL_API_URL = '/static/js/convivial-api.js'
+CONVIVIAL_API_URL = assets.url_for('convivial-api.js', LEGACY_CONVIVIAL_API_URL)
+
+# Login page template
+LOGIN_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Digital Salon - Login</title>
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    <style>
+        body {
+            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
+            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+            min-height: 100vh;
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            margin: 0;
+        }
+        .container {
+            background: white;
+            padding: 2rem;
+            border-radius: 12px;
+            box-shadow: 0 20px 25px -5px rgba(0, 0, 0, 0.1);
+            width: 100%;
+            max-width: 400px;
+        }
+        h1 {
+            text-align: center;
+            color: #1a202c;
+            margin-bottom: 0.5rem;
+        }
+        .subtitle {
+            text-align: center;
+            color: #718096;
+            margin-bottom: 2rem;
+        }
+        .form-group {
+            margin-bottom: 1.5rem;
+        }
+        label {
+            display: block;
+            color: #4a5568;
+            margin-bottom: 0.5rem;
+            font-weight: 500;
+        }
+        input {
+            width: 100%;
+            padding: 0.75rem;
+            border: 1px solid #e2e8f0;
+            border-radius: 6px;
+            font-size: 1rem;
+            transition: border-color 0.2s;
+        }
+        input:focus {
+            outline: none;
+            border-color: #667eea;
+        }
+        button {
+            width: 100%;
+            padding: 0.75rem;
+            background: #667eea;
+            color: white;
+            border: none;
+            border-radius: 6px;
+            font-size: 1rem;
+            font-weight: 500;
+            cursor: pointer;
+            transition: background 0.2s;
+        }
+        button:hover {
+            background: #5a67d8;
+        }
+        .toggle-form {
+            text-align: center;
+            margin-top: 1.5rem;
+            color: #718096;
+        }
+        .toggle-form a {
+            color: #667eea;
+            text-decoration: none;
+        }
+        .error {
+            background: #fed7d7;
+            color: #c53030;
+            padding: 0.75rem;
+            border-radius: 6px;
+            margin-bottom: 1rem;
+        }
+        .success {
+            background: #c6f6d5;
+            color: #2f855a;
+            padding: 0.75rem;
+            border-radius: 6px;
+            margin-bottom: 1rem;
+        }
+        .friend-count {
+            text-align: center;
+            color: #718096;
+            font-size: 0.875rem;
+            margin-top: 1rem;
+        }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>🌟 Digital Salon</h1>
+        <p class="subtitle">{{ 'Join' if is_register else 'Welcome back to' }} your private search circle</p>
+        
+        {% if error %}
+            <div class="error">{{ error }}</div>
+        {% endif %}
+        
+        {% if success %}
+            <div class="success">{{ success }}</div>
+        {% endif %}
+        
+        <form method="POST">
+            {% if is_register %}
+                <div class="form-group">
+                    <label for="email">Email</label>
+                    <input type="email" id="email" name="email" required>
+                </div>
+            {% endif %}
+            
+            <div class="form-group">
+                <label for="username">Username</label>
+                <input type="text" id="username" name="username" required>
+            </div>
+            
+            <div class="form-group">
+                <label for="password">Password</label>
+                <input type="password" id="password" name="password" required>
+            </div>
+            
+            {% if is_register %}
+                <div class="form-group">
+                    <label for="display_name">Display Name (optional)</label>
+                    <input type="text" id="display_name" name="display_name">
+                </div>
+            {% endif %}
+            
+            <button type="submit">{{ 'Create Account' if is_register else 'Login' }}</button>
+        </form>
+        
+        <div class="toggle-form">
+            {% if is_register %}
+                Already have an account? <a href="/login">Login</a>
+            {% else %}
+                New to the salon? <a href="/register">Register</a>
+            {% endif %}
+        </div>
+        
+        {% if friend_count is defined %}
+            <div class="friend-count">
+                {{ friend_count }} of 3 friend slots used
+            </div>
+        {% endif %}
+    </div>
+    
+    <!-- Include the convivial API -->
+    <script src="{{ convivial_api_url }}"></script>
+</body>
+</html>
+"""
+
+def build_inject_script(user_info, token):
+    """Script block that exposes the session to the convivial front-end"""
+    return f"""
+            <script>
+                window.convivialUser = {user_info['claims']};
+                window.convivialToken = '{token}';
+            </script>
+            <script src="{CONVIVIAL_API_URL}"></script>
+            """
+
+def upstream_headers(incoming, user_info):
+    """Headers for the SearXNG request: caller's headers plus identity, minus hop-by-hop"""
+    headers = dict(incoming)
+    headers['X-User-Id'] = user_info['user_id']
+    headers['X-Username'] = user_info['claims']['username']
+    headers['X-User-Role'] = user_info['claims']['role']
+    # Only the proxy may name the cache entry a search belongs to
+    headers.pop(SEARCH_KEY_HEADER, None)
+    headers.pop(INTERNAL_TOKEN_HEADER, None)
+    
+    for header in HOP_BY_HOP_REQUEST_HEADERS:
+        headers.pop(header, None)
+    return headers
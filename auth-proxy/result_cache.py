@@ -0,0 +1,223 @@
+"""
+Shared search result cache for the auth proxy
+Stores SearXNG /search responses in redis-cache, keyed by the normalized
+query, so friends repeating each other's searches skip the engine fan-out
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'search_cache:'
+
+# Freshness per SearXNG category, in seconds; a multi-category search uses the shortest
+DEFAULT_CATEGORY_TTLS = {
+    'general': 3600,
+    'news': 300,
+    'social media': 600,
+    'videos': 3600,
+    'images': 21600,
+    'music': 21600,
+    'it': 21600,
+    'files': 21600,
+    'science': 86400,
+    'map': 86400
+}
+
+# Only these upstream headers are replayed; Set-Cookie and friends never enter the cache
+STORED_HEADERS = ('content-type', 'content-language', 'content-security-policy', 'x-content-type-options')
+
+
+def replayable_headers(headers) -> List[Tuple[str, str]]:
+    """The subset of ``headers`` that may be served to another user"""
+    return [(key, value) for key, value in headers if key.lower() in STORED_HEADERS]
+
+
+class SearchKey(NamedTuple):
+    key: str
+    categories: Tuple[str, ...]
+    pageno: int
+
+
+class CachedPage(NamedTuple):
+    status: int
+    headers: List[Tuple[str, str]]
+    body: bytes
+    stored_at: float
+    fresh_until: float
+
+    @property
+    def is_stale(self) -> bool:
+        return time.time() >= self.fresh_until
+
+
+def normalize_query(query: str) -> str:
+    """Case, width and whitespace insensitive form of a query"""
+    return ' '.join(unicodedata.normalize('NFKC', query).casefold().split())
+
+
+def parse_category_ttls(spec: str) -> Dict[str, int]:
+    """Parse ``news=120,general=1800`` overrides on top of the defaults"""
+    ttls = dict(DEFAULT_CATEGORY_TTLS)
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, seconds = item.partition('=')
+        ttls[name.strip()] = int(seconds)
+    return ttls
+
+
+def search_key(values, cookies) -> Optional[SearchKey]:
+    """Cache key for a SearXNG search request, or None if it should not be cached
+
+    ``values`` are the merged query-string and form fields (SearXNG posts its
+    search form by default). The ``preferences`` cookie and the ``engines``
+    field change which engines run, and the convivial ``mood`` field retunes
+    them (plugins/search_moods.py), so all three are part of the key.
+    """
+    query = values.get('q', '')
+    if not query.strip():
+        return None
+
+    categories = values.get('categories')
+    if categories:
+        names = {name.strip() for name in categories.split(',') if name.strip()}
+    else:
+        names = {field[len('category_'):] for field in values if field.startswith('category_')}
+    categories = tuple(sorted(names)) or ('general',)
+
+    try:
+        pageno = max(int(values.get('pageno', 1)), 1)
+    except ValueError:
+        pageno = 1
+
+    parts = {
+        'q': normalize_query(query),
+        'pageno': pageno,
+        'categories': categories,
+        'language': values.get('language', 'all'),
+        'time_range': values.get('time_range', ''),
+        'safesearch': values.get('safesearch', ''),
+        'format': values.get('format', 'html'),
+        'engines': sorted({name.strip() for name in values.get('engines', '').split(',') if name.strip()}),
+        'mood': values.get('mood', ''),
+        'preferences': hashlib.sha256(cookies.get('preferences', '').encode('utf-8')).hexdigest()
+    }
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+    return SearchKey(digest, categories, pageno)
+
+
+class SearchResultCache:
+    """Redis-backed page cache with per-category TTLs and stale-while-revalidate
+
+    Entries outlive ``stale_ttl`` by up to ``fallback_ttl`` so an old page can
+    still be served while SearXNG is down.
+    """
+
+    def __init__(self, redis_client: redis.Redis, category_ttls: Dict[str, int] = None,
+                 stale_ttl: int = 600, max_bytes: int = 2 * 1024 * 1024, fallback_ttl: int = 0):
+        self.redis = redis_client
+        self.category_ttls = category_ttls or dict(DEFAULT_CATEGORY_TTLS)
+        self.stale_ttl = stale_ttl
+        self.fallback_ttl = max(fallback_ttl, stale_ttl)
+        self.max_bytes = max_bytes
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix='search-cache-refresh')
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'stores': 0, 'revalidations': 0, 'fallbacks': 0,
+                          'errors': 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def ttl_for(self, key: SearchKey) -> int:
+        default = self.category_ttls.get('general', 3600)
+        return min(self.category_ttls.get(name, default) for name in key.categories)
+
+    def get(self, key: SearchKey, allow_expired: bool = False) -> Optional[CachedPage]:
+        """Fresh or stale page for ``key``; ``allow_expired`` is for fallbacks only"""
+        try:
+            raw = self.redis.get(KEY_PREFIX + key.key)
+        except redis.RedisError as e:
+            logger.warning(f"Search cache read failed: {e}")
+            self._count('errors')
+            return None
+        if raw is None:
+            self._count('misses')
+            return None
+
+        meta, _, body = raw.partition(b'\n')
+        meta = json.loads(meta)
+        page = CachedPage(meta['status'], [tuple(h) for h in meta['headers']], body,
+                          meta['stored_at'], meta['fresh_until'])
+        if allow_expired:
+            self._count('fallbacks')
+        elif page.is_stale:
+            if time.time() >= page.fresh_until + self.stale_ttl:
+                self._count('misses')
+                return None
+            self._count('stale_hits')
+        else:
+            self._count('hits')
+        return page
+
+    def contains(self, key: SearchKey) -> bool:
+        """Whether an entry (fresh or not) exists; True when Redis cannot tell"""
+        try:
+            return bool(self.redis.exists(KEY_PREFIX + key.key))
+        except redis.RedisError:
+            return True
+
+    def store(self, key: SearchKey, status: int, headers, body: bytes) -> bool:
+        """Save an upstream page; only complete 200 responses under ``max_bytes`` are kept"""
+        if status != 200 or len(body) > self.max_bytes:
+            return False
+        ttl = self.ttl_for(key)
+        now = time.time()
+        meta = {
+            'status': status,
+            'headers': [list(header) for header in replayable_headers(headers)],
+            'stored_at': now,
+            'fresh_until': now + ttl
+        }
+        try:
+            self.redis.set(KEY_PREFIX + key.key, json.dumps(meta).encode('utf-8') + b'\n' + body,
+                           ex=ttl + self.fallback_ttl)
+        except redis.RedisError as e:
+            logger.warning(f"Search cache write failed: {e}")
+            self._count('errors')
+            return False
+        self._count('stores')
+        return True
+
+    def revalidate(self, key: SearchKey, fetch: Callable[[], Tuple[int, list, bytes]]):
+        """Refresh a stale entry in the background, once across all workers"""
+        try:
+            claimed = self.redis.set(f"{KEY_PREFIX}refresh:{key.key}", b'1', nx=True, ex=30)
+        except redis.RedisError:
+            return
+        if not claimed:
+            return
+        self._count('revalidations')
+
+        def _refresh():
+            try:
+                status, headers, body = fetch()
+                self.store(key, status, headers, body)
+            except Exception as e:
+                logger.warning(f"Search cache revalidation failed: {e}")
+                self._count('errors')
+
+        self._refresher.submit(_refresh)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._counters, stale_ttl=self.stale_ttl, fallback_ttl=self.fallback_ttl,
+                        category_ttls=self.category_ttls)
@@ -0,0 +1,54 @@
+"""
+Announces searches the proxy answers itself
+Cached, coalesced and fallback search pages never reach SearXNG, so its
+post_search plugins (presence, search sessions and collisions, discoveries)
+never see them. Each one is appended to the served-search stream instead
+(convivial_shared/search_events.py), which those plugins consume.
+"""
+
+import logging
+import threading
+from typing import Dict
+
+import redis
+
+from convivial_shared.search_events import publish_served_search
+
+logger = logging.getLogger(__name__)
+
+
+class ServedSearches:
+    """Publishes one stream event per search served without SearXNG
+
+    Failures are logged and never fail the search.
+    """
+
+    def __init__(self, redis_client: redis.Redis):
+        self.redis = redis_client
+        self._lock = threading.Lock()
+        self._counters = {'published': 0, 'errors': 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def record(self, user_info: Dict, query: str, mood: str = '', search_key: str = '', served_as: str = ''):
+        try:
+            publish_served_search(
+                self.redis,
+                str(user_info['user_id']),
+                user_info.get('claims', {}).get('username', ''),
+                query,
+                mood=mood,
+                search_key=search_key,
+                served_as=served_as
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Served search not announced: {e}")
+            self._count('errors')
+            return
+        self._count('published')
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._counters)
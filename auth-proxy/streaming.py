@@ -0,0 +1,84 @@
+"""
+Streaming helpers for the auth proxy
+Relays upstream bodies chunk by chunk and splices the convivial script into
+HTML without ever holding the whole document in memory
+"""
+
+from typing import Callable, Iterable, Iterator, Optional
+
+BODY_CLOSE = b'</body>'
+
+
+class ScriptInjector:
+    """Rolling-window scanner that inserts a payload before the first marker
+
+    Only ``len(marker) - 1`` bytes are held back between chunks, which is
+    enough to catch a marker split across two reads.
+    """
+
+    def __init__(self, payload: bytes, marker: bytes = BODY_CLOSE):
+        self.payload = payload
+        self.marker = marker
+        self.injected = False
+        self._tail = b''
+
+    def feed(self, chunk: bytes) -> bytes:
+        """Consume an upstream chunk and return the bytes that are safe to send"""
+        if self.injected:
+            return chunk
+
+        data = self._tail + chunk if self._tail else chunk
+        index = data.find(self.marker)
+        if index != -1:
+            self.injected = True
+            self._tail = b''
+            return data[:index] + self.payload + data[index:]
+
+        keep = len(self.marker) - 1
+        if len(data) <= keep:
+            self._tail = data
+            return b''
+        self._tail = data[-keep:]
+        return data[:-keep]
+
+    def flush(self) -> bytes:
+        """Release whatever is still held back once upstream is exhausted"""
+        tail, self._tail = self._tail, b''
+        return tail
+
+
+def inject_stream(chunks: Iterable[bytes], payload: bytes) -> Iterator[bytes]:
+    """Yield ``chunks`` with ``payload`` spliced in before ``</body>``"""
+    injector = ScriptInjector(payload)
+    for chunk in chunks:
+        out = injector.feed(chunk)
+        if out:
+            yield out
+    tail = injector.flush()
+    if tail:
+        yield tail
+
+
+def tee(chunks: Iterable[bytes], on_complete: Callable[[Optional[bytes]], None],
+        max_bytes: int) -> Iterator[bytes]:
+    """Yield ``chunks`` unchanged and hand the whole body to ``on_complete``
+
+    ``on_complete`` receives None when the body grew past ``max_bytes`` or the
+    relay was cut short (upstream error, client gone), so a partial page is
+    never mistaken for a complete one.
+    """
+    buffered = []
+    size = 0
+    complete = False
+    try:
+        for chunk in chunks:
+            if buffered is not None:
+                size += len(chunk)
+                if size > max_bytes:
+                    buffered = None
+                else:
+                    buffered.append(chunk)
+            yield chunk
+        complete = True
+    finally:
+        on_complete(b''.join(buffered) if complete and buffered is not None else None)
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The proxy's modules live next to this directory, not in a package, and
+# convivial_shared sits at the repository root (docker-compose mounts it)
+PROXY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(PROXY_DIR))
+sys.path.insert(0, PROXY_DIR)
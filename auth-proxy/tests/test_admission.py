@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+
+from admission import (
+    INTERACTIVE, SCROLL, SPECULATIVE, AdmissionController, AdmissionRejected, classify, worker_share
+)
+
+
+def wait_in_background(controller, priority_class, granted):
+    def run():
+        granted.append((priority_class, controller.admit(priority_class, timeout=5)))
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def wait_until_queued(controller, priority_class, count=1):
+    for _ in range(500):
+        if controller.stats()['classes'][priority_class]['queued'] >= count:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError(f'{priority_class} request never queued')
+
+
+def test_freed_slot_goes_to_the_highest_waiting_class():
+    controller = AdmissionController('searxng', max_concurrency=1, class_limits={SCROLL: 1})
+    held = controller.admit(INTERACTIVE)
+    granted = []
+    scroll = wait_in_background(controller, SCROLL, granted)
+    wait_until_queued(controller, SCROLL)
+    interactive = wait_in_background(controller, INTERACTIVE, granted)
+    wait_until_queued(controller, INTERACTIVE)
+
+    held.release()
+    interactive.join(timeout=5)
+    assert [name for name, _ in granted] == [INTERACTIVE]
+
+    granted[0][1].release()
+    scroll.join(timeout=5)
+    assert [name for name, _ in granted] == [INTERACTIVE, SCROLL]
+
+
+def test_lower_classes_leave_slots_for_interactive_searches():
+    controller = AdmissionController('searxng', max_concurrency=4)
+    speculative = controller.admit(SPECULATIVE)
+    with pytest.raises(AdmissionRejected):
+        controller.admit(SPECULATIVE)
+
+    tickets = [controller.admit(INTERACTIVE) for _ in range(3)]
+    assert controller.stats()['active'] == 4
+
+    speculative.release()
+    speculative.release()  # releasing twice frees one slot only
+    assert controller.stats()['active'] == 3
+    for ticket in tickets:
+        ticket.release()
+
+
+def test_full_queue_is_rejected_without_waiting():
+    controller = AdmissionController('searxng', max_concurrency=1, max_queue=0)
+    with pytest.raises(AdmissionRejected):
+        controller.admit(INTERACTIVE, timeout=5)
+    assert controller.stats()['classes'][INTERACTIVE]['rejected'] == 1
+
+
+def test_classify_by_path_and_page():
+    assert classify('search', {'pageno': '1'}) == INTERACTIVE
+    assert classify('search', {'pageno': '3'}) == SCROLL
+    assert classify('search', {'pageno': 'x'}) == INTERACTIVE
+    assert classify('autocompleter') == 'autocomplete'
+    assert classify('static/themes/simple/app.css') == 'static'
+
+
+def test_each_worker_gets_an_equal_share_of_the_limit():
+    assert worker_share(16, 4) == 4
+    assert worker_share(16, 3) == 6
+    assert worker_share(2, 4) == 1
+    assert worker_share(16, 0) == 16
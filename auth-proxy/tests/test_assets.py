@@ -0,0 +1,45 @@
+import gzip
+import os
+
+from assets import CONVIVIAL_ASSETS, IMMUTABLE, URL_PREFIX, AssetBundle
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_every_requested_asset_is_fingerprinted():
+    bundle = AssetBundle(REPO_ROOT)
+
+    assert set(bundle.by_name) == set(CONVIVIAL_ASSETS)
+    for asset in bundle.by_name.values():
+        assert asset.url.startswith(URL_PREFIX)
+        assert bundle.get(asset.url) is asset
+
+
+def test_fingerprint_follows_the_content(tmp_path):
+    (tmp_path / 'app.js').write_text('one')
+    first = AssetBundle(str(tmp_path), {'app.js': 'app.js'}).by_name['app.js']
+    (tmp_path / 'app.js').write_text('two')
+    second = AssetBundle(str(tmp_path), {'app.js': 'app.js'}).by_name['app.js']
+
+    assert first.url != second.url and first.etag != second.etag
+
+
+def test_precompressed_variant_and_revalidation():
+    bundle = AssetBundle(REPO_ROOT)
+    asset = bundle.by_name['convivial-ui.css']
+
+    status, body, headers = bundle.response_parts(asset, 'gzip, deflate', '')
+    assert status == 200
+    assert headers['Content-Encoding'] == 'gzip'
+    assert headers['Cache-Control'] == IMMUTABLE
+    assert gzip.decompress(body) == asset.variants['identity']
+
+    status, body, _ = bundle.response_parts(asset, 'gzip', asset.etag)
+    assert (status, body) == (304, b'')
+
+
+def test_missing_file_is_skipped(tmp_path):
+    bundle = AssetBundle(str(tmp_path), {'gone.js': 'gone.js'})
+
+    assert bundle.by_name == {}
+    assert bundle.url_for('gone.js', '/static/js/gone.js') == '/static/js/gone.js'
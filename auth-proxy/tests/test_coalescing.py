@@ -0,0 +1,64 @@
+import threading
+import time
+
+import fakeredis
+
+from coalescing import LOCK_PREFIX, SingleFlight
+
+
+def test_concurrent_requests_share_one_fetch():
+    flights = SingleFlight(wait_timeout=5)
+    leader_flight, leader = flights.join('tide tables')
+    assert leader
+
+    results = []
+
+    def follower():
+        flight, leads = flights.join('tide tables')
+        assert not leads
+        results.append(flights.wait(flight))
+
+    threads = [threading.Thread(target=follower) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    while leader_flight.waiters < 3:
+        time.sleep(0.001)
+    flights.complete(leader_flight, b'page')
+    for thread in threads:
+        thread.join()
+
+    assert results == [b'page'] * 3
+    assert flights.stats()['upstream_requests_saved'] == 3
+    assert flights.stats()['in_flight'] == 0
+
+
+def test_failed_fetch_sends_waiters_upstream_themselves():
+    flights = SingleFlight(wait_timeout=5)
+    flight, _ = flights.join('tide tables')
+    follower, _ = flights.join('tide tables')
+
+    flights.complete(flight, None)
+
+    assert flights.wait(follower) is None
+    # The key is free again for the next request
+    assert flights.join('tide tables')[1]
+
+
+def test_only_one_worker_claims_the_distributed_lock():
+    redis_client = fakeredis.FakeRedis()
+    first, second = SingleFlight(redis_client), SingleFlight(redis_client)
+
+    flight, _ = first.join('tide tables')
+    assert first.claim_distributed(flight)
+    assert not second.claim_distributed(second.join('tide tables')[0])
+
+    first.complete(flight, b'page')
+    assert not redis_client.exists(LOCK_PREFIX + 'tide tables')
+
+
+def test_distributed_waiter_loads_the_result_once_the_lock_is_gone():
+    redis_client = fakeredis.FakeRedis()
+    flights = SingleFlight(redis_client, wait_timeout=5)
+
+    assert flights.wait_distributed('tide tables', lambda: b'cached page') == b'cached page'
+    assert flights.stats()['saved_distributed'] == 1
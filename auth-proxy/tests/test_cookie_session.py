@@ -0,0 +1,79 @@
+from flask import Flask, session
+
+from cookie_session import CookieSessionInterface, SessionCodec
+
+SESSION = {'access_token': 'a' * 40, 'user': {'id': 'user-1', 'username': 'alice'}}
+
+
+def test_round_trip_and_tampering():
+    codec = SessionCodec(['secret'])
+    cookie = codec.encode(SESSION)
+
+    assert 'alice' not in cookie
+    assert codec.decode(cookie) == SESSION
+    assert codec.decode(cookie[:-4] + 'AAAA') is None
+    assert SessionCodec(['other-secret']).decode(cookie) is None
+    assert codec.decode('not a cookie') is None
+
+
+def test_rotated_secrets_still_decode_old_cookies():
+    old = SessionCodec(['old']).encode(SESSION)
+
+    assert SessionCodec(['new', 'old']).decode(old) == SESSION
+    assert SessionCodec(['old']).decode(SessionCodec(['new', 'old']).encode(SESSION)) is None
+
+
+def test_decodes_are_memoized_in_a_bounded_lru():
+    codec = SessionCodec(['secret'], cache_size=2)
+    first, second, third = (codec.encode(dict(SESSION, n=n)) for n in range(3))
+
+    codec.decode(first)
+    codec.decode(first)
+    assert (codec.hits, codec.misses) == (1, 1)
+
+    # A cached copy cannot be changed through the dict handed out
+    codec.decode(first)['n'] = 99
+    assert codec.decode(first)['n'] == 0
+
+    codec.decode(second)
+    codec.decode(third)
+    assert codec.stats()['size'] == 2
+    misses = codec.misses
+    codec.decode(first)  # evicted as least recently used
+    assert codec.misses == misses + 1
+
+
+def test_expired_cookie_is_rejected_even_when_cached(monkeypatch):
+    codec = SessionCodec(['secret'], max_age=60)
+    cookie = codec.encode(SESSION)
+    assert codec.decode(cookie) == SESSION
+
+    now = codec.fernet.extract_timestamp(cookie.encode('ascii')) + 61
+    monkeypatch.setattr('cookie_session.time.time', lambda: now)
+    monkeypatch.setattr('cryptography.fernet.time.time', lambda: now)
+    assert codec.decode(cookie) is None
+
+
+def test_flask_session_lives_in_the_cookie():
+    app = Flask(__name__)
+    app.session_interface = CookieSessionInterface(SessionCodec(['secret']))
+
+    @app.route('/login')
+    def login():
+        session['user'] = 'alice'
+        return ''
+
+    @app.route('/whoami')
+    def whoami():
+        return session.get('user', '')
+
+    @app.route('/logout')
+    def logout():
+        session.clear()
+        return ''
+
+    client = app.test_client()
+    client.get('/login')
+    assert client.get('/whoami').text == 'alice'
+    client.get('/logout')
+    assert client.get('/whoami').text == ''
@@ -0,0 +1,17 @@
+import app as proxy
+import proxy_common
+
+
+def test_stats_need_the_internal_token(monkeypatch):
+    monkeypatch.setattr(proxy_common, 'INTERNAL_API_TOKEN', 'internal-secret')
+    client = proxy.app.test_client()
+
+    assert client.get('/health/stats').status_code == 403
+    assert client.get('/health/stats', headers={'X-Internal-Token': 'wrong'}).status_code == 403
+    assert client.get('/health/stats', headers={'X-Internal-Token': 'internal-secret'}).status_code == 200
+
+
+def test_stats_are_off_without_an_internal_token(monkeypatch):
+    monkeypatch.setattr(proxy_common, 'INTERNAL_API_TOKEN', '')
+
+    assert proxy.app.test_client().get('/health/stats', headers={'X-Internal-Token': ''}).status_code == 403
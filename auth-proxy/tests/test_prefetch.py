@@ -0,0 +1,76 @@
+import threading
+
+import requests
+
+import app as proxy
+from admission import SPECULATIVE
+from prefetch import Prefetcher
+
+
+class Fetches:
+    """Fetch callables that block until released"""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.release.wait(5)
+        return 200, [('Content-Type', 'text/html')], b'<html>page 2</html>'
+
+
+def drain(prefetcher):
+    prefetcher._executor.shutdown(wait=True)
+
+
+def test_caps_per_user_and_per_worker():
+    stored = []
+    fetch = Fetches()
+    prefetcher = Prefetcher(lambda *page: stored.append(page) or True, per_user=1, max_in_flight=3)
+
+    assert prefetcher.schedule('alice-1', 'alice', fetch)
+    assert not prefetcher.schedule('alice-1', 'alice', fetch)  # already running
+    assert not prefetcher.schedule('alice-2', 'alice', fetch)  # user cap
+    assert prefetcher.schedule('bob-1', 'bob', fetch)
+    assert prefetcher.schedule('carol-1', 'carol', fetch)
+    assert not prefetcher.schedule('dave-1', 'dave', fetch)  # worker cap
+
+    fetch.release.set()
+    drain(prefetcher)
+    stats = prefetcher.stats()
+    assert (stats['skipped_user_cap'], stats['skipped_global_cap']) == (1, 1)
+    assert stats['stored'] == 3 and stats['in_flight'] == 0
+    assert len(stored) == 3
+
+
+def test_one_user_can_never_take_every_slot():
+    assert Prefetcher(lambda *page: True, per_user=4, max_in_flight=4).per_user == 3
+
+
+def test_failed_fetch_frees_its_slot():
+    def unreachable():
+        raise requests.exceptions.ConnectionError('searxng down')
+
+    prefetcher = Prefetcher(lambda *page: True, per_user=1, max_in_flight=2)
+    prefetcher.schedule('alice-1', 'alice', unreachable)
+    drain(prefetcher)
+
+    assert prefetcher.stats()['failed'] == 1 and prefetcher.stats()['in_flight'] == 0
+
+
+def test_prefetch_is_marked_speculative_for_admission_and_plugins(monkeypatch):
+    sent = {}
+
+    def get(path, **kwargs):
+        sent.update(kwargs, path=path)
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.headers['Content-Type'] = 'text/html'
+        resp._content = b'<html></html>'
+        return resp
+
+    monkeypatch.setattr(proxy.searxng_client, 'get', get)
+    status, _, body = proxy.fetch_search_page('search', {'q': ['ferns'], 'pageno': ['2']}, {'X-User': 'alice'})
+
+    assert (status, body) == (200, b'<html></html>')
+    assert sent['priority_class'] == SPECULATIVE
+    assert sent['headers'] == {'X-User': 'alice', 'Sec-Purpose': 'prefetch'}
@@ -0,0 +1,61 @@
+import fakeredis
+from werkzeug.datastructures import MultiDict
+
+from result_cache import SearchResultCache, replayable_headers, search_key
+
+
+def key_for(cookies=None, **values):
+    return search_key(MultiDict(values), cookies or {})
+
+
+def test_key_ignores_case_width_and_spacing():
+    assert key_for(q='Sourdough  Starters') == key_for(q='sourdough starters')
+    assert key_for(q='ｓｏｕｒｄｏｕｇｈ') == key_for(q='sourdough')
+
+
+def test_key_separates_everything_that_changes_the_results():
+    base = key_for(q='tide tables')
+    assert key_for(q='tide tables', mood='curious') != base
+    assert key_for(q='tide tables', pageno='2') != base
+    assert key_for(q='tide tables', engines='wikipedia') != base
+    assert key_for(q='tide tables', language='fr') != base
+    assert key_for({'preferences': 'theme=dark'}, q='tide tables') != base
+
+
+def test_key_treats_category_fields_like_the_categories_list():
+    assert key_for(q='ferns', categories='images,general') == key_for(q='ferns', category_general='on',
+                                                                      category_images='on')
+
+
+def test_blank_searches_are_not_cached():
+    assert key_for(q='   ') is None
+    assert key_for() is None
+
+
+def test_only_whitelisted_headers_are_replayed():
+    headers = [
+        ('Content-Type', 'text/html'),
+        ('Set-Cookie', 'searxng=secret'),
+        ('Content-Language', 'en'),
+        ('Cache-Control', 'private'),
+        ('X-Request-Id', 'abc')
+    ]
+    assert replayable_headers(headers) == [('Content-Type', 'text/html'), ('Content-Language', 'en')]
+
+
+def test_stored_page_never_carries_another_users_cookie():
+    cache = SearchResultCache(fakeredis.FakeRedis())
+    key = key_for(q='tide tables')
+    assert cache.store(key, 200, [('Content-Type', 'text/html'), ('Set-Cookie', 'searxng=secret')], b'<html>')
+
+    page = cache.get(key)
+    assert page.headers == [('Content-Type', 'text/html')]
+    assert page.body == b'<html>'
+
+
+def test_only_complete_pages_are_stored():
+    cache = SearchResultCache(fakeredis.FakeRedis(), max_bytes=10)
+    key = key_for(q='tide tables')
+    assert not cache.store(key, 502, [], b'')
+    assert not cache.store(key, 200, [], b'x' * 11)
+    assert cache.get(key) is None
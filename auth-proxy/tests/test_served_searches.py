@@ -0,0 +1,122 @@
+import fakeredis
+import pytest
+import requests
+from werkzeug.datastructures import MultiDict
+
+import app as proxy
+from convivial_shared.search_events import (
+    SEARCH_KEY_HEADER, SERVED_STREAM, ensure_group, read_served_searches, record_search_session
+)
+from result_cache import search_key
+
+ALICE = {'user_id': 'u1', 'claims': {'username': 'alice', 'role': 'user'}}
+BOB = {'user_id': 'u2', 'claims': {'username': 'bob', 'role': 'user'}}
+
+
+class SearchDb:
+    """Just enough of search_sessions, users and collisions for record_search_session"""
+
+    def __init__(self, usernames):
+        self.usernames = usernames
+        self.sessions = []  # (user_id, query)
+        self.collisions = []  # (user1_id, user2_id, query)
+        self._rows = []
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params):
+        statement = ' '.join(sql.split())
+        if statement.startswith('INSERT INTO search_sessions'):
+            self.sessions.append(params[:2])
+            self._rows = [{'id': len(self.sessions)}]
+        elif statement.startswith('SELECT DISTINCT ss.user_id'):
+            user_id, query = params
+            others = sorted({uid for uid, q in self.sessions if q == query and uid != user_id})
+            self._rows = [{'user_id': uid, 'username': self.usernames[uid]} for uid in others]
+        elif statement.startswith('INSERT INTO collisions'):
+            self.collisions.append(params)
+        else:
+            raise AssertionError(f'Unexpected SQL: {statement}')
+
+    def fetchone(self):
+        return self._rows[0]
+
+    def fetchall(self):
+        return self._rows
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = fakeredis.FakeRedis()
+    monkeypatch.setattr(proxy.result_cache, 'redis', cache)
+    monkeypatch.setattr(proxy.served_searches, 'redis', cache)
+    return cache
+
+
+def client_for(monkeypatch, user):
+    monkeypatch.setattr(proxy, 'authenticate_session', lambda: ('tok', user))
+    return proxy.app.test_client()
+
+
+def test_cache_hit_is_announced(monkeypatch, cache):
+    key = search_key(MultiDict({'q': 'hello world', 'mood': 'curious'}), {})
+    assert proxy.result_cache.store(key, 200, [('Content-Type', 'application/json')], b'{}')
+
+    resp = client_for(monkeypatch, ALICE).get('/search?q=hello+world&mood=curious')
+
+    assert resp.headers['X-Proxy-Cache'] == 'HIT'
+    [(_, event)] = cache.xrange(SERVED_STREAM)
+    assert event == {
+        b'user_id': b'u1',
+        b'username': b'alice',
+        b'query': b'hello world',
+        b'mood': b'curious',
+        b'search_key': key.key.encode(),
+        b'served_as': b'HIT'
+    }
+
+
+def test_two_users_on_a_cached_query_still_collide(monkeypatch, cache):
+    ensure_group(cache, 'convivial_presence')
+    key = search_key(MultiDict({'q': 'sourdough starters'}), {})
+    proxy.result_cache.store(key, 200, [('Content-Type', 'application/json')], b'{}')
+
+    assert client_for(monkeypatch, ALICE).get('/search?q=sourdough+starters').headers['X-Proxy-Cache'] == 'HIT'
+    assert client_for(monkeypatch, BOB).get('/search?q=sourdough+starters').headers['X-Proxy-Cache'] == 'HIT'
+
+    # What plugins/convivial_presence.py does with each event
+    db = SearchDb({'u1': 'alice', 'u2': 'bob'})
+
+    def handle(event):
+        with db.cursor() as cursor:
+            record_search_session(cursor, event['user_id'], event['query'], event['mood'])
+
+    assert read_served_searches(cache, 'convivial_presence', 'test', handle, block_ms=None) == 2
+    assert db.collisions == [('u2', 'u1', 'sourdough starters')]
+
+
+def test_upstream_search_carries_the_proxy_search_key(monkeypatch, cache):
+    sent = {}
+
+    def fake_request(method, path, headers=None, **kwargs):
+        sent.update(headers)
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.headers['Content-Type'] = 'application/json'
+        resp._content = b'{}'
+        resp._content_consumed = True
+        return resp
+
+    monkeypatch.setattr(proxy.searxng_client, 'request', fake_request)
+    resp = client_for(monkeypatch, ALICE).get('/search?q=tide+tables',
+                                              headers={SEARCH_KEY_HEADER: 'forged'})
+
+    assert resp.headers['X-Proxy-Cache'] == 'MISS'
+    assert sent[SEARCH_KEY_HEADER] == search_key(MultiDict({'q': 'tide tables'}), {}).key
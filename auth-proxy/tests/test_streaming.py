@@ -0,0 +1,34 @@
+from streaming import ScriptInjector, inject_stream
+
+PAYLOAD = b'<script src="/c.js"></script>'
+
+
+def splice(chunks):
+    return b''.join(inject_stream(chunks, PAYLOAD))
+
+
+def test_marker_split_across_every_chunk_boundary():
+    page = b'<html><body><p>results</p></body></html>'
+    expected = page.replace(b'</body>', PAYLOAD + b'</body>')
+    for size in range(1, len(page) + 1):
+        chunks = [page[i:i + size] for i in range(0, len(page), size)]
+        assert splice(chunks) == expected
+
+
+def test_only_the_first_marker_gets_the_payload():
+    assert splice([b'<body></body>', b'<!-- </body> -->']) == b'<body>' + PAYLOAD + b'</body><!-- </body> -->'
+
+
+def test_page_without_marker_passes_through_unchanged():
+    assert splice([b'{"results": ', b'[]}']) == b'{"results": []}'
+
+
+def test_holds_back_no_more_than_the_marker_needs():
+    injector = ScriptInjector(PAYLOAD)
+    assert injector.feed(b'x' * 100) == b'x' * (100 - len(b'</body>') + 1)
+    assert injector.flush() == b'x' * (len(b'</body>') - 1)
+
+    # After injecting, chunks are relayed as they come
+    injector = ScriptInjector(PAYLOAD)
+    injector.feed(b'</body>')
+    assert injector.feed(b'</html>') == b'</html>'
@@ -0,0 +1,45 @@
+import time
+
+from token_cache import TokenCache
+
+
+def test_revocation_drops_every_token_with_the_jti():
+    cache = TokenCache()
+    exp = time.time() + 600
+    cache.put('hash-a', 'jti-1', {'user_id': 'u1'}, exp)
+    cache.put('hash-b', 'jti-1', {'user_id': 'u1'}, exp)
+    cache.put('hash-c', 'jti-2', {'user_id': 'u2'}, exp)
+
+    cache.revoke('jti-1')
+
+    assert cache.get('hash-a') is None
+    assert cache.get('hash-b') is None
+    assert cache.get('hash-c') == {'user_id': 'u2'}
+
+
+def test_revoked_token_checked_concurrently_is_not_cached():
+    cache = TokenCache()
+    # The revocation lands while the token is being verified
+    cache.revoke('jti-1')
+    cache.put('hash-a', 'jti-1', {'user_id': 'u1'}, time.time() + 600)
+
+    assert cache.get('hash-a') is None
+
+
+def test_entries_never_outlive_the_token():
+    cache = TokenCache(ttl=60)
+    cache.put('hash-a', 'jti-1', {'user_id': 'u1'}, time.time() - 1)
+
+    assert cache.get('hash-a') is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TokenCache(maxsize=2)
+    exp = time.time() + 600
+    cache.put('hash-a', 'jti-1', {'user_id': 'u1'}, exp)
+    cache.put('hash-b', 'jti-2', {'user_id': 'u2'}, exp)
+    cache.get('hash-a')
+    cache.put('hash-c', 'jti-3', {'user_id': 'u3'}, exp)
+
+    assert cache.get('hash-b') is None
+    assert cache.get('hash-a') == {'user_id': 'u1'}
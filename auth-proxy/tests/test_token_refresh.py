@@ -0,0 +1,39 @@
+import fakeredis
+import requests
+
+from token_cache import token_hash
+from token_refresh import RESULT_PREFIX, TokenRefresher
+
+
+class AuthService:
+    def __init__(self):
+        self.calls = 0
+
+    def post(self, path, headers=None, **kwargs):
+        self.calls += 1
+        resp = requests.Response()
+        resp.status_code = 200
+        resp._content = b'{"access_token": "new-access-token"}'
+        return resp
+
+
+def test_shared_result_is_unreadable_without_the_refresh_token():
+    cache = fakeredis.FakeRedis()
+    auth = AuthService()
+    assert TokenRefresher(auth, cache).refresh('refresh-token') == 'new-access-token'
+
+    stored = cache.get(RESULT_PREFIX + token_hash('refresh-token'))
+    assert stored is not None and b'new-access-token' not in stored
+
+    # Another worker of the same session reuses it without calling auth-service
+    assert TokenRefresher(auth, cache).refresh('refresh-token') == 'new-access-token'
+    assert auth.calls == 1
+
+
+def test_shared_result_needs_the_matching_refresh_token():
+    cache = fakeredis.FakeRedis()
+    refresher = TokenRefresher(AuthService(), cache)
+    refresher.refresh('refresh-token')
+    cache.set(RESULT_PREFIX + token_hash('other-token'), cache.get(RESULT_PREFIX + token_hash('refresh-token')))
+
+    assert TokenRefresher(None, cache)._load(token_hash('other-token'), 'other-token') is None
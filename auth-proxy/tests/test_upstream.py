@@ -0,0 +1,80 @@
+import io
+
+import pytest
+import requests
+
+from circuit_breaker import CLOSED, OPEN, CircuitBreaker, UpstreamUnavailable
+from convivial_shared.http_retry import JitteredRetry
+from upstream import UpstreamClient
+
+
+def make_response(status, headers=None):
+    resp = requests.Response()
+    resp.status_code = status
+    resp.headers.update(headers or {})
+    resp._content = b''
+    resp.raw = io.BytesIO()
+    return resp
+
+
+def make_client(monkeypatch, resp):
+    breaker = CircuitBreaker('auth-service', failure_threshold=3, recovery_timeout=30)
+    client = UpstreamClient('auth-service', 'http://auth-service:5000', breaker=breaker)
+    monkeypatch.setattr(client.session, 'request', lambda *args, **kwargs: resp)
+    return client
+
+
+def test_auth_service_back_pressure_does_not_open_breaker(monkeypatch):
+    # HashingPoolSaturated: bcrypt pool busy during a login burst
+    client = make_client(monkeypatch, make_response(503, {'Retry-After': '1'}))
+    for _ in range(10):
+        assert client.post('/auth/login', json={}).status_code == 503
+    assert client.breaker.state == CLOSED
+
+
+def test_unavailable_upstream_opens_breaker(monkeypatch):
+    client = make_client(monkeypatch, make_response(503))
+    for _ in range(3):
+        client.post('/auth/login', json={})
+    assert client.breaker.state == OPEN
+
+
+def test_slots_come_back_after_any_exception(monkeypatch):
+    breaker = CircuitBreaker('searxng', max_concurrency=1, acquire_timeout=0)
+    client = UpstreamClient('searxng', 'http://searxng:8080', breaker=breaker)
+
+    def interrupted(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(client.session, 'request', interrupted)
+    for _ in range(3):
+        try:
+            client.get('/search')
+        except KeyboardInterrupt:
+            pass
+    assert breaker.state == CLOSED
+
+    monkeypatch.setattr(client.session, 'request', lambda *args, **kwargs: make_response(200))
+    assert client.get('/search').status_code == 200
+
+
+def test_streamed_response_holds_its_slot_until_closed(monkeypatch):
+    breaker = CircuitBreaker('searxng', max_concurrency=1, acquire_timeout=0)
+    client = UpstreamClient('searxng', 'http://searxng:8080', breaker=breaker)
+    monkeypatch.setattr(client.session, 'request', lambda *args, **kwargs: make_response(200))
+
+    resp = client.get('/search', stream=True)
+    with pytest.raises(UpstreamUnavailable):
+        client.get('/search')
+    resp.close()
+    assert client.get('/search').status_code == 200
+
+
+
+def test_connect_retries_back_off_with_jitter():
+    retry = JitteredRetry(total=5, backoff_factor=1)
+    for _ in range(3):
+        retry = retry.increment(method='GET', url='/search', error=requests.exceptions.ConnectionError())
+    # Full jitter: anywhere between no wait and the exponential backoff (4s here)
+    delays = {retry.get_backoff_time() for _ in range(50)}
+    assert all(0 <= delay <= 4 for delay in delays) and len(delays) > 1
@@ -0,0 +1,258 @@
+"""
+Local JWT verification for the auth proxy
+Verifies access tokens in-process with the shared JWT secret and caches the
+verified claims, dropping them as soon as auth-service blocklists the token
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import jwt
+import redis
+
+logger = logging.getLogger(__name__)
+
+# Key prefix used by auth-service for revoked token ids
+BLOCKLIST_PREFIX = 'blocklist:'
+
+
+def token_hash(token: str) -> str:
+    """Stable cache key for a raw token (never keep the token itself as a key)"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class TokenCache:
+    """Bounded LRU of verified claims with a per-entry TTL"""
+
+    def __init__(self, maxsize: int = 1024, ttl: int = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # hash -> (expires_at, jti, result)
+        self._revoked = {}  # jti -> forget_at
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, jti, result = entry
+            if expires_at <= now or jti in self._revoked:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key: str, jti: str, result: Dict, token_exp: float):
+        expires_at = min(time.time() + self.ttl, token_exp)
+        with self._lock:
+            # A revocation may have landed while this token was being checked
+            if jti in self._revoked:
+                return
+            self._entries[key] = (expires_at, jti, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def revoke(self, jti: str):
+        """Forget every cached token carrying this jti"""
+        now = time.time()
+        with self._lock:
+            self._revoked[jti] = now + self.ttl * 2
+            for key in [k for k, (_, entry_jti, _) in self._entries.items() if entry_jti == jti]:
+                del self._entries[key]
+            for stale in [j for j, forget_at in self._revoked.items() if forget_at <= now]:
+                del self._revoked[stale]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'recent_revocations': len(self._revoked)
+            }
+
+
+class RevocationListener:
+    """Follows the Redis blocklist keyspace and feeds revocations into a cache
+
+    Requires ``notify-keyspace-events`` to include ``K`` and ``$`` (or ``A``).
+    While the listener is not subscribed the cache is bypassed, so a missed
+    notification can never keep a revoked token alive.
+    """
+
+    def __init__(self, redis_client: redis.Redis, cache: TokenCache, db: int = 0):
+        self.redis = redis_client
+        self.cache = cache
+        self.db = db
+        self.healthy = False
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        """Start the listener thread once per process (gunicorn forks workers)"""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self.healthy = False
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='revocation-listener', daemon=True)
+            self._thread.start()
+
+    def _notifications_enabled(self) -> bool:
+        flags = self.redis.config_get('notify-keyspace-events').get('notify-keyspace-events', '')
+        return 'K' in flags and ('$' in flags or 'A' in flags)
+
+    def _run(self):
+        backoff = 1
+        pattern = f'__keyspace@{self.db}__:{BLOCKLIST_PREFIX}*'
+        prefix_len = len(pattern) - 1
+        while True:
+            pubsub = None
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(pattern)
+                if not self._notifications_enabled():
+                    logger.warning("Keyspace notifications disabled on Redis; token cache bypassed")
+                    pubsub.close()
+                    time.sleep(60)
+                    continue
+                self.healthy = True
+                backoff = 1
+                for message in pubsub.listen():
+                    if message['type'] != 'pmessage':
+                        continue
+                    if message['data'] in ('set', 'setex'):
+                        self.cache.revoke(message['channel'][prefix_len:])
+            except redis.RedisError as e:
+                logger.warning(f"Revocation listener disconnected: {e}")
+            except Exception as e:
+                logger.error(f"Revocation listener error: {e}")
+            finally:
+                self.healthy = False
+                self.cache.clear()
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+
+class TokenVerifier:
+    """Verifies access tokens locally, mirroring auth-service's /auth/verify
+
+    Tokens carrying a ``kid`` are checked against auth-service's JWKS through
+    ``jwks_client`` (which refetches the set when it sees an unknown key id);
+    tokens without one use the shared HS256 ``secret``, if it is still accepted.
+    """
+
+    def __init__(self, secret: Optional[str], redis_client: redis.Redis, algorithms=('HS256',),
+                 cache_size: int = 1024, cache_ttl: int = 60,
+                 jwks_client: Optional[jwt.PyJWKClient] = None):
+        self.secret = secret
+        self.algorithms = list(algorithms)
+        self.jwks_client = jwks_client
+        self.redis = redis_client
+        self.cache = TokenCache(maxsize=cache_size, ttl=cache_ttl)
+        self.listener = RevocationListener(redis_client, self.cache)
+
+    def _is_blocklisted(self, jti: str) -> bool:
+        return self.redis.get(f"{BLOCKLIST_PREFIX}{jti}") is not None
+
+    def _signing_key(self, token: str):
+        """(key, algorithms) to check ``token`` with, or None if it cannot be checked"""
+        header = jwt.get_unverified_header(token)
+        if header.get('kid') and self.jwks_client is not None:
+            try:
+                signing_key = self.jwks_client.get_signing_key(header['kid'])
+            except jwt.PyJWKClientError as e:
+                logger.warning(f"No JWKS key for token: {e}")
+                return None
+            # auth-service only publishes Ed25519 (EdDSA) and RSA (RS256) keys
+            return signing_key.key, ['EdDSA' if signing_key.key_type == 'OKP' else 'RS256']
+        if header.get('alg') == 'HS256' and self.secret:
+            return self.secret, ['HS256']
+        return None
+
+    def _claims(self, token: str, verify_exp: bool = True) -> Optional[Dict]:
+        """Claims of a correctly signed, unrevoked access token, or None"""
+        try:
+            resolved = self._signing_key(token)
+            if resolved is None:
+                return None
+            key, algorithms = resolved
+            claims = jwt.decode(
+                token,
+                key,
+                algorithms=[name for name in algorithms if name in self.algorithms],
+                options={'require': ['exp', 'sub', 'jti'], 'verify_exp': verify_exp}
+            )
+        except jwt.InvalidTokenError:
+            return None
+
+        if claims.get('type') != 'access':
+            return None
+
+        try:
+            if self._is_blocklisted(claims['jti']):
+                return None
+        except redis.RedisError as e:
+            logger.warning(f"Blocklist lookup failed: {e}")
+            return None
+        return claims
+
+    def verify(self, token: str) -> Optional[Dict]:
+        """Return the same payload as /auth/verify, or None if the token is not usable"""
+        self.listener.ensure_started()
+        key = token_hash(token)
+
+        if self.listener.healthy:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        claims = self._claims(token)
+        if claims is None:
+            return None
+
+        result = {'valid': True, 'user_id': claims['sub'], 'claims': claims}
+        if self.listener.healthy:
+            self.cache.put(key, claims['jti'], result, claims['exp'])
+        return result
+
+    def verify_expired(self, token: str) -> Optional[Dict]:
+        """Claims of a token whose only fault is having expired, else None
+
+        Used to decide whether a session may still be renewed: a revoked,
+        forged or otherwise invalid token never qualifies.
+        """
+        claims = self._claims(token, verify_exp=False)
+        if claims is None or claims['exp'] > time.time():
+            return None
+        return claims
+
+    def stats(self) -> Dict:
+        return dict(self.cache.stats(), listener_healthy=self.listener.healthy)
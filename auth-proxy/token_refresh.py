@@ -0,0 +1,195 @@
+"""
+Transparent access-token refresh for the auth proxy
+Exchanges the session's refresh token at auth-service shortly before the
+access token expires, once per session even when a page load fans out into
+many concurrent requests, so users are only sent to /login (and bcrypt) when
+their refresh token is no longer accepted
+"""
+
+import base64
+import hashlib
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+import jwt
+import redis
+import requests
+from cryptography.fernet import Fernet, InvalidToken
+
+from coalescing import SingleFlight
+from token_cache import token_hash
+
+logger = logging.getLogger(__name__)
+
+RESULT_PREFIX = 'token_refresh:'
+
+# Shared in place of an access token when auth-service refused the refresh token
+REJECTED = 'rejected'
+
+# Answers meaning the refresh token will never be accepted again (revoked,
+# expired, malformed, or its user is gone); anything else may be retried
+REJECTED_STATUSES = (401, 403, 404, 422)
+
+
+class RefreshRejected(Exception):
+    """auth-service refused the refresh token: the session is over"""
+
+
+def token_expiry(token: str) -> float:
+    """``exp`` of a JWT without checking it (0 if unreadable); verification happens elsewhere"""
+    try:
+        claims = jwt.decode(token, options={'verify_signature': False, 'verify_exp': False})
+        return float(claims.get('exp', 0))
+    except (jwt.InvalidTokenError, TypeError, ValueError):
+        return 0
+
+
+def result_cipher(refresh_token: str) -> Fernet:
+    """Cipher for the shared result of ``refresh_token``
+
+    Keyed by the refresh token itself, so only requests of the same session
+    can read the access token stored under ``token_refresh:``.
+    """
+    digest = hashlib.sha256(f'token-refresh:{refresh_token}'.encode('utf-8')).digest()
+    return Fernet(base64.urlsafe_b64encode(digest))
+
+
+class TokenRefresher:
+    """Deduplicated ``POST /auth/refresh`` calls, keyed by refresh token
+
+    Concurrent requests of one session share a single call through a
+    SingleFlight; the new access token is also kept for ``result_ttl`` seconds
+    (in Redis when available, encrypted with ``result_cipher``) for requests
+    that still carry the old session.
+    """
+
+    def __init__(self, auth_client, redis_client: Optional[redis.Redis] = None,
+                 margin: float = 120, result_ttl: int = 30, wait_timeout: float = 5):
+        self.auth_client = auth_client
+        self.redis = redis_client
+        self.margin = margin
+        self.result_ttl = result_ttl
+        self.flights = SingleFlight(redis_client, wait_timeout=wait_timeout, lock_ttl=wait_timeout + 5)
+        self._recent: Dict[str, tuple] = {}  # key -> (access_token, keep_until)
+        self._lock = threading.Lock()
+        self._counters = {'refreshed': 0, 'shared': 0, 'failed': 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def due(self, access_token: str) -> bool:
+        """True once the access token is within ``margin`` seconds of expiry"""
+        return token_expiry(access_token) - time.time() <= self.margin
+
+    def _load(self, key: str, refresh_token: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            recent = self._recent.get(key)
+            if recent is not None:
+                if recent[1] > now:
+                    return recent[0]
+                del self._recent[key]
+        if self.redis is None:
+            return None
+        try:
+            value = self.redis.get(RESULT_PREFIX + key)
+        except redis.RedisError:
+            return None
+        if value is None:
+            return None
+        try:
+            return result_cipher(refresh_token).decrypt(value, ttl=self.result_ttl).decode('utf-8')
+        except InvalidToken:
+            return None
+
+    def _remember(self, key: str, refresh_token: str, access_token: str):
+        now = time.time()
+        with self._lock:
+            for stale in [k for k, (_, until) in self._recent.items() if until <= now]:
+                del self._recent[stale]
+            self._recent[key] = (access_token, now + self.result_ttl)
+        if self.redis is not None:
+            try:
+                value = result_cipher(refresh_token).encrypt(access_token.encode('utf-8'))
+                self.redis.set(RESULT_PREFIX + key, value, ex=self.result_ttl)
+            except redis.RedisError as e:
+                logger.warning(f"Could not share refreshed token: {e}")
+
+    def forget(self, refresh_token: str):
+        """Drop any shared result for this refresh token (at logout)"""
+        key = token_hash(refresh_token)
+        with self._lock:
+            self._recent.pop(key, None)
+        if self.redis is not None:
+            try:
+                self.redis.delete(RESULT_PREFIX + key)
+            except redis.RedisError as e:
+                logger.warning(f"Could not drop refreshed token: {e}")
+
+    def _call(self, refresh_token: str) -> Optional[str]:
+        try:
+            response = self.auth_client.post(
+                '/auth/refresh',
+                headers={'Authorization': f'Bearer {refresh_token}'}
+            )
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Token refresh failed: {e}")
+            return None
+        if response.status_code in REJECTED_STATUSES:
+            return REJECTED
+        if response.status_code != 200:
+            return None
+        return response.json().get('access_token')
+
+    def refresh(self, refresh_token: str) -> Optional[str]:
+        """New access token for this session, or None if auth-service could not be asked
+
+        Raises RefreshRejected when auth-service refused the refresh token.
+        """
+        if not refresh_token:
+            return None
+        access_token = self._refresh(refresh_token)
+        if access_token == REJECTED:
+            raise RefreshRejected()
+        return access_token
+
+    def _refresh(self, refresh_token: str) -> Optional[str]:
+        key = token_hash(refresh_token)
+
+        access_token = self._load(key, refresh_token)
+        if access_token:
+            self._count('shared')
+            return access_token
+
+        flight, leader = self.flights.join(key)
+        if not leader:
+            access_token = self.flights.wait(flight)
+            if access_token:
+                self._count('shared')
+            return access_token
+
+        access_token = None
+        try:
+            if self.flights.claim_distributed(flight):
+                access_token = self._call(refresh_token)
+                if access_token:
+                    # Refusals are shared too, so every request of the session ends it
+                    self._remember(key, refresh_token, access_token)
+                if access_token and access_token != REJECTED:
+                    self._count('refreshed')
+                else:
+                    self._count('failed')
+            else:
+                access_token = self.flights.wait_distributed(key, lambda: self._load(key, refresh_token))
+                if access_token:
+                    self._count('shared')
+        finally:
+            self.flights.complete(flight, access_token)
+        return access_token
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._counters, margin=self.margin)
@@ -0,0 +1,193 @@
+"""
+Pooled HTTP clients for the services behind the auth proxy
+One keep-alive session per upstream with its own pool size, timeouts,
+jittered connect retries and circuit breaker, plus counters for monitoring
+"""
+
+import os
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from typing import Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from admission import AdmissionController
+from circuit_breaker import CircuitBreaker
+from convivial_shared.http_retry import JitteredRetry
+
+# Upstream statuses that count against the circuit breaker
+FAILURE_STATUSES = (502, 503, 504)
+
+
+def is_upstream_failure(resp: requests.Response) -> bool:
+    """Whether a response counts against the circuit breaker
+
+    A 503 carrying Retry-After is deliberate back-pressure (e.g. auth-service
+    answering a login burst while its bcrypt pool is busy), not a failing
+    upstream, so it must not open the breaker for everybody else.
+    """
+    if resp.status_code == 503 and 'Retry-After' in resp.headers:
+        return False
+    return resp.status_code in FAILURE_STATUSES
+
+
+class UpstreamClient:
+    """Keep-alive session bound to a single upstream base URL"""
+
+    def __init__(self, name: str, base_url: str, pool_size: int = 10,
+                 connect_timeout: float = 2.0, read_timeout: float = 10.0,
+                 retries: int = 2, backoff: float = 0.1, breaker: CircuitBreaker = None,
+                 admission: AdmissionController = None):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = breaker or CircuitBreaker(name, max_concurrency=pool_size)
+        self.admission = admission
+
+        # Connect failures are retried for every method since nothing was sent;
+        # read failures are never retried so slow searches do not run twice.
+        retry = JitteredRetry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=0,
+            backoff_factor=backoff,
+            raise_on_status=False
+        )
+        self.adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=retry
+        )
+        self.session = requests.Session()
+        # The session is shared by every user, so never replay upstream cookies
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._requests = 0
+        self._errors = 0
+
+    @classmethod
+    def from_env(cls, name: str, prefix: str, base_url: str, pool_size: int = 10,
+                 read_timeout: float = 10.0):
+        """Build a client from ``<PREFIX>_POOL_SIZE``, ``_CONNECT_TIMEOUT``, ``_TIMEOUT``,
+        ``_RETRIES``, ``_MAX_CONCURRENCY`` and ``_BREAKER_THRESHOLD`` / ``_BREAKER_RECOVERY``"""
+        pool_size = int(os.environ.get(f'{prefix}_POOL_SIZE', pool_size))
+        breaker = CircuitBreaker(
+            name,
+            failure_threshold=int(os.environ.get(f'{prefix}_BREAKER_THRESHOLD', '5')),
+            recovery_timeout=float(os.environ.get(f'{prefix}_BREAKER_RECOVERY', '30')),
+            max_concurrency=int(os.environ.get(f'{prefix}_MAX_CONCURRENCY', pool_size)),
+            acquire_timeout=float(os.environ.get(f'{prefix}_ACQUIRE_TIMEOUT', '1'))
+        )
+        return cls(
+            name,
+            base_url,
+            pool_size=pool_size,
+            connect_timeout=float(os.environ.get(f'{prefix}_CONNECT_TIMEOUT', '2')),
+            read_timeout=float(os.environ.get(f'{prefix}_TIMEOUT', read_timeout)),
+            retries=int(os.environ.get(f'{prefix}_RETRIES', '2')),
+            breaker=breaker
+        )
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """Send a request to ``base_url + path`` using the pooled session
+
+        Raises ``UpstreamUnavailable`` without touching the network while the
+        breaker is open or the upstream is saturated. With an admission
+        controller, ``priority_class`` picks the queue the request waits in. A
+        streamed response holds its slots until ``resp.close()``.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        priority_class = kwargs.pop('priority_class', None)
+        ticket = self.admission.admit(priority_class) if self.admission is not None else None
+        try:
+            permit = self.breaker.acquire()
+        except BaseException:
+            if ticket is not None:
+                ticket.release()
+            raise
+        with self._lock:
+            self._in_flight += 1
+            self._requests += 1
+        try:
+            resp = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+        except BaseException as e:
+            # Slots must come back whatever went wrong; only network errors count against the upstream
+            if isinstance(e, requests.exceptions.RequestException):
+                with self._lock:
+                    self._errors += 1
+                permit.failure()
+            permit.release()
+            if ticket is not None:
+                ticket.release()
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+        if is_upstream_failure(resp):
+            permit.failure()
+        else:
+            permit.success()
+
+        def release():
+            permit.release()
+            if ticket is not None:
+                ticket.release()
+
+        if not kwargs.get('stream'):
+            release()
+            return resp
+
+        close = resp.close
+
+        def close_and_release():
+            try:
+                close()
+            finally:
+                release()
+
+        resp.close = close_and_release
+        return resp
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request('POST', path, **kwargs)
+
+    def stats(self) -> Dict:
+        """Pool utilisation; ``in_use`` includes connections held by streamed bodies"""
+        pools = []
+        for key in list(self.adapter.poolmanager.pools.keys()):
+            pool = self.adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            queue = pool.pool
+            idle = sum(1 for conn in list(queue.queue) if conn is not None) if queue else 0
+            pools.append({
+                'host': f"{pool.host}:{pool.port}",
+                'maxsize': queue.maxsize if queue else 0,
+                'in_use': queue.maxsize - queue.qsize() if queue else 0,
+                'idle': idle,
+                'connections_opened': pool.num_connections,
+                'requests': pool.num_requests
+            })
+        with self._lock:
+            return {
+                'base_url': self.base_url,
+                'pool_size': self.pool_size,
+                'timeout': list(self.timeout),
+                'in_flight': self._in_flight,
+                'requests': self._requests,
+                'errors': self._errors,
+                'pools': pools,
+                'breaker': self.breaker.stats(),
+                'admission': self.admission.stats() if self.admission is not None else None
+            }
@@ -3,24 +3,35 @@ Authentication Service for SearXNG Convivial Instance
 Provides JWT-based authentication with role-based access control
 """
 
+import hmac
 import os
 from datetime import datetime, timedelta, timezone
 from functools import wraps
 
-from flask import Flask, jsonify, request
+import click
+import jwt as pyjwt
+from flask import Flask, g, jsonify, request
+from flask.cli import AppGroup
 from flask_jwt_extended import (
-    JWTManager, create_access_token, create_refresh_token,
+    JWTManager, create_access_token, create_refresh_token, decode_token,
     get_jwt_identity, jwt_required, get_jwt
 )
+from flask_jwt_extended.exceptions import JWTExtendedException
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
-from flask_bcrypt import Bcrypt
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from marshmallow import Schema, fields, validate, ValidationError
+from sqlalchemy import event, inspect as sa_inspect
 import redis
 
+from directory import DIRECTORY_FIELDS, UserDirectory
+from hashing import MIN_ROUNDS, HashingPoolSaturated, PasswordHasher, shared_rounds
+from keys import ASYMMETRIC_ALGORITHMS, KeyStore, key_algorithm
+from rate_limit import HybridRedisStorage
+from revocation import RevocationFilter
+
 # Initialize Flask app
 app = Flask(__name__)
 
@@ -34,30 +45,71 @@ app.config['JWT_COOKIE_SECURE'] = os.environ.get('ENV') == 'production'
 app.config['JWT_COOKIE_CSRF_PROTECT'] = True
 app.config['JWT_COOKIE_SAMESITE'] = 'Lax'
 
+# Token signing: HS256 with the shared JWT_SECRET, or EdDSA/RS256 with rotating
+# keys from JWT_KEYS_DIR published at /.well-known/jwks.json
+JWT_ALGORITHM = os.environ.get('JWT_ALGORITHM', 'HS256')
+# Keep accepting HS256 tokens issued before a switch to asymmetric keys
+JWT_ACCEPT_HS256 = os.environ.get('JWT_ACCEPT_HS256', 'true').lower() == 'true'
+JWKS_MAX_AGE = int(os.environ.get('JWKS_MAX_AGE', '300'))
+key_store = None
+if JWT_ALGORITHM in ASYMMETRIC_ALGORITHMS:
+    key_store = KeyStore(os.environ.get('JWT_KEYS_DIR', '/app/keys'), JWT_ALGORITHM)
+    key_store.ensure_key()
+    app.config['JWT_ALGORITHM'] = JWT_ALGORITHM
+    app.config['JWT_DECODE_ALGORITHMS'] = list(ASYMMETRIC_ALGORITHMS) + (['HS256'] if JWT_ACCEPT_HS256 else [])
+
 # Database configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = f"postgresql://{os.environ.get('POSTGRES_USER', 'searxng')}:{os.environ.get('POSTGRES_PASSWORD')}@{os.environ.get('POSTGRES_HOST', 'postgres')}/{os.environ.get('POSTGRES_DB', 'searxng_convivial')}"
+# DATABASE_URL / REDIS_URL / RATELIMIT_STORAGE_URI override the compose defaults
+# (used by benchmarks/ to run against local or in-process stand-ins)
+REDIS_URL = os.environ.get('REDIS_URL', f"redis://{os.environ.get('REDIS_HOST', 'redis-cache')}:6379/0")
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL') or f"postgresql://{os.environ.get('POSTGRES_USER', 'searxng')}:{os.environ.get('POSTGRES_PASSWORD')}@{os.environ.get('POSTGRES_HOST', 'postgres')}/{os.environ.get('POSTGRES_DB', 'searxng_convivial')}"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Initialize extensions
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
-bcrypt = Bcrypt(app)
+
 jwt = JWTManager(app)
 cors = CORS(app, origins=os.environ.get('ALLOWED_ORIGINS', 'http://localhost:8890').split(','))
 
-# Rate limiting
+# Rate limiting: hybrid+redis:// counts hits per worker and syncs them to
+# Redis every RATELIMIT_SYNC_INTERVAL seconds (see rate_limit.py); limits of
+# RATELIMIT_SYNC_BELOW hits or fewer are always counted in Redis
+app.config['RATELIMIT_ENABLED'] = os.environ.get('RATELIMIT_ENABLED', 'true').lower() == 'true'
+RATELIMIT_STORAGE_URI = os.environ.get('RATELIMIT_STORAGE_URI', f"hybrid+{REDIS_URL}")
 limiter = Limiter(
     app=app,
     key_func=get_remote_address,
     default_limits=["200 per day", "50 per hour"],
-    storage_uri=f"redis://{os.environ.get('REDIS_HOST', 'redis-cache')}:6379"
+    storage_uri=RATELIMIT_STORAGE_URI,
+    storage_options={
+        'sync_interval': float(os.environ.get('RATELIMIT_SYNC_INTERVAL', '1')),
+        'sync_below': int(os.environ.get('RATELIMIT_SYNC_BELOW', '20')),
+        'max_drift': float(os.environ.get('RATELIMIT_MAX_DRIFT', '0.1'))
+    } if RATELIMIT_STORAGE_URI.startswith('hybrid+') else {}
 )
 
 # Redis for token blacklist
-redis_client = redis.Redis(
-    host=os.environ.get('REDIS_HOST', 'redis-cache'),
-    port=6379,
-    decode_responses=True
+redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+
+# bcrypt runs in a process pool (see hashing.py); BCRYPT_ROUNDS pins the cost,
+# otherwise it is calibrated once (shared through Redis) so one hash takes
+# about BCRYPT_TARGET_MS. Either way it is never below MIN_ROUNDS (12).
+BCRYPT_ROUNDS = os.environ.get('BCRYPT_ROUNDS')
+password_hasher = PasswordHasher(
+    max(int(BCRYPT_ROUNDS), MIN_ROUNDS) if BCRYPT_ROUNDS
+    else shared_rounds(redis_client, float(os.environ.get('BCRYPT_TARGET_MS', '250'))),
+    max_workers=int(os.environ.get('HASHING_WORKERS', '2')),
+    max_queue=int(os.environ.get('HASHING_MAX_QUEUE', '8')),
+    timeout=float(os.environ.get('HASHING_TIMEOUT', '10'))
+)
+
+# Local mirror of the blocklist (see revocation.py); REVOCATION_FILTER=false
+# goes back to one Redis GET per authenticated request
+REVOCATION_FILTER_ENABLED = os.environ.get('REVOCATION_FILTER', 'true').lower() == 'true'
+revocation_filter = RevocationFilter(
+    redis_client,
+    resync_interval=float(os.environ.get('REVOCATION_RESYNC_INTERVAL', '60'))
 )
 
 # Models
@@ -75,10 +127,10 @@ class User(db.Model):
     last_login = db.Column(db.DateTime)
     
     def set_password(self, password):
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.password_hash, password)
+        return password_hasher.check(self.password_hash, password)
     
     def to_dict(self):
         return {
@@ -90,6 +142,36 @@ class User(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+# Every worker serves users from memory (see directory.py); committed changes
+# to directory fields are announced to all workers through Redis
+user_directory = UserDirectory(
+    redis_client,
+    loader=lambda: [(user.id, user.to_dict(), user.is_active) for user in User.query.all()],
+    max_age=float(os.environ.get('USER_DIRECTORY_MAX_AGE', '300'))
+)
+
+@event.listens_for(db.session, 'after_flush')
+def track_directory_changes(session, flush_context):
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, User):
+            session.info['user_directory_dirty'] = True
+            return
+    for obj in session.dirty:
+        if isinstance(obj, User):
+            state = sa_inspect(obj)
+            if any(state.attrs[name].history.has_changes() for name in DIRECTORY_FIELDS):
+                session.info['user_directory_dirty'] = True
+                return
+
+@event.listens_for(db.session, 'after_commit')
+def publish_directory_changes(session):
+    if session.info.pop('user_directory_dirty', False):
+        user_directory.invalidate()
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_directory_changes(session):
+    session.info.pop('user_directory_dirty', None)
+
 # Schemas for validation
 class RegisterSchema(Schema):
     username = fields.Str(required=True, validate=[
@@ -105,9 +187,39 @@ class LoginSchema(Schema):
     password = fields.Str(required=True)
 
 # JWT callbacks
+if key_store is not None:
+    def current_signing_key():
+        # Pinned per request so the kid header and the signature always match
+        if 'signing_key' not in g:
+            g.signing_key = key_store.signing_key()
+        return g.signing_key
+
+    @jwt.encode_key_loader
+    def signing_key(identity):
+        return current_signing_key()[1]
+
+    @jwt.additional_headers_loader
+    def signing_key_id(identity):
+        return {'kid': current_signing_key()[0]}
+
+    @jwt.decode_key_loader
+    def verification_key(jwt_header, jwt_payload):
+        if jwt_header.get('alg') == 'HS256':
+            if not JWT_ACCEPT_HS256:
+                raise pyjwt.InvalidSignatureError('HS256 tokens are no longer accepted')
+            return app.config['JWT_SECRET_KEY']
+        public_key = key_store.public_key(jwt_header.get('kid', ''))
+        if public_key is None:
+            raise pyjwt.InvalidSignatureError('Unknown signing key')
+        if jwt_header.get('alg') != key_algorithm(public_key):
+            raise pyjwt.InvalidSignatureError('Token algorithm does not match its signing key')
+        return public_key
+
 @jwt.token_in_blocklist_loader
 def check_if_token_revoked(jwt_header, jwt_payload):
     jti = jwt_payload['jti']
+    if REVOCATION_FILTER_ENABLED:
+        return revocation_filter.is_revoked(jti)
     token_in_redis = redis_client.get(f"blocklist:{jti}")
     return token_in_redis is not None
 
@@ -128,12 +240,20 @@ def require_friend_limit(f):
     """Decorator to enforce friend limit (max 3 users)"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        user_count = User.query.filter_by(is_active=True).count()
-        if user_count >= 3:
+        if user_directory.active_count() >= 3:
             return jsonify({'message': 'Friend limit reached (max 3)'}), 403
         return f(*args, **kwargs)
     return decorated_function
 
+# Batch verification and /health/stats are for other services only: callers
+# must send this shared secret as X-Internal-Token (both are off while it is unset)
+INTERNAL_API_TOKEN = os.environ.get('INTERNAL_API_TOKEN', '')
+
+def is_internal_caller():
+    """True if the request carries INTERNAL_API_TOKEN"""
+    return bool(INTERNAL_API_TOKEN) and hmac.compare_digest(
+        request.headers.get('X-Internal-Token', '').encode('utf-8'), INTERNAL_API_TOKEN.encode('utf-8'))
+
 # Routes
 @app.route('/health', methods=['GET'])
 def health():
@@ -144,6 +264,20 @@ def health():
         'timestamp': datetime.utcnow().isoformat()
     })
 
+@app.route('/health/stats', methods=['GET'])
+@limiter.exempt
+def health_stats():
+    """Internal counters for monitoring"""
+    if not is_internal_caller():
+        return jsonify({'message': 'Stats are for internal monitoring only'}), 403
+    limit_storage = getattr(limiter, '_storage', None)
+    return jsonify({
+        'revocation_filter': revocation_filter.stats() if REVOCATION_FILTER_ENABLED else None,
+        'password_hashing': password_hasher.stats(),
+        'user_directory': user_directory.stats(),
+        'rate_limit': limit_storage.stats() if isinstance(limit_storage, HybridRedisStorage) else None
+    })
+
 @app.route('/auth/register', methods=['POST'])
 @limiter.limit("3 per hour")
 @require_friend_limit
@@ -237,35 +371,49 @@ def login():
 def refresh():
     """Refresh access token"""
     identity = get_jwt_identity()
-    user = User.query.get(identity)
+    entry = user_directory.get(identity)
     
-    if not user or not user.is_active:
+    if not entry or not entry.is_active:
         return jsonify({'message': 'User not found or inactive'}), 404
     
     access_token = create_access_token(
-        identity=user.id,
+        identity=entry.user['id'],
         additional_claims={
-            'username': user.username,
-            'role': user.role
+            'username': entry.user['username'],
+            'role': entry.user['role']
         }
     )
     
     return jsonify({'access_token': access_token})
 
+def revoke_token(jti, exp):
+    """Blocklist a token id until the token would have expired anyway"""
+    remaining_time = int(exp - datetime.now(timezone.utc).timestamp())
+    if remaining_time <= 0:
+        return
+    redis_client.setex(f"blocklist:{jti}", remaining_time, 'true')
+    revocation_filter.add(jti, remaining_time)
+
 @app.route('/auth/logout', methods=['POST'])
 @jwt_required()
 def logout():
-    """Logout and revoke token"""
-    jti = get_jwt()['jti']
-    exp = get_jwt()['exp']
-    
-    # Calculate token remaining time
-    now = datetime.now(timezone.utc)
-    expiry_time = datetime.fromtimestamp(exp, timezone.utc)
-    remaining_time = int((expiry_time - now).total_seconds())
+    """Logout and revoke token
+
+    The session's refresh token may be sent as ``{"refresh_token": ...}``;
+    it is revoked too, so a copy of the session can no longer renew itself.
+    """
+    claims = get_jwt()
+    revoke_token(claims['jti'], claims['exp'])
     
-    # Add token to blocklist
-    redis_client.setex(f"blocklist:{jti}", remaining_time, 'true')
+    refresh_token = (request.get_json(silent=True) or {}).get('refresh_token')
+    if refresh_token:
+        try:
+            refresh_claims = decode_token(refresh_token, allow_expired=True)
+        except (pyjwt.InvalidTokenError, JWTExtendedException):
+            refresh_claims = None
+        if (refresh_claims and refresh_claims.get('type') == 'refresh'
+                and refresh_claims['sub'] == claims['sub']):
+            revoke_token(refresh_claims['jti'], refresh_claims['exp'])
     
     return jsonify({'message': 'Successfully logged out'})
 
@@ -273,13 +421,12 @@ def logout():
 @jwt_required()
 def me():
     """Get current user info"""
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    entry = user_directory.get(get_jwt_identity())
     
-    if not user:
+    if not entry:
         return jsonify({'message': 'User not found'}), 404
     
-    return jsonify({'user': user.to_dict()})
+    return jsonify({'user': entry.user})
 
 @app.route('/auth/verify', methods=['GET'])
 @jwt_required()
@@ -291,27 +438,135 @@ def verify():
         'claims': get_jwt()
     })
 
+VERIFY_BATCH_MAX = int(os.environ.get('VERIFY_BATCH_MAX', '100'))
+VERIFY_BATCH_RATE_LIMIT = os.environ.get('VERIFY_BATCH_RATE_LIMIT', '600 per minute')
+
+def revoked_jtis(jtis):
+    """Subset of ``jtis`` on the blocklist, with at most one Redis round trip"""
+    if REVOCATION_FILTER_ENABLED and revocation_filter.healthy:
+        return {jti for jti in jtis if revocation_filter.is_revoked(jti)}
+    if not jtis:
+        return set()
+    values = redis_client.mget([f"blocklist:{jti}" for jti in jtis])
+    return {jti for jti, value in zip(jtis, values) if value is not None}
+
+@app.route('/auth/verify/batch', methods=['POST'])
+@limiter.limit(VERIFY_BATCH_RATE_LIMIT)
+def verify_batch():
+    """Verify up to VERIFY_BATCH_MAX tokens at once; results keep the request order"""
+    if not is_internal_caller():
+        return jsonify({'message': 'Batch verification is for internal services only'}), 403
+    
+    tokens = (request.get_json(silent=True) or {}).get('tokens')
+    if not isinstance(tokens, list) or not all(isinstance(token, str) for token in tokens):
+        return jsonify({'message': 'Expected {"tokens": [...]}'}), 400
+    if len(tokens) > VERIFY_BATCH_MAX:
+        return jsonify({'message': f'At most {VERIFY_BATCH_MAX} tokens per batch'}), 413
+    
+    results = []
+    for token in tokens:
+        try:
+            claims = decode_token(token)
+        except pyjwt.ExpiredSignatureError:
+            results.append({'valid': False, 'error': 'Token has expired'})
+            continue
+        except (pyjwt.InvalidTokenError, JWTExtendedException):
+            results.append({'valid': False, 'error': 'Invalid token'})
+            continue
+        if claims.get('type') != 'access':
+            results.append({'valid': False, 'error': 'Invalid token'})
+            continue
+        results.append({'valid': True, 'user_id': claims['sub'], 'claims': claims})
+    
+    revoked = revoked_jtis([result['claims']['jti'] for result in results if result['valid']])
+    for index, result in enumerate(results):
+        if result['valid'] and result['claims']['jti'] in revoked:
+            results[index] = {'valid': False, 'error': 'Token has been revoked'}
+    
+    return jsonify({'results': results})
+
+@app.route('/.well-known/jwks.json', methods=['GET'])
+@app.route('/auth/jwks', methods=['GET'])
+@limiter.exempt
+def jwks():
+    """Public signing keys, for verifying tokens without calling this service"""
+    if key_store is None:
+        body, etag = b'{"keys":[]}', '"empty"'
+    else:
+        body, etag = key_store.jwks()
+    headers = {
+        'Content-Type': 'application/json',
+        'Cache-Control': f'public, max-age={JWKS_MAX_AGE}',
+        'ETag': etag
+    }
+    if etag in request.headers.get('If-None-Match', ''):
+        return '', 304, headers
+    return body, 200, headers
+
 @app.route('/auth/users', methods=['GET'])
 @jwt_required()
 def list_users():
     """List all active users (friends)"""
-    users = User.query.filter_by(is_active=True).all()
-    return jsonify({
-        'users': [user.to_dict() for user in users],
+    etag = f'W/"users-{user_directory.version}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        return '', 304, {'ETag': etag}
+    users = user_directory.active_users()
+    response = jsonify({
+        'users': users,
         'count': len(users),
         'limit': 3
     })
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 # Error handlers
 @app.errorhandler(429)
 def ratelimit_handler(e):
     return jsonify({'message': f'Rate limit exceeded: {e.description}'}), 429
 
+@app.errorhandler(HashingPoolSaturated)
+def hashing_saturated_handler(e):
+    return jsonify({'message': 'Too many sign-ins right now, please retry'}), 503, {'Retry-After': str(e.retry_after)}
+
 @app.errorhandler(500)
 def internal_error(error):
     db.session.rollback()
     return jsonify({'message': 'Internal server error'}), 500
 
+# Key management CLI: flask --app app keys rotate|prune|list
+keys_cli = AppGroup('keys', help='Manage token signing keys')
+
+@keys_cli.command('rotate')
+def rotate_keys():
+    """Create a new signing key; older keys keep verifying until pruned"""
+    if key_store is None:
+        raise click.ClickException('JWT_ALGORITHM is HS256; there are no keys to rotate')
+    click.echo(key_store.rotate())
+
+@keys_cli.command('prune')
+@click.option('--max-age-days', type=int, default=None,
+              help='Defaults to the refresh token lifetime plus one day')
+def prune_keys(max_age_days):
+    """Delete keys too old to have signed any token that is still valid"""
+    if key_store is None:
+        raise click.ClickException('JWT_ALGORITHM is HS256; there are no keys to prune')
+    if max_age_days is None:
+        max_age = (app.config['JWT_REFRESH_TOKEN_EXPIRES'] + timedelta(days=1)).total_seconds()
+    else:
+        max_age = max_age_days * 86400
+    for kid in key_store.prune(max_age):
+        click.echo(f"removed {kid}")
+
+@keys_cli.command('list')
+def list_keys():
+    """Show key ids, newest (signing) first"""
+    if key_store is not None:
+        for kid in reversed(key_store.kids()):
+            click.echo(kid)
+
+app.cli.add_command(keys_cli)
+
 # Initialize database
 with app.app_context():
     db.create_all()
@@ -0,0 +1,379 @@
+"""
+Throughput benchmark for auth-service
+Boots app.py in-process against a local Postgres/Redis (DATABASE_URL and
+REDIS_URL) or in-process stand-ins (--fake: SQLite and fakeredis), drives a
+weighted mix of register/login/refresh/verify/logout requests from N threads
+and reports throughput, latency percentiles and where the time went.
+
+    python benchmarks/bench_auth.py --fake --concurrency 8 --duration 15
+    DATABASE_URL=postgresql://... REDIS_URL=redis://localhost:6379/1 \\
+        python benchmarks/bench_auth.py --mix verify=10,login=1
+"""
+
+import argparse
+import functools
+import json
+import logging
+import math
+import os
+import random
+import secrets
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+OPERATIONS = ('register', 'login', 'refresh', 'verify', 'verify_batch', 'logout')
+DEFAULT_MIX = 'login=2,refresh=2,verify=10,verify_batch=1,logout=1,register=0.2'
+PHASES = ('db', 'redis', 'limiter', 'hashing', 'jwt_encode', 'jwt_decode')
+PASSWORD = 'benchmark-password'
+
+
+class PhaseTimer:
+    """Per-thread, per-request time spent in each instrumented phase
+
+    Phases may nest (the limiter talks to Redis); each phase is charged only
+    its exclusive time, so the phases of a request never add up to more
+    than its latency. Calls made outside a measured request (background
+    threads, seeding) are not recorded.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def begin_request(self):
+        self._local.totals = defaultdict(float)
+        self._local.stack = []
+
+    def end_request(self) -> Dict[str, float]:
+        totals = getattr(self._local, 'totals', None) or {}
+        self._local.totals = None
+        return dict(totals)
+
+    def enter(self, name: str):
+        if getattr(self._local, 'totals', None) is None:
+            return
+        self._local.stack.append([name, time.perf_counter(), 0.0])
+
+    def exit(self):
+        if getattr(self._local, 'totals', None) is None or not self._local.stack:
+            return
+        name, started, children = self._local.stack.pop()
+        elapsed = time.perf_counter() - started
+        self._local.totals[name] += elapsed - children
+        if self._local.stack:
+            self._local.stack[-1][2] += elapsed
+
+    def wrap(self, name: str, fn):
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            self.enter(name)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.exit()
+        return timed
+
+
+def configure_environment(args) -> tempfile.TemporaryDirectory:
+    """Point app.py at the chosen backends; must run before it is imported"""
+    workdir = tempfile.TemporaryDirectory(prefix='auth-bench-')
+    os.environ.setdefault('JWT_KEYS_DIR', os.path.join(workdir.name, 'keys'))
+    os.environ['JWT_ALGORITHM'] = args.algorithm
+    os.environ['RATELIMIT_ENABLED'] = 'false' if args.no_limiter else 'true'
+    if args.bcrypt_rounds:
+        os.environ['BCRYPT_ROUNDS'] = str(args.bcrypt_rounds)
+    os.environ.setdefault('INTERNAL_API_TOKEN', 'bench-internal-token')
+
+    if args.fake:
+        try:
+            import fakeredis
+        except ImportError:
+            sys.exit('--fake needs the fakeredis package (pip install fakeredis)')
+        import redis
+
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir.name, 'auth.db')}"
+        os.environ['RATELIMIT_STORAGE_URI'] = 'memory://'
+        os.environ['REDIS_URL'] = 'redis://fake/0'
+        server = fakeredis.FakeServer()
+        redis.Redis.from_url = classmethod(
+            lambda cls, url, **kwargs: fakeredis.FakeRedis(server=server, **kwargs)
+        )
+    else:
+        missing = [name for name in ('DATABASE_URL', 'REDIS_URL') if not os.environ.get(name)]
+        if missing:
+            sys.exit(f"Set {' and '.join(missing)} or pass --fake")
+    return workdir
+
+
+def instrument(service, timer: PhaseTimer):
+    """Hook the phase timer into SQLAlchemy, redis-py, the limiter, bcrypt and PyJWT"""
+    import jwt
+    import redis
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    event.listen(Engine, 'before_cursor_execute', lambda *args: timer.enter('db'))
+    event.listen(Engine, 'after_cursor_execute', lambda *args: timer.exit())
+    event.listen(Engine, 'handle_error', lambda context: timer.exit())
+
+    redis.Redis.execute_command = timer.wrap('redis', redis.Redis.execute_command)
+    redis.client.Pipeline.execute = timer.wrap('redis', redis.client.Pipeline.execute)
+
+    strategy = getattr(service.limiter, 'limiter', None)
+    if strategy is not None:
+        strategy.hit = timer.wrap('limiter', strategy.hit)
+        strategy.test = timer.wrap('limiter', strategy.test)
+
+    service.password_hasher._run = timer.wrap('hashing', service.password_hasher._run)
+
+    jwt.encode = timer.wrap('jwt_encode', jwt.encode)
+    jwt.decode = timer.wrap('jwt_decode', jwt.decode)
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(','):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation {name!r} (choose from {', '.join(OPERATIONS)})")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError('The mix needs at least one operation with a positive weight')
+    return mix
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    # Nearest rank
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class Worker(threading.Thread):
+    """One simulated client: keeps a token pair and replays the mix until the deadline"""
+
+    def __init__(self, bench, index: int):
+        super().__init__(name=f'bench-{index}', daemon=True)
+        self.bench = bench
+        self.client = bench.service.app.test_client(use_cookies=False)
+        self.rng = random.Random(index)
+        self.username = bench.usernames[index % len(bench.usernames)]
+        self.access_token = None
+        self.refresh_token = None
+        self.samples = []  # (op, status, seconds, phases)
+
+    def call(self, op: str, method: str, path: str, token: Optional[str] = None, body=None, headers=None):
+        headers = dict(headers or {})
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        # A fresh client address per request: the limiter does its full
+        # bookkeeping without the benchmark tripping the per-IP limits
+        environ = {'REMOTE_ADDR': f'10.{self.rng.randrange(256)}.{self.rng.randrange(256)}.{self.rng.randrange(1, 255)}'}
+        timer = self.bench.timer
+        timer.begin_request()
+        started = time.perf_counter()
+        response = self.client.open(path, method=method, json=body, headers=headers, environ_base=environ)
+        elapsed = time.perf_counter() - started
+        self.samples.append((op, response.status_code, elapsed, timer.end_request()))
+        return response
+
+    def login(self):
+        response = self.call('login', 'POST', '/auth/login',
+                             body={'username': self.username, 'password': PASSWORD})
+        if response.status_code == 200:
+            data = response.get_json()
+            self.access_token, self.refresh_token = data['access_token'], data['refresh_token']
+
+    def run(self):
+        ops, weights = zip(*self.bench.mix.items())
+        while time.monotonic() < self.bench.deadline:
+            op = self.rng.choices(ops, weights)[0]
+            if op == 'register':
+                self.bench.register(self)
+                continue
+            if op == 'login' or self.access_token is None:
+                self.login()
+            elif op == 'refresh':
+                response = self.call('refresh', 'POST', '/auth/refresh', token=self.refresh_token)
+                if response.status_code == 200:
+                    self.access_token = response.get_json()['access_token']
+            elif op == 'verify':
+                self.call('verify', 'GET', '/auth/verify', token=self.access_token)
+            elif op == 'verify_batch':
+                tokens = [self.access_token] * self.bench.batch_size
+                self.call('verify_batch', 'POST', '/auth/verify/batch', body={'tokens': tokens},
+                          headers={'X-Internal-Token': os.environ['INTERNAL_API_TOKEN']})
+            elif op == 'logout':
+                self.call('logout', 'POST', '/auth/logout', token=self.access_token)
+                self.access_token = None
+
+
+class Benchmark:
+    def __init__(self, service, args):
+        self.service = service
+        self.args = args
+        self.mix = args.mix
+        self.batch_size = args.batch_size
+        self.timer = PhaseTimer()
+        self.run_id = secrets.token_hex(3)
+        self.usernames: List[str] = []
+        self.registered: List[str] = []
+        self._counter = 0
+        self._lock = threading.Lock()
+        self.deadline = 0.0
+
+    def _create_user(self, username: str):
+        User, db = self.service.User, self.service.db
+        user = User(id=f'bench-{secrets.token_hex(12)}', username=username,
+                    email=f'{username}@bench.invalid', display_name=username)
+        user.set_password(PASSWORD)
+        db.session.add(user)
+        db.session.commit()
+
+    def seed(self):
+        """Create the login accounts; the friend limit (3) caps how many fit"""
+        with self.service.app.app_context():
+            for index in range(self.args.users):
+                username = f'bench{self.run_id}_{index}'
+                self._create_user(username)
+                self.usernames.append(username)
+
+    def register(self, worker: Worker):
+        with self._lock:
+            self._counter += 1
+            username = f'bench{self.run_id}_r{self._counter}'
+        response = worker.call('register', 'POST', '/auth/register', body={
+            'username': username, 'email': f'{username}@bench.invalid', 'password': PASSWORD
+        })
+        if response.status_code == 201:
+            # Deactivate straight away (untimed) so the friend limit leaves room for the next one
+            with self.service.app.app_context():
+                user = self.service.User.query.filter_by(username=username).first()
+                user.is_active = False
+                self.service.db.session.commit()
+            with self._lock:
+                self.registered.append(username)
+
+    def cleanup(self):
+        with self.service.app.app_context():
+            User = self.service.User
+            for user in User.query.filter(User.username.like(f'bench{self.run_id}_%')).all():
+                self.service.db.session.delete(user)
+            self.service.db.session.commit()
+
+    def run(self) -> List[tuple]:
+        self.deadline = time.monotonic() + self.args.warmup
+        warm = [Worker(self, index) for index in range(self.args.concurrency)]
+        for worker in warm:
+            worker.start()
+        for worker in warm:
+            worker.join()
+
+        instrument(self.service, self.timer)
+        workers = [Worker(self, index) for index in range(self.args.concurrency)]
+        self.deadline = time.monotonic() + self.args.duration
+        started = time.monotonic()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.elapsed = time.monotonic() - started
+        return [sample for worker in workers for sample in worker.samples]
+
+
+def summarize(samples: List[tuple], elapsed: float) -> Dict:
+    by_op = defaultdict(list)
+    for sample in samples:
+        by_op[sample[0]].append(sample)
+
+    operations = {}
+    for op in OPERATIONS + ('total',):
+        group = samples if op == 'total' else by_op.get(op)
+        if not group:
+            continue
+        latencies = [seconds for _, _, seconds, _ in group]
+        phases = {name: sum(sample[3].get(name, 0.0) for sample in group) / len(group) * 1000 for name in PHASES}
+        phases['other'] = max(0.0, sum(latencies) / len(group) * 1000 - sum(phases.values()))
+        operations[op] = {
+            'count': len(group),
+            'throughput': len(group) / elapsed,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'statuses': dict(sorted(Counter(status for _, status, _, _ in group).items())),
+            'phase_ms': phases
+        }
+    return operations
+
+
+def print_report(operations: Dict, args, service, elapsed: float):
+    backend = 'fake (SQLite + fakeredis)' if args.fake else 'DATABASE_URL + REDIS_URL'
+    print(f"auth-service: {backend}, {args.concurrency} threads, {elapsed:.1f} s, "
+          f"{args.algorithm}, bcrypt cost {service.password_hasher.rounds}, "
+          f"limiter {'off' if args.no_limiter else 'on'}")
+    print()
+    print(f"{'operation':<14}{'count':>8}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  statuses")
+    for op, row in operations.items():
+        statuses = ' '.join(f'{status}:{count}' for status, count in row['statuses'].items())
+        print(f"{op:<14}{row['count']:>8}{row['throughput']:>10.1f}{row['p50_ms']:>9.2f}"
+              f"{row['p95_ms']:>9.2f}{row['p99_ms']:>9.2f}  {statuses}")
+    print()
+    print('mean ms per request by phase')
+    columns = PHASES + ('other',)
+    print(f"{'operation':<14}" + ''.join(f'{name:>12}' for name in columns))
+    for op, row in operations.items():
+        print(f"{op:<14}" + ''.join(f"{row['phase_ms'][name]:>12.2f}" for name in columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--fake', action='store_true', help='SQLite and fakeredis instead of DATABASE_URL/REDIS_URL')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads (default 8)')
+    parser.add_argument('--duration', type=float, default=10, help='measured seconds (default 10)')
+    parser.add_argument('--warmup', type=float, default=2, help='unmeasured seconds first (default 2)')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f'operation weights (default {DEFAULT_MIX})')
+    parser.add_argument('--users', type=int, default=1, choices=(1, 2),
+                        help='accounts to log in as; the rest of the friend limit is left for register')
+    parser.add_argument('--batch-size', type=int, default=20, help='tokens per verify_batch call')
+    parser.add_argument('--algorithm', default=os.environ.get('JWT_ALGORITHM', 'EdDSA'),
+                        choices=('EdDSA', 'RS256', 'HS256'))
+    parser.add_argument('--bcrypt-rounds', type=int, help='fixed bcrypt cost instead of calibrating')
+    parser.add_argument('--no-limiter', action='store_true', help='run with RATELIMIT_ENABLED=false')
+    parser.add_argument('--json', metavar='PATH', help='also write the results as JSON')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+    workdir = configure_environment(args)
+    sys.path.insert(0, SERVICE_DIR)
+    import app as service
+
+    bench = Benchmark(service, args)
+    bench.seed()
+    try:
+        samples = bench.run()
+    finally:
+        if not args.fake:
+            bench.cleanup()
+        workdir.cleanup()
+
+    operations = summarize(samples, bench.elapsed)
+    print_report(operations, args, service, bench.elapsed)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'config': {key: value for key, value in vars(args).items() if key != 'mix'},
+                       'mix': args.mix, 'elapsed': bench.elapsed, 'operations': operations}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""
+Cached user directory for auth-service
+The user table is tiny and rarely changes, so every worker keeps all of it
+in memory under a version number. Committed changes bump the version in
+Redis and announce it on a pub/sub channel; workers reload on the next read.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'user_directory:version'
+CHANNEL = 'user_directory:invalidate'
+
+# Columns whose changes are visible through the directory (last_login is not)
+DIRECTORY_FIELDS = ('username', 'email', 'display_name', 'role', 'is_active')
+
+
+class DirectoryEntry(NamedTuple):
+    user: Dict  # User.to_dict()
+    is_active: bool
+
+
+class UserDirectory:
+    """Versioned in-process snapshot of the users table
+
+    ``loader`` returns ``(user_id, public_dict, is_active)`` rows and must be
+    called inside an app context. While the invalidation listener is down
+    the version is read from Redis on every access (still no database
+    query), and if Redis is down too the snapshot is reloaded after
+    ``max_age`` seconds.
+    """
+
+    def __init__(self, redis_client: redis.Redis, loader: Callable[[], List[tuple]], max_age: float = 300):
+        self.redis = redis_client
+        self.loader = loader
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._users: Dict[str, DirectoryEntry] = {}
+        self._active: List[Dict] = []
+        self._version = None
+        self._loaded_at = 0.0
+        self._stale = True
+        self._listening = False
+        self._thread = None
+        self._pid = None
+        self._counters = {'reads': 0, 'reloads': 0, 'invalidations': 0}
+
+    # -- invalidation ------------------------------------------------------
+
+    def ensure_started(self):
+        """Start the listener thread once per process (gunicorn forks workers)"""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._listening = False
+            self._stale = True
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._listen, name='user-directory', daemon=True)
+            self._thread.start()
+
+    def _listen(self):
+        backoff = 1
+        while True:
+            pubsub = None
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CHANNEL)
+                # Anything published before the subscription is covered by a reload
+                self._stale = True
+                self._listening = True
+                backoff = 1
+                for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        self._stale = True
+                        with self._lock:
+                            self._counters['invalidations'] += 1
+            except redis.RedisError as e:
+                logger.warning(f"User directory listener disconnected: {e}")
+            except Exception as e:
+                logger.error(f"User directory listener error: {e}")
+            finally:
+                self._listening = False
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def invalidate(self):
+        """Announce a committed change to every worker, this one included"""
+        self._stale = True
+        try:
+            version = self.redis.incr(VERSION_KEY)
+            self.redis.publish(CHANNEL, version)
+        except redis.RedisError as e:
+            logger.warning(f"User directory invalidation not published: {e}")
+
+    # -- reads -------------------------------------------------------------
+
+    def _remote_version(self) -> Optional[str]:
+        try:
+            version = self.redis.get(VERSION_KEY)
+        except redis.RedisError:
+            return None
+        return str(version or 0)
+
+    def _current(self):
+        self.ensure_started()
+        with self._lock:
+            self._counters['reads'] += 1
+            if self._listening and not self._stale:
+                return
+            if not self._listening and not self._stale:
+                version = self._remote_version()
+                if version is not None and version == self._version:
+                    return
+                if version is None and time.time() - self._loaded_at < self.max_age:
+                    return
+
+            # Clear the flag before reading so a change during the load marks it stale again
+            self._stale = False
+            version = self._remote_version()
+            try:
+                rows = self.loader()
+            except Exception:
+                self._stale = True
+                raise
+            self._users = {str(user_id): DirectoryEntry(user, is_active) for user_id, user, is_active in rows}
+            self._active = [user for user_id, user, is_active in rows if is_active]
+            self._version = version if version is not None else str(time.time())
+            self._loaded_at = time.time()
+            self._counters['reloads'] += 1
+
+    @property
+    def version(self) -> str:
+        self._current()
+        return self._version
+
+    def get(self, user_id: str) -> Optional[DirectoryEntry]:
+        self._current()
+        return self._users.get(str(user_id))
+
+    def active_users(self) -> List[Dict]:
+        self._current()
+        return self._active
+
+    def active_count(self) -> int:
+        return len(self.active_users())
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._counters, version=self._version, users=len(self._users),
+                        listening=self._listening)
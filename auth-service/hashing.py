@@ -0,0 +1,160 @@
+"""
+Password hashing off the request threads
+Runs bcrypt in a bounded process pool so a burst of logins cannot occupy
+every web worker, refuses new work once the queue is full, and picks the
+bcrypt cost (never below 12) once per deployment so one hash takes about
+BCRYPT_TARGET_MS
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict
+
+import bcrypt
+import redis
+
+logger = logging.getLogger(__name__)
+
+
+class HashingPoolSaturated(Exception):
+    """Too many hashes are queued; the request should be retried shortly"""
+
+    def __init__(self, retry_after: int = 1):
+        super().__init__('Password hashing is saturated')
+        self.retry_after = retry_after
+
+
+def _hash_password(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _check_password(password: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed)
+
+
+# Never pick a cost below this, however slow the machine
+MIN_ROUNDS = 12
+
+ROUNDS_KEY = 'bcrypt_rounds:'
+
+
+def calibrate_rounds(target_ms: float, min_rounds: int = MIN_ROUNDS, max_rounds: int = 15) -> int:
+    """Highest cost whose hash time stays within ``target_ms`` on this machine"""
+    started = time.perf_counter()
+    _hash_password(b'calibration', min_rounds)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    rounds = min_rounds
+    # Each extra round doubles the work
+    while rounds < max_rounds and elapsed_ms * 2 <= target_ms:
+        rounds += 1
+        elapsed_ms *= 2
+    logger.info(f"bcrypt cost {rounds} (~{elapsed_ms:.0f} ms per hash)")
+    return rounds
+
+
+def shared_rounds(redis_client: redis.Redis, target_ms: float, ttl: int = 86400) -> int:
+    """Cost calibrated once for every worker and replica, kept in Redis for ``ttl``
+
+    The first process to finish calibrating publishes its result and the
+    others adopt it, so all of them hash at the same cost. Without Redis each
+    process calibrates for itself.
+    """
+    key = f"{ROUNDS_KEY}{target_ms:g}"
+    try:
+        stored = redis_client.get(key)
+        if stored is not None:
+            return max(int(stored), MIN_ROUNDS)
+    except redis.RedisError as e:
+        logger.warning(f"Shared bcrypt cost unavailable, calibrating locally: {e}")
+        return calibrate_rounds(target_ms)
+
+    rounds = calibrate_rounds(target_ms)
+    try:
+        if not redis_client.set(key, rounds, nx=True, ex=ttl):
+            rounds = max(int(redis_client.get(key) or rounds), MIN_ROUNDS)
+    except redis.RedisError as e:
+        logger.warning(f"Could not share bcrypt cost: {e}")
+    return rounds
+
+
+class PasswordHasher:
+    """bcrypt in a process pool with a bounded backlog
+
+    At most ``max_workers + max_queue`` hashes may be pending; beyond that,
+    or when a hash waits longer than ``timeout``, HashingPoolSaturated is
+    raised so the caller can answer 503 instead of tying up a thread.
+    """
+
+    def __init__(self, rounds: int, max_workers: int = 2, max_queue: int = 8, timeout: float = 10):
+        self.rounds = rounds
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._pool = None
+        self._pid = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._counters = {'hashed': 0, 'checked': 0, 'rejected': 0, 'timeouts': 0}
+
+    def _executor(self) -> ProcessPoolExecutor:
+        # A pool inherited through gunicorn's fork is unusable; make one per process
+        if self._pool is None or self._pid != os.getpid():
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('forkserver')
+            )
+            self._pid = os.getpid()
+        return self._pool
+
+    def _run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._counters['rejected'] += 1
+                raise HashingPoolSaturated()
+            self._pending += 1
+            executor = self._executor()
+        try:
+            future = executor.submit(fn, *args)
+        except BaseException:
+            self._done()
+            raise
+        # The slot is held until the hash finishes, not until the caller gives up on it
+        future.add_done_callback(lambda _: self._done())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # Drop it if it never started; a running hash cannot be interrupted
+            future.cancel()
+            with self._lock:
+                self._counters['timeouts'] += 1
+            raise HashingPoolSaturated()
+
+    def _done(self):
+        with self._lock:
+            self._pending -= 1
+
+    def hash(self, password: str) -> str:
+        hashed = self._run(_hash_password, password.encode('utf-8'), self.rounds)
+        with self._lock:
+            self._counters['hashed'] += 1
+        return hashed.decode('utf-8')
+
+    def check(self, hashed: str, password: str) -> bool:
+        result = self._run(_check_password, password.encode('utf-8'), hashed.encode('utf-8'))
+        with self._lock:
+            self._counters['checked'] += 1
+        return result
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(
+                self._counters,
+                pending=self._pending,
+                rounds=self.rounds,
+                max_workers=self.max_workers,
+                max_queue=self.max_queue
+            )
@@ -0,0 +1,182 @@
+"""
+Signing keys for auth-service tokens
+Keeps EdDSA or RSA private keys as PEM files in a directory (one file per
+key id), signs with the newest one and publishes the public halves as a
+JWKS document, so other services can verify tokens without calling us
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from jwt.algorithms import OKPAlgorithm, RSAAlgorithm
+
+logger = logging.getLogger(__name__)
+
+ASYMMETRIC_ALGORITHMS = ('EdDSA', 'RS256')
+
+
+def _new_private_key(algorithm: str):
+    if algorithm == 'EdDSA':
+        return ed25519.Ed25519PrivateKey.generate()
+    if algorithm == 'RS256':
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    raise ValueError(f"Unsupported signing algorithm: {algorithm}")
+
+
+def key_algorithm(key) -> str:
+    """JWS algorithm of a private or public signing key"""
+    return 'EdDSA' if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)) else 'RS256'
+
+
+class KeyStore:
+    """Directory of ``<kid>.pem`` private keys; the lexically greatest kid signs
+
+    Key ids start with their creation time, so "greatest" means "newest" and
+    a rotation done by one process is picked up by every worker on its next
+    reload check.
+    """
+
+    def __init__(self, directory: str, algorithm: str = 'EdDSA', reload_interval: float = 5):
+        if algorithm not in ASYMMETRIC_ALGORITHMS:
+            raise ValueError(f"Unsupported signing algorithm: {algorithm}")
+        self.directory = directory
+        self.algorithm = algorithm
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._keys: Dict[str, object] = {}  # kid -> private key
+        self._signature = None
+        self._checked_at = float('-inf')
+        self._jwks: Optional[Tuple[bytes, str]] = None
+
+    # -- files -------------------------------------------------------------
+
+    def _listing(self):
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith('.pem')]
+        except FileNotFoundError:
+            return ()
+        return tuple(sorted((entry.name, entry.stat().st_mtime_ns) for entry in entries))
+
+    def _reload(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        listing = self._listing()
+        if listing == self._signature and not force:
+            return
+
+        keys = {}
+        for name, _ in listing:
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, 'rb') as f:
+                    keys[name[:-len('.pem')]] = serialization.load_pem_private_key(f.read(), password=None)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Signing key {name} not loaded: {e}")
+        self._keys = keys
+        self._signature = listing
+        self._jwks = None
+
+    def _write(self, algorithm: str) -> str:
+        kid = f"{int(time.time()):010d}-{secrets.token_hex(4)}"
+        private_key = _new_private_key(algorithm)
+        pem = private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        )
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        tmp_path = os.path.join(self.directory, f".{kid}.tmp")
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pem)
+        os.replace(tmp_path, os.path.join(self.directory, f"{kid}.pem"))
+        return kid
+
+    # -- public API --------------------------------------------------------
+
+    def ensure_key(self):
+        """Create a first key unless one exists; safe to call from every worker at once"""
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            with self._lock:
+                self._reload(force=True)
+                if not self._keys:
+                    kid = self._write(self.algorithm)
+                    logger.info(f"Created signing key {kid}")
+                    self._reload(force=True)
+
+    def rotate(self) -> str:
+        """Add a new key; it signs from now on while older keys keep verifying"""
+        with self._lock:
+            kid = self._write(self.algorithm)
+            self._reload(force=True)
+        return kid
+
+    def prune(self, max_age: float) -> List[str]:
+        """Delete keys older than ``max_age`` seconds, never the current one"""
+        with self._lock:
+            self._reload(force=True)
+            current = max(self._keys, default=None)
+            cutoff = time.time() - max_age
+            removed = []
+            for kid in list(self._keys):
+                if kid != current and int(kid.split('-', 1)[0]) < cutoff:
+                    os.remove(os.path.join(self.directory, f"{kid}.pem"))
+                    removed.append(kid)
+            self._reload(force=True)
+        return removed
+
+    def signing_key(self) -> Tuple[str, object, str]:
+        """(kid, private key, algorithm) to sign new tokens with"""
+        with self._lock:
+            self._reload()
+            if not self._keys:
+                raise RuntimeError(f"No signing keys in {self.directory}")
+            kid = max(self._keys)
+            private_key = self._keys[kid]
+        return kid, private_key, key_algorithm(private_key)
+
+    def public_key(self, kid: str):
+        """Public key for ``kid``, or None if it was never issued or has been pruned"""
+        with self._lock:
+            self._reload()
+            if kid not in self._keys:
+                # Possibly rotated by another process moments ago
+                self._checked_at = float('-inf')
+                self._reload()
+            private_key = self._keys.get(kid)
+        return private_key.public_key() if private_key is not None else None
+
+    def kids(self) -> List[str]:
+        with self._lock:
+            self._reload()
+            return sorted(self._keys)
+
+    def jwks(self) -> Tuple[bytes, str]:
+        """Serialized JWKS document and its ETag, rebuilt only when the key set changes"""
+        with self._lock:
+            self._reload()
+            if self._jwks is None:
+                keys = []
+                for kid in sorted(self._keys, reverse=True):
+                    private_key = self._keys[kid]
+                    algorithm = key_algorithm(private_key)
+                    to_jwk = OKPAlgorithm.to_jwk if algorithm == 'EdDSA' else RSAAlgorithm.to_jwk
+                    jwk = json.loads(to_jwk(private_key.public_key()))
+                    jwk.update({'kid': kid, 'alg': algorithm, 'use': 'sig'})
+                    keys.append(jwk)
+                body = json.dumps({'keys': keys}, separators=(',', ':')).encode('utf-8')
+                self._jwks = (body, f'"{hashlib.sha256(body).hexdigest()[:16]}"')
+            return self._jwks
@@ -0,0 +1,238 @@
+"""
+Hybrid rate limit storage for Flask-Limiter
+Counts hits in a per-worker table and reconciles it with the Redis counters
+in one Lua call per interval, so most limiter checks cost no round trip.
+Registered as the ``hybrid+redis://`` storage scheme.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import redis
+from limits.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'LIMITER'
+
+# KEYS: counters; ARGV: (amount, expiry, elastic) per key.
+# Returns (count, ttl) per key after adding its amount.
+SYNC_SCRIPT = """
+local result = {}
+for i, key in ipairs(KEYS) do
+    local offset = (i - 1) * 3
+    local expiry = tonumber(ARGV[offset + 2])
+    local count = redis.call('INCRBY', key, tonumber(ARGV[offset + 1]))
+    local ttl = redis.call('TTL', key)
+    if ttl < 0 or ARGV[offset + 3] == '1' then
+        redis.call('EXPIRE', key, expiry)
+        ttl = expiry
+    end
+    result[#result + 1] = count
+    result[#result + 1] = ttl
+end
+return result
+"""
+
+
+def limit_amount(key: str) -> Optional[int]:
+    """Hits allowed per window, read from a limits key (``.../<amount>/<multiples>/<granularity>``)"""
+    try:
+        return int(key.rsplit('/', 3)[-3])
+    except (IndexError, ValueError):
+        return None
+
+
+class _Counter:
+    __slots__ = ('base', 'pending', 'allowance', 'expiry', 'elastic', 'expires_at', 'synced_at')
+
+    def __init__(self, allowance: int, expiry: int, elastic: bool):
+        self.base = 0  # count in Redis at the last sync, our own hits included
+        self.pending = 0  # hits counted here but not yet added in Redis
+        self.allowance = allowance
+        self.expiry = expiry
+        self.elastic = elastic
+        self.expires_at = 0.0
+        self.synced_at = 0.0
+
+
+class HybridRedisStorage(Storage):
+    """Fixed-window counters kept locally and summed in Redis every ``sync_interval``
+
+    A worker answers from ``base + pending`` until its unsynced hits on a key
+    reach the key's allowance (``max_drift`` of the limit) or the last sync is
+    older than two intervals; then that hit is synced before it is answered.
+    Each worker can therefore admit at most ``allowance - 1`` hits that the
+    others have not seen, and limits of ``sync_below`` hits or fewer (register,
+    login) are always counted in Redis, exactly as with ``redis://``.
+
+    This is a fixed window rather than a token bucket: Flask-Limiter asks its
+    storage for hit counts per window key, so a bucket would not plug in here
+    and the limits stay those already declared on the routes. The cost is the
+    usual fixed-window edge burst, up to twice the limit within a short span
+    across a window boundary, which ``redis://`` has as well.
+    """
+
+    STORAGE_SCHEME = ['hybrid+redis']
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, sync_interval: float = 1.0,
+                 sync_below: int = 20, max_drift: float = 0.1, batch_size: int = 500, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.redis = redis.Redis.from_url(uri[len('hybrid+'):], **options)
+        self.sync_interval = sync_interval
+        self.sync_below = sync_below
+        self.max_drift = max_drift
+        self.batch_size = batch_size
+        self._script = self.redis.register_script(SYNC_SCRIPT)
+        self._counters: Dict[str, _Counter] = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stats = {'local_hits': 0, 'synced_hits': 0, 'flushes': 0, 'flush_errors': 0}
+
+    @property
+    def base_exceptions(self):
+        return redis.RedisError
+
+    def ensure_started(self):
+        """Start the flush thread once per process (gunicorn forks workers)"""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            # Counts inherited through a fork belong to the parent
+            self._counters = {}
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='rate-limit-sync', daemon=True)
+            self._thread.start()
+
+    # -- reconciliation ----------------------------------------------------
+
+    def _sync(self, keys: List[str]) -> Dict[str, int]:
+        """Add the pending hits of ``keys`` in Redis; returns each key's new count"""
+        batch = []
+        with self._lock:
+            for key in keys:
+                counter = self._counters.get(key)
+                if counter is not None:
+                    batch.append((key, counter, counter.pending))
+                    counter.pending = 0
+        if not batch:
+            return {}
+
+        args = []
+        for _, counter, amount in batch:
+            args.extend((amount, counter.expiry, '1' if counter.elastic else '0'))
+        try:
+            result = self._script(keys=[key for key, _, _ in batch], args=args)
+        except redis.RedisError:
+            # Keep the hits for the next attempt
+            with self._lock:
+                for _, counter, amount in batch:
+                    counter.pending += amount
+            raise
+
+        now = time.time()
+        counts = {}
+        with self._lock:
+            for index, (key, counter, _) in enumerate(batch):
+                count, ttl = int(result[index * 2]), int(result[index * 2 + 1])
+                counter.base = count
+                counter.expires_at = now + ttl
+                counter.synced_at = now
+                counts[key] = count
+        return counts
+
+    def flush(self):
+        """Sync every key with pending hits and forget windows that have ended"""
+        now = time.time()
+        with self._lock:
+            for key in [key for key, counter in self._counters.items()
+                        if counter.expires_at <= now and not counter.pending]:
+                del self._counters[key]
+            keys = [key for key, counter in self._counters.items() if counter.pending]
+        for start in range(0, len(keys), self.batch_size):
+            self._sync(keys[start:start + self.batch_size])
+        with self._lock:
+            self._stats['flushes'] += 1
+
+    def _run(self):
+        while True:
+            time.sleep(self.sync_interval)
+            try:
+                self.flush()
+            except redis.RedisError as e:
+                with self._lock:
+                    self._stats['flush_errors'] += 1
+                logger.warning(f"Rate limit sync failed: {e}")
+            except Exception as e:
+                logger.error(f"Rate limit sync error: {e}")
+
+    # -- limits.storage.Storage ----------------------------------------------
+
+    def incr(self, key: str, expiry: int, elastic_expiry: bool = False, amount: int = 1) -> int:
+        self.ensure_started()
+        limit = limit_amount(key)
+        now = time.time()
+        with self._lock:
+            counter = self._counters.get(key)
+            fresh = (counter is not None and counter.expires_at > now
+                     and now - counter.synced_at < self.sync_interval * 2)
+            if counter is None or counter.expires_at <= now:
+                # New window: its count comes from Redis on this first hit
+                allowance = max(1, int((limit or 0) * self.max_drift))
+                counter = self._counters[key] = _Counter(allowance, expiry, elastic_expiry)
+            counter.pending += amount
+            if fresh and limit is not None and limit > self.sync_below and counter.pending < counter.allowance:
+                self._stats['local_hits'] += 1
+                return counter.base + counter.pending
+            self._stats['synced_hits'] += 1
+        count = self._sync([key]).get(key)
+        if count is None:
+            # A concurrent sync took our hit along with its own
+            with self._lock:
+                return counter.base + counter.pending
+        return count
+
+    def get(self, key: str) -> int:
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is not None and counter.expires_at > time.time():
+                return counter.base + counter.pending
+        return int(self.redis.get(key) or 0)
+
+    def get_expiry(self, key: str) -> float:
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is not None and counter.expires_at > time.time():
+                return counter.expires_at
+        return max(self.redis.ttl(key), 0) + time.time()
+
+    def check(self) -> bool:
+        try:
+            return bool(self.redis.ping())
+        except redis.RedisError:
+            return False
+
+    def reset(self) -> Optional[int]:
+        with self._lock:
+            self._counters = {}
+        removed = 0
+        for key in self.redis.scan_iter(match=f'{KEY_PREFIX}*', count=1000):
+            removed += self.redis.delete(key)
+        return removed
+
+    def clear(self, key: str):
+        with self._lock:
+            self._counters.pop(key, None)
+        self.redis.delete(key)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._stats, keys=len(self._counters),
+                        pending=sum(counter.pending for counter in self._counters.values()),
+                        sync_interval=self.sync_interval, sync_below=self.sync_below)
@@ -0,0 +1,184 @@
+"""
+In-process view of the token blocklist
+Keeps the revoked token ids from Redis in a local set (behind a Bloom filter
+pre-check), fed by keyspace notifications and rebuilt by a periodic SCAN, so
+checking an unrevoked token needs no network round trip
+"""
+
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from typing import Dict, Iterable
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+BLOCKLIST_PREFIX = 'blocklist:'
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings; rebuilt rather than shrunk"""
+
+    def __init__(self, capacity: int = 10000, error_rate: float = 0.001):
+        # m = -n ln p / (ln 2)^2, k = m/n ln 2
+        self.size = max(64, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str) -> Iterable[int]:
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:], 'big') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationFilter:
+    """Local mirror of ``blocklist:<jti>`` keys
+
+    Healthy once subscribed to the blocklist keyspace and resynced; until
+    then (or after a disconnect) ``is_revoked`` asks Redis directly, so a
+    missed notification can never let a revoked token through.
+    """
+
+    def __init__(self, redis_client: redis.Redis, db: int = 0, resync_interval: float = 60,
+                 capacity: int = 10000):
+        self.redis = redis_client
+        self.db = db
+        self.resync_interval = resync_interval
+        self.capacity = capacity
+        self.healthy = False
+        self._revoked: Dict[str, float] = {}  # jti -> expires_at
+        self._recent: Dict[str, float] = {}  # added while a resync is running
+        self._bloom = BloomFilter(capacity)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._counters = {'local_checks': 0, 'bloom_negatives': 0, 'redis_checks': 0, 'resyncs': 0}
+
+    def ensure_started(self):
+        """Start the listener thread once per process (gunicorn forks workers)"""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self.healthy = False
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='revocation-filter', daemon=True)
+            self._thread.start()
+
+    def add(self, jti: str, ttl: float):
+        """Record a revocation made by this process without waiting for the notification"""
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._revoked[jti] = expires_at
+            self._recent[jti] = expires_at
+            self._bloom.add(jti)
+
+    def is_revoked(self, jti: str) -> bool:
+        self.ensure_started()
+        if self.healthy:
+            with self._lock:
+                self._counters['local_checks'] += 1
+                if jti not in self._bloom:
+                    self._counters['bloom_negatives'] += 1
+                    return False
+                expires_at = self._revoked.get(jti)
+            return expires_at is not None and expires_at > time.time()
+
+        with self._lock:
+            self._counters['redis_checks'] += 1
+        return self.redis.get(f"{BLOCKLIST_PREFIX}{jti}") is not None
+
+    def _resync(self):
+        """Rebuild the set and the Bloom filter from a full SCAN of the blocklist"""
+        with self._lock:
+            self._recent = {}
+        now = time.time()
+        revoked = {}
+        keys = list(self.redis.scan_iter(match=f"{BLOCKLIST_PREFIX}*", count=1000))
+        if keys:
+            pipe = self.redis.pipeline(transaction=False)
+            for key in keys:
+                pipe.ttl(key)
+            for key, ttl in zip(keys, pipe.execute()):
+                if ttl is None or ttl == -2:
+                    continue
+                revoked[key[len(BLOCKLIST_PREFIX):]] = now + (ttl if ttl > 0 else 86400)
+
+        bloom = BloomFilter(max(self.capacity, len(revoked) * 2))
+        for jti in revoked:
+            bloom.add(jti)
+        with self._lock:
+            # Keep revocations that arrived while the SCAN was running
+            for jti, expires_at in self._recent.items():
+                revoked[jti] = expires_at
+                bloom.add(jti)
+            self._revoked = revoked
+            self._bloom = bloom
+            self._counters['resyncs'] += 1
+
+    def _notifications_enabled(self) -> bool:
+        flags = self.redis.config_get('notify-keyspace-events').get('notify-keyspace-events', '')
+        return 'K' in flags and ('$' in flags or 'A' in flags)
+
+    def _run(self):
+        backoff = 1
+        pattern = f'__keyspace@{self.db}__:{BLOCKLIST_PREFIX}*'
+        prefix_len = len(pattern) - 1
+        while True:
+            pubsub = None
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(pattern)
+                if not self._notifications_enabled():
+                    logger.warning("Keyspace notifications disabled on Redis; checking the blocklist remotely")
+                    pubsub.close()
+                    time.sleep(60)
+                    continue
+                # Subscribe first, then resync, so nothing falls between the two
+                self._resync()
+                self.healthy = True
+                backoff = 1
+                next_resync = time.monotonic() + self.resync_interval
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is not None and message['type'] == 'pmessage':
+                        if message['data'] in ('set', 'setex'):
+                            jti = message['channel'][prefix_len:]
+                            ttl = self.redis.ttl(f"{BLOCKLIST_PREFIX}{jti}")
+                            self.add(jti, ttl if ttl and ttl > 0 else 86400)
+                        elif message['data'] in ('del', 'expired'):
+                            with self._lock:
+                                self._revoked.pop(message['channel'][prefix_len:], None)
+                    if time.monotonic() >= next_resync:
+                        self._resync()
+                        next_resync = time.monotonic() + self.resync_interval
+            except redis.RedisError as e:
+                logger.warning(f"Revocation filter disconnected: {e}")
+            except Exception as e:
+                logger.error(f"Revocation filter error: {e}")
+            finally:
+                self.healthy = False
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._counters, healthy=self.healthy, revoked=len(self._revoked))
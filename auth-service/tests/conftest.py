@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+# The service's modules live next to this directory, not in a package, and
+# convivial_shared sits at the repository root (docker-compose mounts it)
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(SERVICE_DIR))
+sys.path.insert(0, SERVICE_DIR)
+
+
+@pytest.fixture(scope='session')
+def service(tmp_path_factory):
+    """app.py on SQLite and fakeredis, like benchmarks/bench_auth.py --fake"""
+    import fakeredis
+    import redis
+
+    workdir = tmp_path_factory.mktemp('auth-service')
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{workdir / 'auth.db'}",
+        'REDIS_URL': 'redis://fake/0',
+        'RATELIMIT_STORAGE_URI': 'memory://',
+        'RATELIMIT_ENABLED': 'false',
+        'REVOCATION_FILTER': 'false',
+        'JWT_ALGORITHM': 'EdDSA',
+        'JWT_KEYS_DIR': str(workdir / 'keys'),
+        'BCRYPT_ROUNDS': '12',
+        'INTERNAL_API_TOKEN': 'internal-secret'
+    })
+    server = fakeredis.FakeServer()
+    from_url = redis.Redis.__dict__['from_url']
+    redis.Redis.from_url = classmethod(lambda cls, url, **kwargs: fakeredis.FakeRedis(server=server, **kwargs))
+    try:
+        import app
+    finally:
+        redis.Redis.from_url = from_url
+    return app
@@ -0,0 +1,70 @@
+import uuid
+from datetime import datetime
+
+import pytest
+
+from directory import VERSION_KEY
+
+
+@pytest.fixture
+def users(service):
+    with service.app.app_context():
+        yield service
+        service.db.session.rollback()
+
+
+def add_user(service, username):
+    user = service.User(id=str(uuid.uuid4()), username=username, email=f'{username}@example.org',
+                        password_hash='not-a-real-hash', display_name=username.title())
+    service.db.session.add(user)
+    service.db.session.commit()
+    return user
+
+
+def remote_version(service):
+    return int(service.redis_client.get(VERSION_KEY) or 0)
+
+
+def test_committed_directory_changes_reach_the_directory(users):
+    user = add_user(users, f'alice{uuid.uuid4().hex[:8]}')
+    assert users.user_directory.get(user.id).user['display_name'] == user.display_name
+
+    before = remote_version(users)
+    user.display_name = 'Alice in Wonderland'
+    users.db.session.commit()
+
+    assert remote_version(users) == before + 1
+    assert users.user_directory.get(user.id).user['display_name'] == 'Alice in Wonderland'
+
+
+def test_rolled_back_changes_are_not_announced(users):
+    user = add_user(users, f'bob{uuid.uuid4().hex[:8]}')
+    before = remote_version(users)
+
+    user.display_name = 'Never Bob'
+    users.db.session.flush()
+    users.db.session.rollback()
+    users.db.session.commit()
+
+    assert remote_version(users) == before
+
+
+def test_fields_outside_the_directory_do_not_invalidate_it(users):
+    user = add_user(users, f'carol{uuid.uuid4().hex[:8]}')
+    before = remote_version(users)
+
+    user.last_login = datetime.utcnow()
+    users.db.session.commit()
+
+    assert remote_version(users) == before
+
+
+def test_deactivated_users_leave_the_active_list(users):
+    user = add_user(users, f'dave{uuid.uuid4().hex[:8]}')
+    assert user.id in {entry['id'] for entry in users.user_directory.active_users()}
+
+    user.is_active = False
+    users.db.session.commit()
+
+    assert user.id not in {entry['id'] for entry in users.user_directory.active_users()}
+    assert users.user_directory.get(user.id).is_active is False
@@ -0,0 +1,46 @@
+import time
+
+import pytest
+
+from hashing import HashingPoolSaturated, PasswordHasher
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher(rounds=4, max_workers=1, max_queue=0)
+    yield hasher
+    hasher._executor().shutdown(cancel_futures=True)
+
+
+def wait_until_idle(hasher, timeout=10):
+    deadline = time.monotonic() + timeout
+    while hasher.stats()['pending'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return hasher.stats()['pending'] == 0
+
+
+def test_hash_and_check(hasher):
+    hashed = hasher.hash('correct horse')
+    assert hasher.check(hashed, 'correct horse')
+    assert not hasher.check(hashed, 'battery staple')
+    assert hasher.stats()['pending'] == 0
+
+
+def test_full_pool_rejects_new_work(hasher):
+    hasher.hash('warm up the worker')
+    hasher.timeout = 0.2
+
+    # Outlives the caller's timeout: the caller gives up, the worker does not
+    with pytest.raises(HashingPoolSaturated):
+        hasher._run(time.sleep, 1)
+    assert hasher.stats()['timeouts'] == 1
+
+    # Its slot stays taken until it finishes, so the pool is still full
+    assert hasher.stats()['pending'] == 1
+    with pytest.raises(HashingPoolSaturated):
+        hasher.hash('correct horse')
+    assert hasher.stats()['rejected'] == 1
+
+    assert wait_until_idle(hasher)
+    hasher.timeout = 10
+    assert hasher.check(hasher.hash('correct horse'), 'correct horse')
@@ -0,0 +1,74 @@
+import json
+import time
+
+import jwt
+import pytest
+
+from keys import KeyStore
+
+
+def sign(store, claims):
+    kid, private_key, algorithm = store.signing_key()
+    return jwt.encode(claims, private_key, algorithm=algorithm, headers={'kid': kid})
+
+
+def verify(jwks_body, token):
+    """What another service does with the published JWKS"""
+    kid = jwt.get_unverified_header(token)['kid']
+    jwk = {key['kid']: key for key in json.loads(jwks_body)['keys']}[kid]
+    return jwt.decode(token, jwt.PyJWK(jwk).key, algorithms=[jwk['alg']])
+
+
+@pytest.mark.parametrize('algorithm', ['EdDSA', 'RS256'])
+def test_tokens_verify_against_the_published_key_of_their_kid(tmp_path, algorithm):
+    store = KeyStore(str(tmp_path), algorithm=algorithm)
+    store.ensure_key()
+    token = sign(store, {'sub': 'alice'})
+
+    body, _ = store.jwks()
+    [jwk] = json.loads(body)['keys']
+    assert (jwk['kid'], jwk['alg'], jwk['use']) == (jwt.get_unverified_header(token)['kid'], algorithm, 'sig')
+    assert 'd' not in jwk  # only public halves are published
+    assert verify(body, token) == {'sub': 'alice'}
+
+
+def test_rotation_signs_with_the_new_key_and_still_verifies_old_tokens(tmp_path):
+    store = KeyStore(str(tmp_path))
+    store.ensure_key()
+    old_token = sign(store, {'sub': 'alice'})
+    _, old_etag = store.jwks()
+
+    time.sleep(1)  # kids sort by creation second
+    new_kid = store.rotate()
+    new_token = sign(store, {'sub': 'bob'})
+
+    body, etag = store.jwks()
+    assert etag != old_etag
+    assert jwt.get_unverified_header(new_token)['kid'] == new_kid
+    assert [key['kid'] for key in json.loads(body)['keys']][0] == new_kid
+    assert verify(body, old_token) == {'sub': 'alice'}
+    assert verify(body, new_token) == {'sub': 'bob'}
+
+
+def test_another_workers_rotation_is_picked_up(tmp_path):
+    worker_a = KeyStore(str(tmp_path), reload_interval=0)
+    worker_b = KeyStore(str(tmp_path), reload_interval=3600)
+    worker_a.ensure_key()
+    worker_b.ensure_key()
+
+    time.sleep(1)
+    kid = worker_a.rotate()
+    # An unknown kid forces a reload despite the interval
+    assert worker_b.public_key(kid) is not None
+
+
+def test_prune_keeps_the_signing_key(tmp_path):
+    store = KeyStore(str(tmp_path))
+    store.ensure_key()
+    time.sleep(1)
+    current = store.rotate()
+
+    removed = store.prune(max_age=0)
+    assert current not in removed and len(removed) == 1
+    assert store.kids() == [current]
+    assert store.public_key(removed[0]) is None
@@ -0,0 +1,66 @@
+import fakeredis
+import pytest
+import redis
+
+from rate_limit import SYNC_SCRIPT, HybridRedisStorage
+
+# limits keys end in <amount>/<multiples>/<granularity>
+SEARCH_KEY = 'LIMITER/10.0.0.1/search/100/1/minute'
+LOGIN_KEY = 'LIMITER/10.0.0.1/auth.login/5/1/minute'
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeRedis()
+
+
+def worker(redis_client):
+    # A long interval keeps the flush thread out of the way; tests flush by hand
+    storage = HybridRedisStorage('hybrid+redis://redis-cache:6379/0', sync_interval=60)
+    storage.redis = redis_client
+    storage._script = redis_client.register_script(SYNC_SCRIPT)
+    return storage
+
+
+def test_unsynced_hits_stay_below_the_allowance(redis_client):
+    workers = [worker(redis_client), worker(redis_client)]
+    allowance = 10  # 10% of 100
+
+    total = 0
+    for _ in range(60):
+        for storage in workers:
+            total += 1
+            assert storage.incr(SEARCH_KEY, 60) <= total
+            # Each worker holds back fewer hits than its allowance
+            assert int(redis_client.get(SEARCH_KEY)) >= total - len(workers) * (allowance - 1)
+
+    assert sum(storage.stats()['local_hits'] for storage in workers) > 0
+    for storage in workers:
+        storage.flush()
+    assert int(redis_client.get(SEARCH_KEY)) == total
+
+
+def test_small_limits_are_always_counted_in_redis(redis_client):
+    workers = [worker(redis_client), worker(redis_client)]
+
+    counts = [workers[hit % 2].incr(LOGIN_KEY, 60) for hit in range(6)]
+
+    assert counts == [1, 2, 3, 4, 5, 6]
+    assert all(storage.stats()['local_hits'] == 0 for storage in workers)
+
+
+def test_failed_sync_keeps_the_hits(redis_client):
+    storage = worker(redis_client)
+    storage.incr(SEARCH_KEY, 60)
+    storage.incr(SEARCH_KEY, 60)
+
+    def unreachable(**kwargs):
+        raise redis.ConnectionError('redis-cache is down')
+
+    real_script, storage._script = storage._script, unreachable
+    with pytest.raises(redis.ConnectionError):
+        storage.flush()
+    storage._script = real_script
+
+    storage.flush()
+    assert int(redis_client.get(SEARCH_KEY)) == 2
@@ -0,0 +1,67 @@
+import fakeredis
+import pytest
+
+from revocation import BLOCKLIST_PREFIX, BloomFilter, RevocationFilter
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+@pytest.fixture
+def revocations(redis_client, monkeypatch):
+    # The listener thread needs keyspace notifications; tests drive the filter directly
+    monkeypatch.setattr(RevocationFilter, 'ensure_started', lambda self: None)
+    return RevocationFilter(redis_client, capacity=100)
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add(f'jti-{i}')
+
+    assert all(f'jti-{i}' in bloom for i in range(1000))
+    false_positives = sum(f'other-{i}' in bloom for i in range(10000))
+    assert false_positives < 300
+
+
+def test_unsynced_filter_asks_redis(redis_client, revocations):
+    redis_client.setex(f'{BLOCKLIST_PREFIX}revoked', 60, 'true')
+
+    assert revocations.is_revoked('revoked')
+    assert not revocations.is_revoked('valid')
+    assert revocations.stats()['redis_checks'] == 2
+
+
+def test_synced_filter_answers_locally(redis_client, revocations):
+    redis_client.setex(f'{BLOCKLIST_PREFIX}revoked', 60, 'true')
+    revocations._resync()
+    revocations.healthy = True
+
+    assert revocations.is_revoked('revoked')
+    assert not revocations.is_revoked('valid')
+    stats = revocations.stats()
+    assert (stats['redis_checks'], stats['local_checks'], stats['revoked']) == (0, 2, 1)
+
+
+def test_revocation_made_during_a_resync_survives_it(redis_client, revocations, monkeypatch):
+    scan_iter = redis_client.scan_iter
+
+    def scan_while_revoking(*args, **kwargs):
+        keys = list(scan_iter(*args, **kwargs))
+        revocations.add('revoked-meanwhile', 60)
+        return iter(keys)
+
+    monkeypatch.setattr(redis_client, 'scan_iter', scan_while_revoking)
+    revocations._resync()
+    revocations.healthy = True
+
+    assert revocations.is_revoked('revoked-meanwhile')
+
+
+def test_expired_revocations_no_longer_match(revocations):
+    revocations.add('short-lived', -1)
+    revocations.healthy = True
+
+    assert not revocations.is_revoked('short-lived')
@@ -0,0 +1,52 @@
+import pytest
+from flask_jwt_extended import create_access_token, create_refresh_token, decode_token
+
+INTERNAL = {'X-Internal-Token': 'internal-secret'}
+
+
+@pytest.fixture
+def tokens(service):
+    with service.app.app_context():
+        access = create_access_token(identity='user-1', additional_claims={'username': 'alice'})
+        revoked = create_access_token(identity='user-2', additional_claims={'username': 'bob'})
+        refresh = create_refresh_token(identity='user-1')
+        service.redis_client.setex(f"blocklist:{decode_token(revoked)['jti']}", 3600, 'true')
+    return access, revoked, refresh
+
+
+def verify_batch(service, tokens, headers=INTERNAL):
+    return service.app.test_client().post('/auth/verify/batch', json={'tokens': tokens}, headers=headers)
+
+
+def test_only_internal_callers_may_verify_in_batches(service, tokens):
+    assert verify_batch(service, [tokens[0]], headers={}).status_code == 403
+    assert verify_batch(service, [tokens[0]], headers={'X-Internal-Token': 'guess'}).status_code == 403
+
+
+def test_results_keep_the_request_order(service, tokens):
+    access, revoked, refresh = tokens
+    resp = verify_batch(service, [access, 'garbage', revoked, refresh, access])
+
+    assert resp.status_code == 200
+    results = resp.get_json()['results']
+    assert [result['valid'] for result in results] == [True, False, False, False, True]
+    assert results[0]['user_id'] == 'user-1'
+    assert results[2]['error'] == 'Token has been revoked'
+    assert results[3]['error'] == 'Invalid token'  # refresh tokens are not access tokens
+
+
+def test_revocations_are_checked_in_one_mget(service, tokens, monkeypatch):
+    calls = []
+    mget = service.redis_client.mget
+    monkeypatch.setattr(service.redis_client, 'mget', lambda keys: calls.append(keys) or mget(keys))
+    monkeypatch.setattr(service.redis_client, 'get', lambda key: pytest.fail('per-token GET'))
+
+    verify_batch(service, [tokens[0], tokens[1], tokens[0]])
+    assert len(calls) == 1 and len(calls[0]) == 3
+
+
+def test_malformed_and_oversized_batches(service, tokens, monkeypatch):
+    assert verify_batch(service, 'not a list').status_code == 400
+    assert verify_batch(service, [1, 2]).status_code == 400
+    monkeypatch.setattr(service, 'VERIFY_BATCH_MAX', 2)
+    assert verify_batch(service, [tokens[0]] * 3).status_code == 413
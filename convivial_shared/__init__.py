@@ -0,0 +1,6 @@
+"""
+Code shared by auth-proxy, api-service and the SearXNG plugins and middleware
+docker-compose mounts this package into each of them, so Redis key names,
+event formats, scripts and retry policies are defined once instead of copied
+per service
+"""
@@ -0,0 +1,17 @@
+"""
+Connect retries for the pooled HTTP sessions
+auth-proxy's upstream clients and the SearXNG auth middleware retry failed
+connects with the same policy, defined here once.
+"""
+
+import random
+
+from urllib3.util.retry import Retry
+
+
+class JitteredRetry(Retry):
+    """urllib3 Retry with full jitter so reconnecting workers do not stampede"""
+
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff) if backoff else 0
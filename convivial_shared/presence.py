@@ -0,0 +1,79 @@
+"""
+Presence index shared by api-service and the searxng presence plugin
+Online users live in a sorted set scored by last heartbeat plus a hash of
+their status, so listing them is one script call however large the Redis
+keyspace is. plugins/convivial_presence.py writes both keys, api-service
+and the plugin read them.
+"""
+
+import json
+import time
+from typing import Dict, List
+
+import redis
+
+INDEX_KEY = 'presence_index'  # user_id -> last heartbeat (unix time)
+STATUS_KEY = 'presence_status'  # user_id -> JSON status
+TTL = 300  # seconds without a heartbeat before a user is offline
+
+# KEYS: index, status hash; ARGV: cutoff. Drops members that have not sent a
+# heartbeat since the cutoff, then returns (user_id, status) pairs.
+PRUNE_AND_READ = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', '(' .. ARGV[1])
+if #expired > 0 then
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', '(' .. ARGV[1])
+    redis.call('HDEL', KEYS[2], unpack(expired))
+end
+local members = redis.call('ZRANGEBYSCORE', KEYS[1], ARGV[1], '+inf')
+if #members == 0 then
+    return {}
+end
+local statuses = redis.call('HMGET', KEYS[2], unpack(members))
+local result = {}
+for i, member in ipairs(members) do
+    result[#result + 1] = member
+    result[#result + 1] = statuses[i]
+end
+return result
+"""
+
+
+def anonymize_query(query: str) -> str:
+    """Create a hint about search without revealing details"""
+    if len(query) < 5:
+        return "✨"
+
+    words = query.split()
+    if len(words) == 1:
+        return f"{query[0]}{'*' * (len(query) - 1)}"
+    else:
+        return f"{len(words)} words about {query[0]}..."
+
+
+class PresenceIndex:
+    """Reader and writer for the index; ``ttl`` seconds without a heartbeat means offline
+
+    ``redis_client`` must decode responses.
+    """
+
+    def __init__(self, redis_client: redis.Redis, ttl: int = TTL):
+        self.redis = redis_client
+        self.ttl = ttl
+        self._prune_and_read = redis_client.register_script(PRUNE_AND_READ)
+
+    def update(self, user_id: str, status: Dict):
+        """Record a heartbeat; status and heartbeat change together in one MULTI"""
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hset(STATUS_KEY, user_id, json.dumps(status))
+        pipe.zadd(INDEX_KEY, {user_id: time.time()})
+        pipe.execute()
+
+    def online(self) -> List[Dict]:
+        """Status of everyone seen within ``ttl``, most recent first"""
+        reply = self._prune_and_read(keys=[INDEX_KEY, STATUS_KEY], args=[time.time() - self.ttl])
+        users = []
+        for user_id, status in zip(reply[0::2], reply[1::2]):
+            if status:
+                users.append(dict(json.loads(status), user_id=user_id))
+        users.reverse()
+        return users
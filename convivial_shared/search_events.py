@@ -0,0 +1,153 @@
+"""
+Searches answered without SearXNG
+auth-proxy serves repeated searches from its result cache (cached, coalesced
+and fallback pages), so SearXNG and its post_search plugins never see them.
+The proxy appends one event per such search to a Redis stream in redis-cache;
+each convivial plugin reads the stream through its own consumer group and
+applies the same side effects it applies to the searches it sees directly.
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+SERVED_STREAM = 'search_served'
+# Roughly how many events the stream keeps for consumers that fall behind
+SERVED_STREAM_MAXLEN = 10000
+
+# Sent by auth-proxy with every upstream search it may cache. SearXNG plugins
+# keep the top results of that search under the key, so later events for the
+# same cached page can be handled without the page itself.
+SEARCH_KEY_HEADER = 'X-Convivial-Search-Key'
+RESULTS_PREFIX = 'search_results:'
+# Outlives the proxy's cache entries (freshness plus fallback, a day each at most)
+RESULTS_TTL = 2 * 86400
+RESULT_FIELDS = ('url', 'title', 'content', 'engine', 'img_src', 'thumbnail')
+
+
+def publish_served_search(redis_client: redis.Redis, user_id: str, username: str, query: str,
+                          mood: str = '', search_key: str = '', served_as: str = '') -> str:
+    """Announce a search answered from the proxy cache; returns the stream entry id"""
+    entry_id = redis_client.xadd(SERVED_STREAM, {
+        'user_id': user_id,
+        'username': username,
+        'query': query,
+        'mood': mood,
+        'search_key': search_key,
+        'served_as': served_as
+    }, maxlen=SERVED_STREAM_MAXLEN, approximate=True)
+    return entry_id.decode('ascii') if isinstance(entry_id, bytes) else entry_id
+
+
+def stash_results(redis_client: redis.Redis, search_key: str, results: List[Dict]):
+    """Keep the top ``results`` of a search for events that refer to it by key"""
+    kept = [{field: result.get(field) for field in RESULT_FIELDS if result.get(field)} for result in results]
+    redis_client.set(RESULTS_PREFIX + search_key, json.dumps(kept), ex=RESULTS_TTL)
+
+
+def load_results(redis_client: redis.Redis, search_key: str) -> List[Dict]:
+    """Results stashed for ``search_key``, or an empty list"""
+    if not search_key:
+        return []
+    raw = redis_client.get(RESULTS_PREFIX + search_key)
+    return json.loads(raw) if raw else []
+
+
+def record_search_session(cursor, user_id: str, query: str, mood: Optional[str] = None) -> List[Dict]:
+    """Store a search session and any collisions it makes; returns the friends it collided with
+
+    A collision is another user's session for the same query within the
+    last hour. ``cursor`` must return rows as dicts (RealDictCursor); the
+    caller commits.
+    """
+    cursor.execute("""
+        INSERT INTO search_sessions (user_id, query, mood)
+        VALUES (%s, %s, %s)
+        RETURNING id
+    """, (user_id, query, mood))
+    cursor.fetchone()
+
+    cursor.execute("""
+        SELECT DISTINCT ss.user_id, u.username
+        FROM search_sessions ss
+        JOIN users u ON u.id = ss.user_id
+        WHERE ss.user_id != %s
+        AND ss.query = %s
+        AND ss.session_start > NOW() - INTERVAL '1 hour'
+    """, (user_id, query))
+    collisions = cursor.fetchall()
+
+    for collision in collisions:
+        cursor.execute("""
+            INSERT INTO collisions (user1_id, user2_id, query, collision_type)
+            VALUES (%s, %s, %s, 'simultaneous')
+        """, (user_id, collision['user_id'], query))
+    return collisions
+
+
+def _text(value) -> str:
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def ensure_group(redis_client: redis.Redis, group: str):
+    """Create ``group`` on the stream (starting with new events) unless it exists"""
+    try:
+        redis_client.xgroup_create(SERVED_STREAM, group, id='$', mkstream=True)
+    except redis.ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+def read_served_searches(redis_client: redis.Redis, group: str, consumer: str,
+                         handler: Callable[[Dict], None], count: int = 50, block_ms: int = 5000) -> int:
+    """Hand up to ``count`` new events of ``group`` to ``handler``; returns how many were read
+
+    Events are acknowledged once handled, failed or not, so a broken event
+    is logged once instead of being retried forever.
+    """
+    reply = redis_client.xreadgroup(group, consumer, {SERVED_STREAM: '>'}, count=count, block=block_ms)
+    handled = 0
+    for _, entries in reply or ():
+        for entry_id, fields in entries:
+            event = {_text(key): _text(value) for key, value in fields.items()}
+            try:
+                handler(event)
+            except Exception as e:
+                logger.error(f"Served search {_text(entry_id)} not processed: {e}")
+            redis_client.xack(SERVED_STREAM, group, entry_id)
+            handled += 1
+    return handled
+
+
+def start_consumer(redis_client: redis.Redis, group: str, handler: Callable[[Dict], None]) -> threading.Thread:
+    """Follow the stream in a daemon thread for the life of this process
+
+    Each process is one consumer of ``group``, so every event is handled by
+    exactly one SearXNG worker per plugin.
+    """
+    consumer = f"{socket.gethostname()}-{os.getpid()}"
+
+    def _run():
+        backoff = 1
+        while True:
+            try:
+                ensure_group(redis_client, group)
+                while True:
+                    read_served_searches(redis_client, group, consumer, handler)
+                    backoff = 1
+            except redis.RedisError as e:
+                logger.warning(f"Served search stream unavailable: {e}")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    thread = threading.Thread(target=_run, name=f'{group}-served-searches', daemon=True)
+    thread.start()
+    return thread
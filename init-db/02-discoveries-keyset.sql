@@ -0,0 +1,11 @@
+-- Keyset pagination for the api-service discovery listing (GET /discoveries/)
+-- Pages are read newest first on (discovered_at, id), so one index scan
+-- serves any page from its cursor instead of skipping OFFSET rows.
+-- Safe to run by hand on an existing database.
+
+CREATE INDEX IF NOT EXISTS idx_discoveries_discovered_at_id
+    ON discoveries (discovered_at DESC, id DESC);
+
+-- The composite index also answers max(discovered_at) (the listing ETag)
+-- and every query the single-column index served
+DROP INDEX IF EXISTS idx_discoveries_discovered_at;
@@ -0,0 +1,106 @@
+-- Item counters on collections
+-- collections.item_count and collections.last_added_at are kept in step with
+-- collection_items by a trigger, in the same transaction as the change, so
+-- listing collections never has to aggregate their items.
+-- reconcile_collection_counts() repairs any drift (api-service runs it
+-- periodically). Safe to run by hand on an existing database.
+
+ALTER TABLE collections ADD COLUMN IF NOT EXISTS item_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE collections ADD COLUMN IF NOT EXISTS last_added_at TIMESTAMP WITH TIME ZONE;
+
+-- Newest item per collection, for recomputing last_added_at after a removal
+CREATE INDEX IF NOT EXISTS idx_collection_items_collection_added
+    ON collection_items (collection_id, added_at DESC);
+-- The listing reads collections newest first
+CREATE INDEX IF NOT EXISTS idx_collections_created_at ON collections (created_at DESC);
+
+CREATE OR REPLACE FUNCTION collection_items_count_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE collections SET
+            item_count = GREATEST(item_count - 1, 0),
+            last_added_at = (
+                SELECT max(added_at) FROM collection_items WHERE collection_id = OLD.collection_id
+            )
+        WHERE id = OLD.collection_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE collections SET
+            item_count = item_count + 1,
+            last_added_at = GREATEST(last_added_at, NEW.added_at)
+        WHERE id = NEW.collection_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS collection_items_count ON collection_items;
+CREATE TRIGGER collection_items_count
+    AFTER INSERT OR DELETE OR UPDATE OF collection_id, added_at ON collection_items
+    FOR EACH ROW EXECUTE FUNCTION collection_items_count_changed();
+
+-- Recount one batch of collections: the batch_size collections after after_id
+-- in id order. Counters are compared without locks first, and only a
+-- collection whose counters disagree is locked and recounted, so an insert
+-- racing the recount either is counted here or applies its own +1
+-- afterwards, never both or neither. Returns how many were corrected and the
+-- last id looked at (NULL past the end); callers commit between batches so no
+-- lock is held for longer than one batch.
+CREATE OR REPLACE FUNCTION reconcile_collection_counts(after_id UUID DEFAULT NULL, batch_size INTEGER DEFAULT 100)
+RETURNS TABLE (corrected INTEGER, last_id UUID) AS $$
+DECLARE
+    candidate RECORD;
+    stored RECORD;
+    actual_count INTEGER;
+    actual_last TIMESTAMP WITH TIME ZONE;
+BEGIN
+    corrected := 0;
+    last_id := NULL;
+    FOR candidate IN
+        SELECT c.id, c.item_count, c.last_added_at, items.item_count AS actual_count,
+               items.last_added_at AS actual_last
+        FROM (
+            SELECT id, item_count, last_added_at FROM collections
+            WHERE after_id IS NULL OR id > after_id
+            ORDER BY id
+            LIMIT batch_size
+        ) c
+        CROSS JOIN LATERAL (
+            SELECT count(*)::INTEGER AS item_count, max(added_at) AS last_added_at
+            FROM collection_items WHERE collection_id = c.id
+        ) items
+        ORDER BY c.id
+    LOOP
+        last_id := candidate.id;
+        CONTINUE WHEN candidate.item_count IS NOT DISTINCT FROM candidate.actual_count
+                  AND candidate.last_added_at IS NOT DISTINCT FROM candidate.actual_last;
+        -- The unlocked figures may be stale: lock the row, then count again
+        SELECT item_count, last_added_at INTO stored FROM collections WHERE id = candidate.id FOR UPDATE;
+        CONTINUE WHEN NOT FOUND;
+        SELECT count(*)::INTEGER, max(added_at) INTO actual_count, actual_last
+        FROM collection_items WHERE collection_id = candidate.id;
+        IF stored.item_count IS DISTINCT FROM actual_count
+           OR stored.last_added_at IS DISTINCT FROM actual_last THEN
+            UPDATE collections SET item_count = actual_count, last_added_at = actual_last
+            WHERE id = candidate.id;
+            corrected := corrected + 1;
+        END IF;
+    END LOOP;
+    RETURN NEXT;
+END;
+$$ language 'plpgsql';
+
+-- Backfill collections created before the trigger existed
+DO $$
+DECLARE
+    batch RECORD;
+    cursor_id UUID := NULL;
+BEGIN
+    LOOP
+        SELECT * INTO batch FROM reconcile_collection_counts(cursor_id);
+        EXIT WHEN batch.last_id IS NULL;
+        cursor_id := batch.last_id;
+    END LOOP;
+END;
+$$;
@@ -0,0 +1,26 @@
+-- Direct-to-storage uploads
+-- api-service hands out presigned MinIO URLs and records each upload here;
+-- a row is 'pending' until the client confirms it, then 'complete' (or
+-- 'rejected' if the stored object breaks the size limit). Clients upload to
+-- staging/<object_key>; only the copy made at completion lives at object_key.
+-- Pending rows that are never confirmed become 'expired' and their parts are
+-- discarded.
+-- Safe to run by hand on an existing database.
+
+CREATE TABLE IF NOT EXISTS file_uploads (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    user_id VARCHAR(36) NOT NULL, -- auth-service user id (JWT subject)
+    object_key TEXT NOT NULL UNIQUE,
+    file_type VARCHAR(50) NOT NULL, -- avatar, voice_note, general, ...
+    content_type VARCHAR(100),
+    declared_size BIGINT,
+    size BIGINT,
+    etag TEXT,
+    multipart_upload_id TEXT,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending', -- pending, complete, rejected, expired
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    completed_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX IF NOT EXISTS idx_file_uploads_user_id ON file_uploads(user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_file_uploads_pending ON file_uploads(created_at) WHERE status = 'pending';
@@ -0,0 +1,43 @@
+-- Change counter for the api-service discovery listing (GET /discoveries/)
+-- max(discovered_at) only moves on inserts, so deleting a discovery (also by
+-- ON DELETE CASCADE from users), editing its annotations or gift fields, or
+-- renaming its author would leave the listing's ETag unchanged. Every such
+-- change bumps discovery_changes.version instead, once per transaction.
+-- The triggers are deferred to commit, so the version row is locked only
+-- while the transaction commits and readers see the new version together
+-- with the rows that caused it. Safe to run by hand on an existing database.
+
+CREATE TABLE IF NOT EXISTS discovery_changes (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL DEFAULT 0,
+    changed_in xid8
+);
+
+INSERT INTO discovery_changes (id) VALUES (TRUE) ON CONFLICT (id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_discovery_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- Later rows of the same transaction see its own bump and skip the update
+    UPDATE discovery_changes SET
+        version = version + 1,
+        changed_in = pg_current_xact_id()
+    WHERE changed_in IS DISTINCT FROM pg_current_xact_id();
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS discoveries_version ON discoveries;
+CREATE CONSTRAINT TRIGGER discoveries_version
+    AFTER INSERT OR UPDATE OR DELETE ON discoveries
+    DEFERRABLE INITIALLY DEFERRED
+    FOR EACH ROW EXECUTE FUNCTION bump_discovery_version();
+
+-- Listed discoveries carry their author's names
+DROP TRIGGER IF EXISTS users_discovery_version ON users;
+CREATE CONSTRAINT TRIGGER users_discovery_version
+    AFTER UPDATE OF username, display_name ON users
+    DEFERRABLE INITIALLY DEFERRED
+    FOR EACH ROW
+    WHEN (OLD.username IS DISTINCT FROM NEW.username OR OLD.display_name IS DISTINCT FROM NEW.display_name)
+    EXECUTE FUNCTION bump_discovery_version();
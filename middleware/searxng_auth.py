@@ -6,14 +6,91 @@ Integrates JWT authentication with SearXNG without modifying core
 import os
 import json
 from functools import wraps
+from http.cookiejar import DefaultCookiePolicy
 from flask import request, redirect, url_for, session, g
 import requests
+from requests.adapters import HTTPAdapter
 from urllib.parse import quote_plus
 
+from convivial_shared.http_retry import JitteredRetry
+
+try:
+    import jwt
+except ImportError:  # optional: without PyJWT every check goes to /auth/verify
+    jwt = None
+
+try:
+    import redis
+except ImportError:  # optional: without redis, local checks cannot see revocations
+    redis = None
+
 # Configuration
 AUTH_SERVICE_URL = os.environ.get('AUTH_SERVICE_URL', 'http://auth-service:5000')
 API_SERVICE_URL = os.environ.get('API_SERVICE_URL', 'http://api-service:5001')
 
+# Upstream HTTP settings
+AUTH_SERVICE_POOL_SIZE = int(os.environ.get('AUTH_SERVICE_POOL_SIZE', '10'))
+AUTH_SERVICE_TIMEOUT = (
+    float(os.environ.get('AUTH_SERVICE_CONNECT_TIMEOUT', '2')),
+    float(os.environ.get('AUTH_SERVICE_TIMEOUT', '10'))
+)
+AUTH_SERVICE_RETRIES = int(os.environ.get('AUTH_SERVICE_RETRIES', '2'))
+
+def _build_http_session(pool_size, retries):
+    """Keep-alive session shared by every request in this worker"""
+    http = requests.Session()
+    # Shared across users: never replay cookies set by an upstream
+    http.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=pool_size,
+        max_retries=JitteredRetry(
+            total=retries, connect=retries, read=0, status=0,
+            backoff_factor=0.1, raise_on_status=False
+        )
+    )
+    http.mount('http://', adapter)
+    http.mount('https://', adapter)
+    return http
+
+auth_http = _build_http_session(AUTH_SERVICE_POOL_SIZE, AUTH_SERVICE_RETRIES)
+
+# Token verification: 'local' checks signatures against auth-service's JWKS
+# and the blocklist in redis-cache, 'remote' calls /auth/verify every time
+AUTH_VERIFY_MODE = os.environ.get('AUTH_VERIFY_MODE', 'local' if jwt and redis else 'remote')
+AUTH_JWKS_URL = os.environ.get('AUTH_JWKS_URL', f'{AUTH_SERVICE_URL}/.well-known/jwks.json')
+AUTH_REDIS_URL = os.environ.get('AUTH_REDIS_URL', 'redis://redis-cache:6379/0')
+JWT_SECRET = os.environ.get('JWT_SECRET')  # only for HS256 tokens issued before key rotation
+
+_jwks_client = None
+_blocklist = None
+if AUTH_VERIFY_MODE == 'local' and jwt and redis:
+    _jwks_client = jwt.PyJWKClient(AUTH_JWKS_URL, cache_keys=True, lifespan=300, timeout=5)
+    _blocklist = redis.Redis.from_url(AUTH_REDIS_URL, socket_timeout=1)
+
+def _verify_locally(token):
+    """True/False if the token could be checked here, None to ask auth-service instead"""
+    if _jwks_client is None:
+        return None
+    try:
+        header = jwt.get_unverified_header(token)
+        if header.get('kid'):
+            signing_key = _jwks_client.get_signing_key(header['kid'])
+            # auth-service only publishes Ed25519 (EdDSA) and RSA (RS256) keys
+            key, algorithms = signing_key.key, ['EdDSA' if signing_key.key_type == 'OKP' else 'RS256']
+        elif JWT_SECRET and header.get('alg') == 'HS256':
+            key, algorithms = JWT_SECRET, ['HS256']
+        else:
+            return None
+        claims = jwt.decode(token, key, algorithms=algorithms, options={'require': ['exp', 'sub', 'jti']})
+        if claims.get('type') != 'access':
+            return False
+        return _blocklist.get(f"blocklist:{claims['jti']}") is None
+    except jwt.InvalidTokenError:
+        return False
+    except (jwt.PyJWKClientError, redis.RedisError):
+        return None
+
 class ConvivialAuthMiddleware:
     """Middleware to add authentication to SearXNG"""
     
@@ -90,10 +167,10 @@ class ConvivialAuthMiddleware:
             
             # Call auth service
             try:
-                response = requests.post(f'{AUTH_SERVICE_URL}/auth/login', json={
+                response = auth_http.post(f'{AUTH_SERVICE_URL}/auth/login', json={
                     'username': username,
                     'password': password
-                })
+                }, timeout=AUTH_SERVICE_TIMEOUT)
                 
                 if response.status_code == 200:
                     data = response.json()
@@ -184,7 +261,8 @@ class ConvivialAuthMiddleware:
             }
             
             try:
-                response = requests.post(f'{AUTH_SERVICE_URL}/auth/register', json=data)
+                response = auth_http.post(f'{AUTH_SERVICE_URL}/auth/register', json=data,
+                                          timeout=AUTH_SERVICE_TIMEOUT)
                 
                 if response.status_code == 201:
                     # Auto-login after registration
@@ -208,8 +286,10 @@ class ConvivialAuthMiddleware:
             token = session.get('access_token')
             if token:
                 try:
-                    requests.post(f'{AUTH_SERVICE_URL}/auth/logout', 
-                                headers={'Authorization': f'Bearer {token}'})
+                    auth_http.post(f'{AUTH_SERVICE_URL}/auth/logout',
+                                   headers={'Authorization': f'Bearer {token}'},
+                                   json={'refresh_token': session.get('refresh_token')},
+                                   timeout=AUTH_SERVICE_TIMEOUT)
                 except:
                     pass
             
@@ -234,10 +314,20 @@ class ConvivialAuthMiddleware:
             if not token:
                 return redirect(url_for('login_page'))
             
-            # Verify token
+            # Verify token, locally when possible
+            valid = _verify_locally(token)
+            if valid is not None:
+                if valid:
+                    g.user = session.get('user')
+                    g.token = token
+                    return
+                session.clear()
+                return redirect(url_for('login_page'))
+            
             try:
-                response = requests.get(f'{AUTH_SERVICE_URL}/auth/verify',
-                                      headers={'Authorization': f'Bearer {token}'})
+                response = auth_http.get(f'{AUTH_SERVICE_URL}/auth/verify',
+                                         headers={'Authorization': f'Bearer {token}'},
+                                         timeout=AUTH_SERVICE_TIMEOUT)
                 
                 if response.status_code == 200:
                     g.user = session.get('user')
@@ -3,9 +3,9 @@ Convivial Presence Plugin for Searxng
 Tracks friend presence and search activity in a warm, ambient way
 """
 
-import asyncio
 import json
 import logging
+import threading
 from datetime import datetime, timezone
 from typing import Dict, Optional
 import redis
@@ -14,6 +14,9 @@ from psycopg2.extras import RealDictCursor
 from searx import settings
 from searx.plugins import logger
 
+from convivial_shared.presence import PresenceIndex, anonymize_query
+from convivial_shared.search_events import record_search_session, start_consumer
+
 name = "Convivial Presence"
 description = "Ambient awareness of friends' search journeys"
 default_on = True
@@ -30,10 +33,13 @@ preferences = {
 redis_cache = None
 redis_pubsub = None
 pg_pool = None
+presence_index = None
+# The request threads and the served-search consumer share one connection
+pg_lock = threading.Lock()
 
 def init(app):
     """Initialize plugin connections"""
-    global redis_cache, redis_pubsub, pg_pool
+    global redis_cache, redis_pubsub, pg_pool, presence_index
     
     try:
         # Cache instance for search data
@@ -42,6 +48,8 @@ def init(app):
             port=6379,
             decode_responses=True
         )
+        # Online friends, shared with api-service (see convivial_shared/presence.py)
+        presence_index = PresenceIndex(redis_cache)
         
         # Pub/Sub instance for real-time
         redis_pubsub = redis.Redis(
@@ -60,6 +68,10 @@ def init(app):
             cursor_factory=RealDictCursor
         )
         
+        # Searches auth-proxy answered from its cache never reach on_request
+        # or post_search; they arrive on the served-search stream instead
+        start_consumer(redis_cache, 'convivial_presence', _on_served_search)
+        
         logger.info("Convivial Presence plugin initialized")
         
     except Exception as e:
@@ -67,117 +79,95 @@ def init(app):
 
 def on_request(request, search):
     """Pre-search hook: broadcast search intent"""
-    if not redis_pubsub:
+    if not redis_pubsub or is_speculative(request):
         return True
         
     user = get_current_user(request)
     if not user or user.get('is_ghost'):
         return True
     
-    try:
-        # Non-blocking broadcast
-        asyncio.create_task(_broadcast_search_intent(user, search))
-    except Exception as e:
-        logger.error(f"Presence broadcast error: {e}")
+    # Two quick Redis calls (a publish and one MULTI); SearXNG hooks run
+    # without an event loop, so this is done inline rather than as a task
+    _broadcast_search_intent(user, search.query)
     
     return True
 
-async def _broadcast_search_intent(user: Dict, search: Dict):
+def _broadcast_search_intent(user: Dict, query: str):
     """Broadcast search activity to friends"""
     try:
         presence_data = {
             'user_id': user['id'],
             'username': user['username'],
             'mood': user.get('current_mood', ''),
-            'query_hint': _anonymize_query(search.query) if search.query else '',
+            'query_hint': anonymize_query(query) if query else '',
             'timestamp': datetime.now(timezone.utc).isoformat(),
             'event': 'search_started'
         }
         
         # Publish to presence channel
-        await redis_pubsub.publish('presence:search', json.dumps(presence_data))
+        redis_pubsub.publish('presence:search', json.dumps(presence_data))
         
         # Update last seen
-        await redis_cache.setex(
-            f"presence:{user['id']}",
-            300,  # 5 minute TTL
-            json.dumps({
-                'status': 'searching',
-                'mood': user.get('current_mood', ''),
-                'last_seen': presence_data['timestamp']
-            })
-        )
+        presence_index.update(user['id'], {
+            'username': user['username'],
+            'status': 'searching',
+            'mood': user.get('current_mood', ''),
+            'last_seen': presence_data['timestamp']
+        })
         
     except Exception as e:
         logger.error(f"Failed to broadcast presence: {e}")
 
 def post_search(request, search):
     """Post-search hook: track discoveries and detect collisions"""
-    if not pg_pool:
+    if not pg_pool or is_speculative(request):
         return True
         
     user = get_current_user(request)
     if not user:
         return True
     
-    try:
-        # Process results asynchronously
-        asyncio.create_task(_process_search_results(user, search))
-    except Exception as e:
-        logger.error(f"Post-search processing error: {e}")
+    # SearXNG runs hooks without an event loop, so record inline like the stream consumer
+    _record_search(user, search.search_query.query)
     
     return True
 
-async def _process_search_results(user: Dict, search: Dict):
-    """Store discoveries and check for collisions"""
-    try:
-        with pg_pool.cursor() as cursor:
-            # Record search session
-            cursor.execute("""
-                INSERT INTO search_sessions (user_id, query, mood)
-                VALUES (%s, %s, %s)
-                RETURNING id
-            """, (user['id'], search.query, user.get('current_mood')))
-            
-            session_id = cursor.fetchone()['id']
-            
-            # Check for collisions
-            cursor.execute("""
-                SELECT DISTINCT ss.user_id, u.username
-                FROM search_sessions ss
-                JOIN users u ON u.id = ss.user_id
-                WHERE ss.user_id != %s
-                AND ss.query = %s
-                AND ss.session_start > NOW() - INTERVAL '1 hour'
-            """, (user['id'], search.query))
-            
-            collisions = cursor.fetchall()
-            
-            if collisions:
-                # Record collision event
-                for collision in collisions:
-                    cursor.execute("""
-                        INSERT INTO collisions (user1_id, user2_id, query, collision_type)
-                        VALUES (%s, %s, %s, 'simultaneous')
-                    """, (user['id'], collision['user_id'], search.query))
-                
-                # Broadcast collision event
-                collision_event = {
-                    'event': 'collision_detected',
-                    'users': [user['username']] + [c['username'] for c in collisions],
-                    'query': search.query,
-                    'type': 'simultaneous',
-                    'timestamp': datetime.now(timezone.utc).isoformat()
-                }
-                
-                await redis_pubsub.publish('presence:collisions', json.dumps(collision_event))
-            
+def _record_search(user: Dict, query: str):
+    """Record the search session and broadcast any collision it makes"""
+    with pg_lock:
+        try:
+            with pg_pool.cursor() as cursor:
+                collisions = record_search_session(cursor, user['id'], query, user.get('current_mood'))
             pg_pool.commit()
-            
-    except Exception as e:
-        logger.error(f"Failed to process search results: {e}")
-        if pg_pool:
+        except Exception as e:
+            logger.error(f"Failed to process search results: {e}")
             pg_pool.rollback()
+            return
+    
+    if collisions:
+        # Broadcast collision event
+        collision_event = {
+            'event': 'collision_detected',
+            'users': [user['username']] + [c['username'] for c in collisions],
+            'query': query,
+            'type': 'simultaneous',
+            'timestamp': datetime.now(timezone.utc).isoformat()
+        }
+        try:
+            redis_pubsub.publish('presence:collisions', json.dumps(collision_event))
+        except Exception as e:
+            logger.error(f"Failed to broadcast collision: {e}")
+
+def _on_served_search(event: Dict):
+    """A search auth-proxy answered from its cache: same effects as one SearXNG ran"""
+    user = {
+        'id': event['user_id'],
+        'username': event['username'],
+        'current_mood': event.get('mood', '')
+    }
+    _broadcast_search_intent(user, event['query'])
+    if pg_pool:
+        _record_search(user, event['query'])
 
 def get_current_user(request) -> Optional[Dict]:
     """Get current user from session"""
@@ -190,30 +180,18 @@ def get_current_user(request) -> Optional[Dict]:
         'is_ghost': False
     }
 
-def _anonymize_query(query: str) -> str:
-    """Create a hint about search without revealing details"""
-    if len(query) < 5:
-        return "✨"
-    
-    words = query.split()
-    if len(words) == 1:
-        return f"{query[0]}{'*' * (len(query) - 1)}"
-    else:
-        return f"{len(words)} words about {query[0]}..."
+def is_speculative(request) -> bool:
+    """True for prefetches and cache refreshes sent by auth-proxy, which nobody asked for"""
+    return request.headers.get('Sec-Purpose', '').startswith('prefetch')
 
 # WebSocket integration points
 def get_active_friends():
     """Get currently active friends for UI"""
-    if not redis_cache:
+    if not presence_index:
         return []
     
     try:
-        friends = []
-        for key in redis_cache.scan_iter("presence:*"):
-            data = redis_cache.get(key)
-            if data:
-                friends.append(json.loads(data))
-        return friends
+        return presence_index.online()  # most recently seen first
     except Exception as e:
         logger.error(f"Failed to get active friends: {e}")
         return []
\ No newline at end of file
@@ -3,9 +3,9 @@ Discovery Feed Plugin for Searxng
 Real-time feed of friend discoveries with social features
 """
 
-import asyncio
 import json
 import logging
+import threading
 from datetime import datetime, timezone, timedelta
 from typing import Dict, List, Optional
 import redis
@@ -14,6 +14,8 @@ from psycopg2.extras import RealDictCursor
 from searx import settings
 from searx.plugins import logger
 
+from convivial_shared.search_events import SEARCH_KEY_HEADER, load_results, stash_results, start_consumer
+
 name = "Discovery Feed"
 description = "Share and see friend discoveries in real-time"
 default_on = True
@@ -30,6 +32,8 @@ preferences = {
 redis_cache = None
 redis_pubsub = None
 pg_pool = None
+# The request threads and the served-search consumer share one connection
+pg_lock = threading.Lock()
 
 def init(app):
     """Initialize plugin connections"""
@@ -57,6 +61,9 @@ def init(app):
             cursor_factory=RealDictCursor
         )
         
+        # Searches auth-proxy answered from its cache arrive on the served-search stream
+        start_consumer(redis_cache, 'discovery_feed', _on_served_search)
+        
         logger.info("Discovery Feed plugin initialized")
         
     except Exception as e:
@@ -64,27 +71,36 @@ def init(app):
 
 def post_search(request, search):
     """Track interesting discoveries after search"""
-    if not redis_pubsub or not pg_pool:
+    # Kept even for speculative fetches: the proxy may serve this page later
+    search_key = request.headers.get(SEARCH_KEY_HEADER)
+    if search_key and redis_cache:
+        try:
+            stash_results(redis_cache, search_key, search.result_container.results[:5])
+        except Exception as e:
+            logger.error(f"Failed to keep results for served searches: {e}")
+    
+    if not redis_pubsub or not pg_pool or is_speculative(request):
         return True
         
     user = get_current_user(request)
     if not user or not user.get('share_discoveries', True):
         return True
     
-    try:
-        # Process discoveries asynchronously
-        asyncio.create_task(_process_discoveries(user, search))
-    except Exception as e:
-        logger.error(f"Discovery processing error: {e}")
+    # SearXNG runs hooks without an event loop, so share inline like the stream consumer
+    _share_discoveries(user, search.search_query.query, search.result_container.results[:5])
     
     return True
 
-async def _process_discoveries(user: Dict, search: Dict):
-    """Extract and share interesting discoveries"""
+def _on_served_search(event: Dict):
+    """A search auth-proxy answered from its cache: share discoveries from its kept results"""
+    results = load_results(redis_cache, event.get('search_key', ''))
+    if results and pg_pool:
+        user = {'id': event['user_id'], 'username': event['username'], 'share_discoveries': True}
+        _share_discoveries(user, event['query'], results)
+
+def _share_discoveries(user: Dict, query: str, results: List[Dict]):
+    """Store and announce the results worth sharing"""
     try:
-        results = search.result_container.results[:5]  # Top 5 results
-        query = search.search_query.query
-        
         # Check for gift keywords
         gift_keywords = settings.get('convivial', {}).get('auto_gift_keywords', [])
         is_gift_worthy = any(kw.lower() in query.lower() for kw in gift_keywords)
@@ -112,20 +128,21 @@ async def _process_discoveries(user: Dict, search: Dict):
                 discoveries.append(discovery)
                 
                 # Store in database
-                with pg_pool.cursor() as cursor:
-                    cursor.execute("""
-                        INSERT INTO discoveries 
-                        (user_id, query, result_url, result_title, result_snippet, engine, result_data)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s)
-                        RETURNING id
-                    """, (
-                        user['id'], query, discovery['url'], 
-                        discovery['title'], discovery['snippet'], 
-                        discovery['engine'], json.dumps({'score': score})
-                    ))
-                    
-                    discovery['id'] = cursor.fetchone()['id']
-                    pg_pool.commit()
+                with pg_lock:
+                    with pg_pool.cursor() as cursor:
+                        cursor.execute("""
+                            INSERT INTO discoveries 
+                            (user_id, query, result_url, result_title, result_snippet, engine, result_data)
+                            VALUES (%s, %s, %s, %s, %s, %s, %s)
+                            RETURNING id
+                        """, (
+                            user['id'], query, discovery['url'], 
+                            discovery['title'], discovery['snippet'], 
+                            discovery['engine'], json.dumps({'score': score})
+                        ))
+                        
+                        discovery['id'] = cursor.fetchone()['id']
+                        pg_pool.commit()
         
         if discoveries:
             # Update feed cache
@@ -142,7 +159,7 @@ async def _process_discoveries(user: Dict, search: Dict):
             redis_cache.zremrangebyrank(feed_key, 0, -101)  # Keep last 100
             
             # Publish to real-time feed
-            await redis_pubsub.publish(
+            redis_pubsub.publish(
                 'discovery_feed:new',
                 json.dumps({
                     'user': user['username'],
@@ -153,12 +170,13 @@ async def _process_discoveries(user: Dict, search: Dict):
             
             # Check for gift opportunities
             if is_gift_worthy and len(discoveries) > 0:
-                await _suggest_gift(user, discoveries[0])
+                _suggest_gift(user, discoveries[0])
                 
     except Exception as e:
         logger.error(f"Failed to process discoveries: {e}")
         if pg_pool:
-            pg_pool.rollback()
+            with pg_lock:
+                pg_pool.rollback()
 
 def _calculate_interest_score(result: Dict, query: str) -> float:
     """Calculate how interesting/shareworthy a result is"""
@@ -194,7 +212,7 @@ def _calculate_interest_score(result: Dict, query: str) -> float:
     
     return min(score, 1.0)
 
-async def _suggest_gift(user: Dict, discovery: Dict):
+def _suggest_gift(user: Dict, discovery: Dict):
     """Suggest gifting a discovery to a friend"""
     try:
         # Find friends who might enjoy this
@@ -235,7 +253,7 @@ async def _suggest_gift(user: Dict, discovery: Dict):
                 )
                 
                 # Notify via WebSocket
-                await redis_pubsub.publish(
+                redis_pubsub.publish(
                     'gift:suggestion',
                     json.dumps(suggestion)
                 )
@@ -355,6 +373,10 @@ def get_current_user(request) -> Optional[Dict]:
         'share_discoveries': True
     }
 
+def is_speculative(request) -> bool:
+    """True for prefetches and cache refreshes sent by auth-proxy, which nobody asked for"""
+    return request.headers.get('Sec-Purpose', '').startswith('prefetch')
+
 # Template helper functions for UI integration
 def get_feed_html():
     """Generate HTML for discovery feed widget"""
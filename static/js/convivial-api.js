@@ -70,7 +70,7 @@ class ConvivialAPI {
 
     async logout() {
         try {
-            await this.apiCall('/auth/logout', 'POST');
+            await this.apiCall('/auth/logout', 'POST', { refresh_token: this.refreshToken });
             this.token = null;
             this.refreshToken = null;
             localStorage.clear();
@@ -160,25 +160,42 @@ class ConvivialAPI {
         return this.apiCall('/social/morning-coffee');
     }
 
-    // File upload
+    // File upload: the bytes go straight to storage, the API only signs and records
     async uploadFile(file, type = 'general') {
-        const formData = new FormData();
-        formData.append('file', file);
-        formData.append('type', type);
-
-        const response = await fetch(`${this.apiBase}/files/upload`, {
-            method: 'POST',
-            headers: {
-                'Authorization': `Bearer ${this.token}`
-            },
-            body: formData
+        const upload = await this.apiCall('/files/uploads', 'POST', {
+            filename: file.name,
+            content_type: file.type || 'application/octet-stream',
+            size: file.size,
+            type
         });
 
-        if (!response.ok) {
-            throw new Error('Upload failed');
+        let completion = {};
+        if (upload.method === 'PUT') {
+            const response = await fetch(upload.url, {
+                method: 'PUT',
+                headers: upload.headers,
+                body: file
+            });
+            if (!response.ok) {
+                throw new Error('Upload failed');
+            }
+        } else {
+            const parts = [];
+            for (const part of upload.parts) {
+                const start = (part.part_number - 1) * upload.part_size;
+                const response = await fetch(part.url, {
+                    method: 'PUT',
+                    body: file.slice(start, start + upload.part_size)
+                });
+                if (!response.ok) {
+                    throw new Error('Upload failed');
+                }
+                parts.push({ part_number: part.part_number, etag: response.headers.get('ETag') });
+            }
+            completion = { parts };
         }
 
-        return response.json();
+        return this.apiCall(`/files/uploads/${upload.upload_id}/complete`, 'POST', completion);
     }
 
     // WebSocket connection
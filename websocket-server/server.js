@@ -9,6 +9,7 @@ const { Server } = require('socket.io');
 const { createAdapter } = require('@socket.io/redis-adapter');
 const { createClient } = require('redis');
 const jwt = require('jsonwebtoken');
+const { createRemoteJWKSet, decodeProtectedHeader, jwtVerify } = require('jose');
 const { Pool } = require('pg');
 const winston = require('winston');
 require('dotenv').config();
@@ -75,6 +76,120 @@ async function setupRedisAdapter() {
   return { pubClient, subClient };
 }
 
+// Discoveries shared through api-service (POST /discoveries/ and /discoveries/batch)
+// reach the salon the same way as ones shared over the socket
+function announceDiscovery(username, discovery, timestamp) {
+  if (discovery.is_gift) {
+    if (discovery.gifted_to) {
+      io.to(`user:${discovery.gifted_to}`).emit('gift:pending', {
+        from: username,
+        hint: discovery.gift_message,
+        revealIn: '24 hours'
+      });
+    }
+    return;
+  }
+  io.to('convivial-salon').emit('discovery:new', {
+    id: discovery.id,
+    user: username,
+    title: discovery.title,
+    url: discovery.url,
+    timestamp
+  });
+}
+
+async function subscribeDiscoveryEvents(pubClient) {
+  // A subscribed connection cannot run other commands, so it gets its own
+  const eventClient = pubClient.duplicate();
+  await eventClient.connect();
+  
+  await eventClient.subscribe(['discoveries:new', 'discoveries:batch'], (message, channel) => {
+    try {
+      const event = JSON.parse(message);
+      // A batch is one event for all of its discoveries
+      const discoveries = channel === 'discoveries:batch' ? event.discoveries : [event];
+      for (const discovery of discoveries) {
+        announceDiscovery(event.user, discovery, event.timestamp);
+      }
+    } catch (err) {
+      logger.error(`Bad ${channel} event:`, err);
+    }
+  });
+  logger.info('Subscribed to api-service discovery events');
+}
+
+// Token signatures are checked offline against auth-service's published keys;
+// the key set is cached and refetched (at most every 30s) when an unknown kid shows up
+const AUTH_SERVICE_URL = process.env.AUTH_SERVICE_URL || 'http://auth-service:5000';
+const jwks = createRemoteJWKSet(
+  new URL(process.env.AUTH_JWKS_URL || `${AUTH_SERVICE_URL}/.well-known/jwks.json`),
+  { cacheMaxAge: 300000, cooldownDuration: 30000 }
+);
+
+async function verifyTokenSignature(token) {
+  const header = decodeProtectedHeader(token);
+  if (header.kid) {
+    const { payload } = await jwtVerify(token, jwks, { algorithms: ['EdDSA', 'RS256'] });
+    return payload;
+  }
+  // HS256 tokens issued with the shared secret, until JWT_ACCEPT_HS256=false
+  if (process.env.JWT_ACCEPT_HS256 !== 'false' && process.env.JWT_SECRET) {
+    return jwt.verify(token, process.env.JWT_SECRET, { algorithms: ['HS256'] });
+  }
+  throw new Error('Unsupported token signature');
+}
+
+// Revocation checks from sockets connecting at the same time (e.g. after a
+// restart) are collapsed into POST /auth/verify/batch calls. The endpoint is
+// internal: it needs auth-service's INTERNAL_API_TOKEN and accepts at most
+// VERIFY_BATCH_MAX tokens per call (keep in step with auth-service)
+const INTERNAL_API_TOKEN = process.env.INTERNAL_API_TOKEN || '';
+const VERIFY_BATCH_MAX = parseInt(process.env.VERIFY_BATCH_MAX || '100', 10);
+const VERIFY_BATCH_WINDOW_MS = parseInt(process.env.VERIFY_BATCH_WINDOW_MS || '10', 10);
+const VERIFY_BATCH_SIZE = Math.min(parseInt(process.env.VERIFY_BATCH_SIZE || '100', 10), VERIFY_BATCH_MAX);
+if (!INTERNAL_API_TOKEN) {
+  logger.warn('INTERNAL_API_TOKEN is not set; auth-service will refuse every token verification');
+}
+let pendingVerifies = [];
+let verifyTimer = null;
+
+function verifyWithAuthService(token) {
+  return new Promise((resolve, reject) => {
+    pendingVerifies.push({ token, resolve, reject });
+    if (pendingVerifies.length >= VERIFY_BATCH_SIZE) {
+      flushVerifies();
+    } else if (!verifyTimer) {
+      verifyTimer = setTimeout(flushVerifies, VERIFY_BATCH_WINDOW_MS);
+    }
+  });
+}
+
+async function flushVerifies() {
+  clearTimeout(verifyTimer);
+  verifyTimer = null;
+  const batch = pendingVerifies;
+  pendingVerifies = [];
+  if (batch.length === 0) return;
+  
+  const tokens = [...new Set(batch.map(pending => pending.token))];
+  try {
+    const response = await fetch(`${AUTH_SERVICE_URL}/auth/verify/batch`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json', 'X-Internal-Token': INTERNAL_API_TOKEN },
+      body: JSON.stringify({ tokens })
+    });
+    if (!response.ok) {
+      throw new Error(`Batch verification failed with status ${response.status}`);
+    }
+    const { results } = await response.json();
+    const byToken = new Map(tokens.map((token, index) => [token, results[index]]));
+    batch.forEach(pending => pending.resolve(byToken.get(pending.token)));
+  } catch (err) {
+    logger.warn(`Token verification unavailable: ${err.message}`);
+    batch.forEach(pending => pending.reject(err));
+  }
+}
+
 // Authentication middleware
 io.use(async (socket, next) => {
   try {
@@ -85,17 +200,12 @@ io.use(async (socket, next) => {
     
     // Always verify JWT properly
     try {
-      const decoded = jwt.verify(token, process.env.JWT_SECRET);
+      const decoded = await verifyTokenSignature(token);
       
-      // Verify token with auth service
-      const authResponse = await fetch(`${process.env.AUTH_SERVICE_URL || 'http://auth-service:5000'}/auth/verify`, {
-        headers: {
-          'Authorization': `Bearer ${token}`
-        }
-      });
+      // Verify token with auth service (revocation check, batched)
+      const authData = await verifyWithAuthService(token);
       
-      if (authResponse.ok) {
-        const authData = await authResponse.json();
+      if (authData && authData.valid) {
         socket.userId = authData.user_id;
         socket.username = authData.claims.username;
         socket.userRole = authData.claims.role;
@@ -289,7 +399,8 @@ app.get('/health', (req, res) => {
 // Start server
 async function start() {
   try {
-    await setupRedisAdapter();
+    const { pubClient } = await setupRedisAdapter();
+    await subscribeDiscoveryEvents(pubClient);
     
     const PORT = process.env.PORT || 3000;
     httpServer.listen(PORT, () => {